@@ -0,0 +1,145 @@
+# Сравнение синхронного и асинхронного режима работы с БД под конкурентной нагрузкой.
+#
+# Запуск (нужна поднятая БД из .env):
+#     python -m benchmarks.async_vs_sync --concurrency 200 --requests 5000 --delay-ms 20
+#
+# --delay-ms добавляет pg_sleep к каждому запросу, имитируя медленный запрос:
+# синхронные обработчики упираются в пул потоков Starlette (40 слотов),
+# асинхронные - только в размер пула соединений. Ошибки (например, исчерпание
+# пула соединений при завершении синхронных зависимостей) считаются отдельно
+# и не попадают в перцентили.
+import argparse
+import asyncio
+import statistics
+import time
+from typing import List
+
+import httpx
+import uvicorn
+from fastapi import Depends, FastAPI
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from config import POSTGRES_CONN, POSTGRES_ASYNC_CONN
+from enums import TenderStatus
+from models import Tender
+from schemas import Tender as TenderSchema
+
+
+def build_sync_app(pool_size: int, delay: float) -> FastAPI:
+    engine = create_engine(POSTGRES_CONN, pool_size=pool_size, max_overflow=0, pool_timeout=5)
+    session_factory = sessionmaker(bind=engine, autoflush=False)
+    app = FastAPI()
+
+    def get_db():
+        db = session_factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    @app.get("/api/tenders/", response_model=List[TenderSchema])
+    def list_tenders(db: Session = Depends(get_db)):
+        if delay:
+            db.execute(text("SELECT pg_sleep(:d)"), {"d": delay})
+        return db.execute(
+            select(Tender).filter(Tender.status == TenderStatus.PUBLISHED).limit(50)
+        ).scalars().all()
+
+    return app
+
+
+def build_async_app(pool_size: int, delay: float) -> FastAPI:
+    engine = create_async_engine(POSTGRES_ASYNC_CONN, pool_size=pool_size, max_overflow=0, pool_timeout=5)
+    session_factory = async_sessionmaker(bind=engine, autoflush=False, expire_on_commit=False)
+    app = FastAPI()
+
+    async def get_db():
+        async with session_factory() as db:
+            yield db
+
+    @app.get("/api/tenders/", response_model=List[TenderSchema])
+    async def list_tenders(db: AsyncSession = Depends(get_db)):
+        if delay:
+            await db.execute(text("SELECT pg_sleep(:d)"), {"d": delay})
+        result = await db.execute(
+            select(Tender).filter(Tender.status == TenderStatus.PUBLISHED).limit(50)
+        )
+        return result.scalars().all()
+
+    return app
+
+
+async def drive(port: int, concurrency: int, total: int) -> dict:
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(total):
+        queue.put_nowait(None)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", limits=limits, timeout=60) as client:
+        async def worker():
+            nonlocal errors
+            while not queue.empty():
+                queue.get_nowait()
+                started = time.perf_counter()
+                try:
+                    response = await client.get("/api/tenders/")
+                except httpx.HTTPError:
+                    errors += 1
+                    continue
+                if response.status_code != 200:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "rps": total / elapsed,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000,
+        "errors": errors,
+    }
+
+
+async def run_mode(app: FastAPI, port: int, args) -> dict:
+    server = uvicorn.Server(uvicorn.Config(app, port=port, log_level="warning", backlog=4096))
+    serve_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+    try:
+        # Прогрев пула соединений
+        await drive(port, args.concurrency, args.concurrency)
+        return await drive(port, args.concurrency, args.requests)
+    finally:
+        server.should_exit = True
+        await serve_task
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--pool-size", type=int, default=100)
+    parser.add_argument("--delay-ms", type=float, default=20)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    delay = args.delay_ms / 1000
+    for mode, builder in (("sync", build_sync_app), ("async", build_async_app)):
+        result = asyncio.run(run_mode(builder(args.pool_size, delay), args.port, args))
+        print(
+            f"{mode:>5}: {result['rps']:8.1f} req/s  "
+            f"p50 {result['p50_ms']:7.1f} ms  p99 {result['p99_ms']:7.1f} ms  "
+            f"errors {result['errors']}"
+        )
+
+
+if __name__ == "__main__":
+    main()
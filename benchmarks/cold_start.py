@@ -0,0 +1,92 @@
+# Время холодного старта воркера: от запуска процесса uvicorn до первого
+# успешного ответа /api/ping.
+#
+# Запуск (нужна поднятая БД из .env с применёнными миграциями, python manage.py migrate):
+#     python -m benchmarks.cold_start --runs 10
+#
+# Каждый прогон - новый процесс, поэтому в замер входят импорт модулей,
+# обработчики startup и первое соединение с БД. Отдельно, тоже в новых
+# процессах, замеряются фазы: импорт main и обработчики startup.
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+def measure(port: int, timeout: float) -> float:
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        with httpx.Client(base_url=f"http://127.0.0.1:{port}") as client:
+            while True:
+                try:
+                    if client.get("/api/ping").status_code == 200:
+                        return time.perf_counter() - started
+                except httpx.HTTPError:
+                    pass
+                if time.perf_counter() - started > timeout:
+                    sys.exit("FAIL: server did not start")
+                time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+# Выполняется в отдельном процессе: время импорта main и обработчиков startup
+PHASES_SCRIPT = """
+import asyncio, json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+
+async def startup():
+    await main.app.router.startup()
+    ready = time.perf_counter()
+    await main.app.router.shutdown()
+    await main.async_engine.dispose()
+    return ready
+
+ready = asyncio.run(startup())
+print(json.dumps({"import": imported - started, "startup": ready - imported}))
+"""
+
+
+def measure_phases() -> dict:
+    output = subprocess.run(
+        [sys.executable, "-c", PHASES_SCRIPT],
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summary(name: str, timings: list) -> str:
+    timings = sorted(timings)
+    return (f"{name}: median {statistics.median(timings) * 1000:.0f} ms, "
+            f"min {timings[0] * 1000:.0f} ms, max {timings[-1] * 1000:.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--port", type=int, default=8767)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    print(f"{args.runs} runs")
+    print(summary("cold start", [measure(args.port, args.timeout) for _ in range(args.runs)]))
+    phases = [measure_phases() for _ in range(args.runs)]
+    print(summary("  import main", [phase["import"] for phase in phases]))
+    print(summary("  startup handlers", [phase["startup"] for phase in phases]))
+
+
+if __name__ == "__main__":
+    main()
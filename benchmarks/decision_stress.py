@@ -0,0 +1,136 @@
+# Стресс-проверка атомарности решений по предложению.
+#
+# Запуск (нужна поднятая БД из .env с демо-данными):
+#     python -m benchmarks.decision_stress --reviewers 50 --repeats 5
+#
+# Создаёт reviewers ответственных за организацию, одно предложение и
+# одновременно отправляет reviewers * repeats одобрений (каждый ревьюер
+# голосует repeats раз). В итоге предложение должно быть опубликовано ровно
+# с BID_APPROVAL_QUORUM голосами, без дублей, и ровно BID_APPROVAL_QUORUM
+# запросов должны получить успешный результат. Во время шторма отдельное
+# соединение опрашивает pg_locks: параллельные UPDATE одной строки по очереди
+# ждут её блокировку (tuple/transactionid) на время одной короткой
+# транзакции, других ожиданий - таблиц, advisory-блокировок, очереди
+# NOTIFY - быть не должно.
+import argparse
+import asyncio
+import sys
+import time
+import uuid
+
+from sqlalchemy import select, text
+
+import crud
+from database import AsyncSessionLocal, async_engine
+from enums import BidStatus, DecisionType
+from models import Bid, Employee, OrganizationResponsible
+from schemas import BidCreate, TenderCreate
+
+ORGANIZATION_ID = 1
+
+# Ожидания строки предложения: tuple на таблице предложений и transactionid
+# (без таблицы) - транзакции, которая её держит
+ROW_LOCKS = {("tuple", Bid.__tablename__), ("transactionid", "")}
+
+# Незахваченные блокировки в текущей базе, кроме запросов самого опроса
+LOCK_WAITS = text("""
+    SELECT l.locktype, coalesce(l.relation::regclass::text, '') AS relation
+    FROM pg_locks l
+    JOIN pg_stat_activity a ON a.pid = l.pid
+    WHERE NOT l.granted
+      AND a.datname = current_database()
+      AND l.pid <> pg_backend_pid()
+""")
+
+
+async def prepare(reviewers: int):
+    prefix = f"stress_{uuid.uuid4().hex[:8]}"
+    async with AsyncSessionLocal() as db:
+        employees = [Employee(username=f"{prefix}_{i}") for i in range(reviewers)]
+        db.add_all(employees)
+        await db.flush()
+        db.add_all([
+            OrganizationResponsible(organization_id=ORGANIZATION_ID, user_id=employee.id)
+            for employee in employees
+        ])
+        await db.commit()
+
+        tender = await crud.create_tender(db, TenderCreate(
+            name="stress",
+            service_type="Construction",
+            organization_id=ORGANIZATION_ID,
+            creator_username=employees[0].username,
+        ))
+        bid = await crud.create_bid(db, BidCreate(
+            name="stress",
+            tender_id=tender.id,
+            organization_id=ORGANIZATION_ID,
+            creator_username=employees[0].username,
+        ), creator_id=employees[0].id)
+        return bid.id, [employee.username for employee in employees]
+
+
+async def decide(bid_id: int, username: str):
+    async with AsyncSessionLocal() as db:
+        return await crud.apply_bid_decision(db, bid_id, username, DecisionType.APPROVE)
+
+
+async def sample_lock_waits(stop: asyncio.Event, samples: list):
+    # Опрос идёт в своём соединении, пока не закончится шторм
+    async with async_engine.connect() as conn:
+        while not stop.is_set():
+            samples.append((await conn.execute(LOCK_WAITS)).all())
+            await conn.rollback()
+            await asyncio.sleep(0.001)
+
+
+async def main(args):
+    bid_id, usernames = await prepare(args.reviewers)
+
+    stop = asyncio.Event()
+    samples = []
+    sampler = asyncio.create_task(sample_lock_waits(stop, samples))
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        decide(bid_id, username)
+        for _ in range(args.repeats)
+        for username in usernames
+    ))
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await sampler
+
+    async with AsyncSessionLocal() as db:
+        bid = (await db.execute(select(Bid).filter(Bid.id == bid_id))).scalar_one()
+    await async_engine.dispose()
+
+    accepted = [result for result in results if result]
+    print(f"{len(results)} decisions in {elapsed:.2f}s, accepted: {len(accepted)}")
+    print(f"status={bid.status.value} count={bid.approve_decision_count} approved_by={len(bid.approved_by)}")
+    row_waits = [
+        sum(1 for lock in sample if tuple(lock) in ROW_LOCKS)
+        for sample in samples
+    ]
+    other_waits = {tuple(lock) for sample in samples for lock in sample} - ROW_LOCKS
+    print(f"lock samples: {len(samples)}, max waiting on the bid row: {max(row_waits, default=0)}, "
+          f"other waits: {sorted(other_waits) or 'none'}")
+
+    quorum = crud.BID_APPROVAL_QUORUM
+    ok = (
+        bid.status == BidStatus.PUBLISHED
+        and bid.approve_decision_count == quorum
+        and len(bid.approved_by) == len(set(bid.approved_by)) == quorum
+        and len(accepted) == quorum
+    )
+    if not ok:
+        sys.exit("FAIL: final state is not exact")
+    if not samples or other_waits:
+        sys.exit("FAIL: decisions waited on locks other than the bid row")
+    print("ok")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--reviewers", type=int, default=50)
+    parser.add_argument("--repeats", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,241 @@
+# Лента изменений /api/events под нагрузкой: тысячи простаивающих
+# подписчиков SSE и подписчик, который не читает поток.
+#
+# Запуск (нужна поднятая БД из .env с применёнными миграциями, python manage.py migrate):
+#     python -m benchmarks.events --subscribers 2000 --events 20
+#
+# По умолчанию запускает uvicorn с приложением из main.py на --port.
+# События отправляются прямо в канал NOTIFY (events.notify), без записей в
+# таблицы, поэтому замеряется только путь listener -> брокер -> SSE.
+#   1. --subscribers подписчиков подключаются и простаивают: замеряются время
+#      подключения, память сервера на подписчика (RSS) и отсутствие ошибок.
+#   2. --events событий раздаются всем: задержка доставки от NOTIFY до
+#      подписчика (p50/p99/max) и число доставленных событий.
+#   3. Подписчик с маленьким буфером сокета не читает поток, пока --burst
+#      событий раздаются ему и обычному подписчику: первый должен получить
+#      reset и отключиться, второй - получить всё (--burst 0 - пропустить).
+import argparse
+import asyncio
+import json
+import socket
+import subprocess
+import sys
+import time
+
+from benchmarks.load_test import percentile, wait_ready
+from database import AsyncSessionLocal, async_engine
+from events import notify
+
+# Поле-заполнитель раздувает кадры burst, чтобы буферы сокета
+# заполнились за тысячи, а не сотни тысяч событий
+BURST_PADDING = 2000
+
+
+def synthetic_event(**extra) -> dict:
+    return dict(
+        type="tender",
+        id=0,
+        tender_id=0,
+        organization_id=0,
+        status="PUBLISHED",
+        version=1,
+        sent_at=time.time(),
+        **extra,
+    )
+
+
+async def send_events(events: list):
+    async with AsyncSessionLocal() as db:
+        await notify(db, events)
+        await db.commit()
+
+
+class Subscriber:
+    # Подписчик на голых asyncio-потоках: httpx на тысячах соединений сам
+    # становится узким местом замера
+
+    def __init__(self, host: str, port: int, receive_buffer: int = None):
+        self.host = host
+        self.port = port
+        self.receive_buffer = receive_buffer
+        self.latencies = []
+        self.resets = 0
+        self.finished = asyncio.Event()
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, query: str = ""):
+        sock = None
+        if self.receive_buffer:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, self.receive_buffer)
+            sock.setblocking(False)
+            await asyncio.get_running_loop().sock_connect(sock, (self.host, self.port))
+            self.reader, self.writer = await asyncio.open_connection(sock=sock, limit=2 ** 20)
+        else:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port, limit=2 ** 20)
+        self.writer.write(f"GET /api/events{query} HTTP/1.1\r\nHost: {self.host}\r\n\r\n".encode())
+        status = await self.reader.readline()
+        if b" 200 " not in status:
+            raise RuntimeError(f"subscribe failed: {status!r}")
+        while await self.reader.readline() not in (b"\r\n", b""):
+            pass
+
+    async def read(self):
+        # Тело - chunked, каждый кадр SSE в своём чанке: строки размеров
+        # чанков просто пропускаются
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    return
+                if line.startswith(b"data: "):
+                    received = time.time()
+                    event = json.loads(line[6:])
+                    if "sent_at" in event:
+                        self.latencies.append(received - event["sent_at"])
+                elif line.startswith(b"event: reset"):
+                    self.resets += 1
+        except (ConnectionError, asyncio.IncompleteReadError):
+            return
+        finally:
+            self.finished.set()
+
+    def close(self):
+        self.writer.close()
+
+
+async def metric(base_url_host: str, port: int, name: str) -> float:
+    reader, writer = await asyncio.open_connection(base_url_host, port)
+    writer.write(f"GET /metrics HTTP/1.1\r\nHost: {base_url_host}\r\nConnection: close\r\n\r\n".encode())
+    body = (await reader.read()).decode()
+    writer.close()
+    for line in body.splitlines():
+        if line.startswith(name + " "):
+            return float(line.split()[1])
+    raise RuntimeError(f"metric {name} not found")
+
+
+def rss_kib(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as status:
+        for line in status:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1])
+    return 0
+
+
+async def wait_metric(host: str, port: int, name: str, value: float, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    while await metric(host, port, name) != value:
+        if time.perf_counter() > deadline:
+            raise RuntimeError(f"{name} did not reach {value}")
+        await asyncio.sleep(0.1)
+
+
+async def idle_and_fan_out(host: str, port: int, server_pid: int, args) -> bool:
+    rss_before = rss_kib(server_pid) if server_pid else 0
+    subscribers = [Subscriber(host, port) for _ in range(args.subscribers)]
+    started = time.perf_counter()
+    for offset in range(0, len(subscribers), args.connect_batch):
+        await asyncio.gather(*(subscriber.connect() for subscriber in subscribers[offset:offset + args.connect_batch]))
+    connected = time.perf_counter() - started
+    readers = [asyncio.create_task(subscriber.read()) for subscriber in subscribers]
+    await wait_metric(host, port, "events_subscribers", args.subscribers)
+
+    await asyncio.sleep(args.idle)
+    dropped = sum(subscriber.finished.is_set() for subscriber in subscribers)
+    rss_after = rss_kib(server_pid) if server_pid else 0
+    print(f"{args.subscribers} subscribers connected in {connected:.2f} s, "
+          f"{dropped} dropped after {args.idle:.0f} s idle")
+    if server_pid:
+        print(f"  server RSS {rss_before / 1024:.0f} -> {rss_after / 1024:.0f} MiB, "
+              f"{(rss_after - rss_before) / args.subscribers:.1f} KiB per subscriber")
+
+    for _ in range(args.events):
+        await send_events([synthetic_event()])
+        await asyncio.sleep(args.event_interval)
+    await asyncio.sleep(1)
+    latencies = sorted(latency for subscriber in subscribers for latency in subscriber.latencies)
+    expected = args.subscribers * args.events
+    print(f"  fan-out: {len(latencies)}/{expected} delivered, "
+          f"p50 {percentile(latencies, 0.5):.1f} ms, p99 {percentile(latencies, 0.99):.1f} ms, "
+          f"max {latencies[-1] * 1000 if latencies else 0:.1f} ms")
+
+    for subscriber in subscribers:
+        subscriber.close()
+    await asyncio.gather(*readers)
+    await wait_metric(host, port, "events_subscribers", 0)
+    return dropped == 0 and len(latencies) == expected
+
+
+async def slow_consumer(host: str, port: int, args) -> bool:
+    overflows_before = await metric(host, port, "events_overflows_total")
+    reader = Subscriber(host, port)
+    stalled = Subscriber(host, port, receive_buffer=4096)
+    await reader.connect()
+    await stalled.connect()
+    reader_task = asyncio.create_task(reader.read())
+    await wait_metric(host, port, "events_subscribers", 2)
+
+    # Пачками меньше очереди подписчика: читающий успевает разбирать, а
+    # нечитающий рано или поздно упирается в буферы сокета и переполняет очередь
+    padding = "x" * BURST_PADDING
+    for offset in range(0, args.burst, args.burst_batch):
+        await send_events([synthetic_event(pad=padding) for _ in range(min(args.burst_batch, args.burst - offset))])
+        await asyncio.sleep(0.01)
+    await asyncio.sleep(1)
+    overflows = await metric(host, port, "events_overflows_total") - overflows_before
+
+    # Теперь нечитающий дочитывает: в конце потока должен быть reset
+    await asyncio.wait_for(stalled.read(), 60)
+    reader.close()
+    await reader_task
+    print(f"slow consumer: {overflows:.0f} overflow(s), stalled got {len(stalled.latencies)} events "
+          f"and {stalled.resets} reset(s); reader got {len(reader.latencies)}/{args.burst} events")
+    return overflows == 1 and stalled.resets == 1 and len(reader.latencies) == args.burst
+
+
+async def run(host: str, port: int, server_pid: int, args) -> bool:
+    ok = await idle_and_fan_out(host, port, server_pid, args)
+    if args.burst:
+        ok = await slow_consumer(host, port, args) and ok
+    await async_engine.dispose()
+    return ok
+
+
+async def main(args):
+    host, port, server = "127.0.0.1", args.port, None
+    if args.base_url:
+        host, port = args.base_url.split("//")[-1].rstrip("/").split(":")
+        port = int(port)
+    else:
+        server = subprocess.Popen([
+            sys.executable, "-m", "uvicorn", "main:app",
+            "--port", str(port),
+            "--log-level", "warning",
+            "--backlog", "4096",
+            "--timeout-graceful-shutdown", "1",
+        ])
+    try:
+        await wait_ready(f"http://{host}:{port}")
+        ok = await run(host, port, server.pid if server else None, args)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+    if not ok:
+        sys.exit("FAIL")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url")
+    parser.add_argument("--port", type=int, default=8768)
+    parser.add_argument("--subscribers", type=int, default=2000)
+    parser.add_argument("--connect-batch", type=int, default=200)
+    parser.add_argument("--idle", type=float, default=5)
+    parser.add_argument("--events", type=int, default=20)
+    parser.add_argument("--event-interval", type=float, default=0.5)
+    parser.add_argument("--burst", type=int, default=5000)
+    parser.add_argument("--burst-batch", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
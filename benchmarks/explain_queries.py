@@ -0,0 +1,170 @@
+# Проверка планов запросов crud.py на большом наборе данных.
+#
+# Запускать на отдельной пустой базе, к которой применены миграции:
+#     POSTGRES_DATABASE=avito_explain alembic upgrade head
+#     POSTGRES_DATABASE=avito_explain python -m benchmarks.explain_queries --tenders 200000
+#
+# Скрипт наполняет базу через generate_series (если она ещё пуста), вызывает
+# функции crud.py, перехватывает отправленный ими SQL и выполняет для него
+# EXPLAIN. Проверка падает, если хотя бы один запрос читает большую таблицу
+# последовательным сканированием.
+import argparse
+import asyncio
+import json
+import sys
+
+from sqlalchemy import event, select, text
+
+import crud
+from database import AsyncSessionLocal, async_engine
+from models import BidHistory, TenderHistory
+from pagination import PageParams, decode_cursor
+
+LARGE_TABLES = {
+    "tenders",
+    "bids",
+    "tender_history",
+    "bid_history",
+    "employee",
+    "organization_responsible",
+}
+
+SEED_SQL = """
+INSERT INTO organization (name, description, type, created_at, updated_at)
+SELECT 'org ' || g, 'organization ' || g, (ARRAY['IE', 'LLC', 'JSC'])[1 + g % 3]::organizationtype,
+       now() - g * interval '1 second', now()
+FROM generate_series(1, :organizations) AS g;
+
+INSERT INTO employee (username, first_name, last_name, created_at, updated_at)
+SELECT 'user' || g, 'First' || g, 'Last' || g, now() - g * interval '1 second', now()
+FROM generate_series(1, :employees) AS g;
+
+INSERT INTO organization_responsible (organization_id, user_id)
+SELECT 1 + g % :organizations, g
+FROM generate_series(1, :employees) AS g;
+
+INSERT INTO tenders (name, description, service_type, status, organization_id, created_at, updated_at, version)
+SELECT 'tender ' || g, repeat('d', 200),
+       (ARRAY['Construction', 'Delivery', 'Manufacture', 'Consulting', 'Cleaning'])[1 + ((g % 7) * (g % 7)) % 5],
+       (ARRAY['CREATED', 'PUBLISHED', 'CLOSED'])[1 + g % 3]::tenderstatus,
+       1 + g % :organizations, now() - g * interval '1 second', now(), 1
+FROM generate_series(1, :tenders) AS g;
+
+INSERT INTO bids (name, description, status, tender_id, organization_id, created_at, updated_at,
+                  version, creator_id, approve_decision_count, approved_by)
+SELECT 'bid ' || g, repeat('d', 200), 'CREATED'::bidstatus, 1 + g % :tenders,
+       1 + g % :organizations, now() - g * interval '1 second', now(), 1,
+       1 + g % :employees, 0, '{}'
+FROM generate_series(1, :tenders * 2) AS g;
+
+INSERT INTO tender_history (tender_id, name, description, status, version, service_type)
+SELECT id, name, description, status, version, service_type FROM tenders;
+
+INSERT INTO bid_history (bid_id, name, description, status, version, timestamp)
+SELECT id, name, description, status, version, now() FROM bids;
+"""
+
+
+async def seed(args):
+    async with async_engine.begin() as conn:
+        count = (await conn.execute(text("SELECT count(*) FROM tenders"))).scalar()
+        if count >= args.tenders:
+            return
+        if count:
+            sys.exit("База уже содержит данные, нужна пустая база")
+        params = {
+            "organizations": args.tenders // 100,
+            "employees": args.tenders // 10,
+            "tenders": args.tenders,
+        }
+        for statement in SEED_SQL.split(";"):
+            if statement.strip():
+                await conn.execute(text(statement), params)
+    async with async_engine.connect() as conn:
+        await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text("ANALYZE"))
+
+
+def collect_scans(plan, scans):
+    scans.append((plan["Node Type"], plan.get("Relation Name"), plan.get("Index Name")))
+    for child in plan.get("Plans", []):
+        collect_scans(child, scans)
+    return scans
+
+
+async def run_checks():
+    captured = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        captured.append((statement, parameters))
+
+    event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+
+    async with AsyncSessionLocal() as db:
+        _, next_cursor = await crud.get_tenders(db)
+        next_page = PageParams(after=decode_cursor(next_cursor))
+        checks = {
+            "get_identity": lambda: crud.get_identity(db, "user42"),
+            "resolve_permissions": lambda: crud.resolve_permissions(
+                db, "user42", organization_id=43, tender_id=42),
+            "get_tender": lambda: crud.get_tender(db, 42),
+            "get_bid": lambda: crud.get_bid(db, 42),
+            "get_tenders": lambda: crud.get_tenders(db),
+            "get_tenders(cursor)": lambda: crud.get_tenders(db, page=next_page),
+            "get_tenders(service_type)": lambda: crud.get_tenders(db, service_type="Delivery"),
+            "get_tenders(username)": lambda: crud.get_tenders(db, username="user42"),
+            "get_my_tenders": lambda: crud.get_my_tenders(db, "user42"),
+            "get_bids_for_tender": lambda: crud.get_bids_for_tender(db, 42),
+            "get_my_bids": lambda: crud.get_my_bids(db, "user42"),
+            "get_employees": lambda: crud.get_employees(db),
+            "get_organizations": lambda: crud.get_organizations(db),
+            "search_tenders": lambda: crud.search_tenders(db, "42"),
+            "search_tenders(username)": lambda: crud.search_tenders(db, "42", username="user42"),
+            "search_bids(username)": lambda: crud.search_bids(db, "42", username="user42"),
+            "get_tender_version": lambda: crud.get_tender_version(db, 42, 1),
+            "get_tender_versions": lambda: crud.get_tender_versions(db, 42),
+            "get_bid_version": lambda: crud.get_bid_version(db, 42, 1),
+            "tender_history lookup": lambda: db.execute(select(TenderHistory).filter(
+                TenderHistory.tender_id == 42, TenderHistory.version == 1)),
+            "bid_history lookup": lambda: db.execute(select(BidHistory).filter(
+                BidHistory.bid_id == 42, BidHistory.version == 1)),
+        }
+
+        statements = {}
+        for name, call in checks.items():
+            captured.clear()
+            await call()
+            statements[name] = list(captured)
+
+    event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+
+    failed = False
+    async with async_engine.connect() as conn:
+        for name, queries in statements.items():
+            for statement, parameters in queries:
+                result = await conn.exec_driver_sql("EXPLAIN (FORMAT JSON) " + statement, parameters)
+                plan = result.scalar()
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = collect_scans(plan[0]["Plan"], [])
+                seq_scans = [rel for node, rel, _ in scans if node == "Seq Scan" and rel in LARGE_TABLES]
+                used = sorted({index for _, _, index in scans if index})
+                status = "FAIL" if seq_scans else "ok"
+                failed = failed or bool(seq_scans)
+                print(f"{status:4} {name:30} indexes: {', '.join(used) or '-'}"
+                      + (f"  seq scan: {', '.join(seq_scans)}" if seq_scans else ""))
+    return not failed
+
+
+async def main(args):
+    await seed(args)
+    ok = await run_checks()
+    await async_engine.dispose()
+    if not ok:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenders", type=int, default=200000)
+    asyncio.run(main(parser.parse_args()))
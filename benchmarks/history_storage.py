@@ -0,0 +1,108 @@
+# Объём истории версий и задержка отката для разных режимов хранения.
+#
+# Запуск (нужна поднятая БД из .env с демо-данными):
+#     python -m benchmarks.history_storage --tenders 50 --edits 60 --rollbacks 200
+#
+# Для каждого режима создаёт tenders тендеров с описанием ~1000 символов и
+# делает edits правок (название, статус или небольшой фрагмент описания),
+# затем считает средний размер строки tender_history на версию и задержку
+# rollback_tender к случайной версии.
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from sqlalchemy import func, select
+
+import crud
+from database import AsyncSessionLocal, async_engine
+from history import history_codec
+from models import TenderHistory
+from schemas import TenderCreate, TenderUpdate
+
+MODES = (
+    ("full", "none"),
+    ("delta", "none"),
+    ("delta", "zlib"),
+)
+WORDS = "поставка монтаж ремонт бетон кровля доставка склад проект смета фасад".split()
+
+
+def description(rng: random.Random) -> str:
+    text = " ".join(rng.choice(WORDS) for _ in range(200))
+    return text[:1000]
+
+
+def edit(rng: random.Random, tender) -> TenderUpdate:
+    kind = rng.random()
+    if kind < 0.4:
+        return TenderUpdate(name=f"bench {rng.randrange(10 ** 6)}", username="johndoe")
+    if kind < 0.6:
+        status = rng.choice(["CREATED", "PUBLISHED", "CLOSED"])
+        return TenderUpdate(status=status, username="johndoe")
+    # Правка небольшого фрагмента описания
+    position = rng.randrange(0, 900)
+    text = tender.description
+    return TenderUpdate(
+        description=text[:position] + rng.choice(WORDS) + text[position + 10:][:1000 - position - 10],
+        username="johndoe",
+        )
+
+
+async def run_mode(args, storage: str, compression: str):
+    history_codec.storage = storage
+    history_codec.compression = compression
+    rng = random.Random(args.seed)
+
+    tender_ids = []
+    async with AsyncSessionLocal() as db:
+        for _ in range(args.tenders):
+            tender = await crud.create_tender(db, TenderCreate(
+                name="bench",
+                service_type="Construction",
+                description=description(rng),
+                organization_id=1,
+                creator_username="johndoe",
+            ))
+            for _ in range(args.edits):
+                tender = await crud.update_tender(db, tender, edit(rng, tender))
+            tender_ids.append(tender.id)
+
+        result = await db.execute(
+            select(func.sum(func.pg_column_size(TenderHistory.__table__.table_valued())), func.count())
+            .filter(TenderHistory.tender_id.in_(tender_ids))
+        )
+        total_bytes, versions = result.one()
+
+        latencies = []
+        for _ in range(args.rollbacks):
+            tender = await crud.get_tender(db, rng.choice(tender_ids))
+            version = rng.randint(1, args.edits + 1)
+            started = time.perf_counter()
+            assert await crud.rollback_tender(db, tender, version)
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{storage:>5}/{compression:<4}: {total_bytes / versions:7.1f} bytes/version, "
+        f"rollback p50 {statistics.median(latencies):6.2f} ms, p99 {p99:6.2f} ms"
+    )
+
+
+async def main(args):
+    history_codec.snapshot_interval = args.snapshot_interval
+    for storage, compression in MODES:
+        await run_mode(args, storage, compression)
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--tenders", type=int, default=50)
+    parser.add_argument("--edits", type=int, default=60)
+    parser.add_argument("--rollbacks", type=int, default=200)
+    parser.add_argument("--snapshot-interval", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    asyncio.run(main(parser.parse_args()))
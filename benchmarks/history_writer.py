@@ -0,0 +1,106 @@
+# Задержка редактирования тендера при записи истории в транзакции изменения
+# (HISTORY_WRITER=inline) и через очередь history_outbox (outbox).
+#
+# Запуск (нужна поднятая БД из .env с демо-данными и применёнными миграциями):
+#     python -m benchmarks.history_writer --edits 4000 --concurrency 10
+#
+# Для каждого режима --concurrency сессий правят каждая свой тендер, всего
+# --edits правок; замеряются правки/с и задержка crud.update_tender
+# (p50/p99/max). В режиме outbox параллельно работает фоновый перенос
+# очереди, как в воркере приложения; после правок замеряется, за сколько он
+# догоняет, и проверяется, что история каждого тендера - версии 1..N без
+# пропусков.
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import func, select
+
+import crud
+from benchmarks.load_test import percentile
+from database import AsyncSessionLocal, async_engine
+from history_outbox import drain_history_outbox, run_history_writer
+from models import HistoryOutbox, TenderHistory
+from schemas import TenderCreate, TenderUpdate
+
+TENDER = TenderCreate(
+    name="bench",
+    service_type="Construction",
+    description="d" * 500,
+    organization_id=1,
+    creator_username="johndoe",
+)
+
+
+async def edit_tender(edits: int, latencies: list) -> int:
+    async with AsyncSessionLocal() as db:
+        tender = await crud.create_tender(db, TENDER)
+        for edit in range(edits):
+            update = TenderUpdate(name=f"bench {edit}", username="johndoe")
+            started = time.perf_counter()
+            tender = await crud.update_tender(db, tender, update)
+            latencies.append(time.perf_counter() - started)
+        return tender.id
+
+
+async def history_is_complete(tender_ids: list, versions: int) -> bool:
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(
+                TenderHistory.tender_id,
+                func.count(),
+                func.count(func.distinct(TenderHistory.version)),
+                func.max(TenderHistory.version),
+            )
+            .filter(TenderHistory.tender_id.in_(tender_ids))
+            .group_by(TenderHistory.tender_id)
+        )
+        rows = result.all()
+    return len(rows) == len(tender_ids) and all(row[1:] == (versions, versions, versions) for row in rows)
+
+
+async def run(mode: str, args) -> bool:
+    crud.HISTORY_WRITER = mode
+    writer = asyncio.create_task(run_history_writer(args.interval)) if mode == "outbox" else None
+    per_tender = args.edits // args.concurrency
+    latencies = []
+    started = time.perf_counter()
+    tender_ids = await asyncio.gather(*(edit_tender(per_tender, latencies) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - started
+
+    lag = 0.0
+    if writer:
+        # Сколько фоновый перенос отстаёт от последней правки
+        caught_up = time.perf_counter()
+        async with AsyncSessionLocal() as db:
+            while await db.scalar(select(func.count()).select_from(HistoryOutbox)):
+                await db.rollback()
+                await asyncio.sleep(0.01)
+        lag = time.perf_counter() - caught_up
+        writer.cancel()
+        await drain_history_outbox(wait=True)
+
+    complete = await history_is_complete(tender_ids, per_tender + 1)
+    latencies.sort()
+    print(f"{mode:>6}: {len(latencies) / elapsed:7.1f} edits/s  "
+          f"p50 {percentile(latencies, 0.5):6.2f} ms  p99 {percentile(latencies, 0.99):6.2f} ms  "
+          f"max {latencies[-1] * 1000:6.2f} ms  "
+          f"history lag {lag * 1000:6.0f} ms  complete: {complete}")
+    return complete
+
+
+async def main(args):
+    ok = True
+    for mode in ("inline", "outbox"):
+        ok = await run(mode, args) and ok
+    await async_engine.dispose()
+    if not ok:
+        raise SystemExit("FAIL: history has gaps")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--edits", type=int, default=4000)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--interval", type=float, default=0.5)
+    asyncio.run(main(parser.parse_args()))
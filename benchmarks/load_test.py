@@ -0,0 +1,340 @@
+# Нагрузочный прогон API смесями запросов и сравнение с сохранённым baseline.
+#
+# Запуск (нужна поднятая БД из .env с применёнными миграциями, python manage.py migrate):
+#     python -m benchmarks.load_test --save-baseline benchmarks/load_baseline.json
+#     python -m benchmarks.load_test --baseline benchmarks/load_baseline.json --threshold 0.2
+#
+# По умолчанию запускает uvicorn с приложением из main.py на --port;
+# с --base-url нагружает уже запущенный сервер (БД из .env должна быть той
+# же: тестовые данные создаются напрямую в ней). Смеси:
+#     browse         - просмотр ленты тендеров с переходом по страницам
+#     bid_create     - создание предложений вперемешку со списком предложений
+#     decision_storm - одновременные решения множества ответственных по
+#                      одному предложению, затем по следующему
+#     rollback       - редактирования и откаты тендеров
+# Для каждой смеси и эндпоинта записываются RPS, p50/p95/p99 и число ошибок.
+# Прогон завершается с ошибкой, если RPS упал или перцентиль вырос больше
+# чем на threshold относительно baseline (задержки - с допуском
+# --latency-slack-ms, чтобы не реагировать на шум в доли миллисекунды).
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+import uuid
+from collections import defaultdict
+from typing import Callable, Dict, List, NamedTuple
+
+import httpx
+from sqlalchemy import update
+
+import crud
+from database import AsyncSessionLocal, async_engine
+from enums import OrganizationType, TenderStatus
+from models import Employee, Organization, OrganizationResponsible, Tender
+from schemas import BidCreate, TenderCreate
+
+# Ответы, которые в смеси ожидаемы и не считаются ошибкой: повторное
+# решение того же ответственного и решение по уже опубликованному
+# предложению - нормальный исход шторма решений
+EXPECTED_STATUSES = {
+    "POST /api/bids/{bid_id}/decision": (200, 400),
+}
+
+
+class Fixtures(NamedTuple):
+    organization_id: int
+    usernames: List[str]
+    tender_ids: List[int]
+    bid_ids: List[int]
+
+
+class Operation(NamedTuple):
+    # Шаблон маршрута - ключ в отчёте
+    endpoint: str
+    weight: int
+    request: Callable
+
+
+async def prepare(args) -> Fixtures:
+    prefix = f"load_{uuid.uuid4().hex[:8]}"
+    async with AsyncSessionLocal() as db:
+        organization = Organization(name=prefix, type=OrganizationType.LLC)
+        employees = [Employee(username=f"{prefix}_{i}") for i in range(args.users)]
+        db.add(organization)
+        db.add_all(employees)
+        await db.flush()
+        db.add_all([
+            OrganizationResponsible(organization_id=organization.id, user_id=employee.id)
+            for employee in employees
+        ])
+        await db.commit()
+
+        tenders = await crud.create_tenders_bulk(db, [
+            TenderCreate(
+                name=f"{prefix} tender {i}",
+                description="load test " * 20,
+                service_type="Construction",
+                organization_id=organization.id,
+                creator_username=employees[0].username,
+            )
+            for i in range(args.tenders)
+        ])
+        tender_ids = [tender.id for tender in tenders]
+        await db.execute(
+            update(Tender)
+            .where(Tender.id.in_(tender_ids))
+            .values(status=TenderStatus.PUBLISHED)
+            .execution_options(synchronize_session=False)
+        )
+        await db.commit()
+
+        # Предложения для шторма решений: каждое получает storm_votes голосов
+        bids = await crud.create_bids_bulk(db, [
+            BidCreate(
+                name=f"{prefix} bid {i}",
+                tender_id=tender_ids[i % len(tender_ids)],
+                organization_id=organization.id,
+                creator_username=employees[0].username,
+            )
+            for i in range(args.storm_bids)
+        ], creator_ids=[employees[0].id] * args.storm_bids)
+        return Fixtures(
+            organization_id=organization.id,
+            usernames=[employee.username for employee in employees],
+            tender_ids=tender_ids,
+            bid_ids=[bid.id for bid in bids],
+        )
+
+
+def build_mixes(fixtures: Fixtures, args) -> Dict[str, List[Operation]]:
+    cursors = []
+    decisions = iter(range(10 ** 9))
+
+    async def list_tenders(client, rng):
+        params = {"limit": 20}
+        # Часть пользователей листает дальше первой страницы
+        if cursors and rng.random() < 0.3:
+            params["cursor"] = rng.choice(cursors)
+        response = await client.get("/api/tenders/", params=params)
+        cursor = response.headers.get("x-next-cursor")
+        if cursor and len(cursors) < 1000:
+            cursors.append(cursor)
+        return response
+
+    async def list_my_tenders(client, rng):
+        return await client.get("/api/tenders/my", params={"username": rng.choice(fixtures.usernames)})
+
+    async def list_bids(client, rng):
+        return await client.get(f"/api/bids/{rng.choice(fixtures.tender_ids)}/list")
+
+    async def create_bid(client, rng):
+        return await client.post("/api/bids/new", json={
+            "name": "load bid",
+            "description": "load test",
+            "tender_id": rng.choice(fixtures.tender_ids),
+            "organization_id": fixtures.organization_id,
+            "creator_username": rng.choice(fixtures.usernames),
+        })
+
+    async def decide(client, rng):
+        # Подряд идущие решения бьют в одно предложение, пока оно не
+        # наберёт storm_votes голосов
+        bid_id = fixtures.bid_ids[next(decisions) // args.storm_votes % len(fixtures.bid_ids)]
+        return await client.post(
+            f"/api/bids/{bid_id}/decision",
+            params={"username": rng.choice(fixtures.usernames), "decision": "approve"},
+        )
+
+    async def edit_tender(client, rng):
+        return await client.patch(
+            f"/api/tenders/{rng.choice(fixtures.tender_ids)}/edit",
+            json={"username": fixtures.usernames[0], "description": f"edited {rng.random()}"},
+        )
+
+    async def rollback_tender(client, rng):
+        return await client.put(f"/api/tenders/{rng.choice(fixtures.tender_ids)}/rollback/1")
+
+    return {
+        "browse": [
+            Operation("GET /api/tenders/", 80, list_tenders),
+            Operation("GET /api/tenders/my", 10, list_my_tenders),
+            Operation("GET /api/bids/{tender_id}/list", 10, list_bids),
+        ],
+        "bid_create": [
+            Operation("POST /api/bids/new", 70, create_bid),
+            Operation("GET /api/bids/{tender_id}/list", 30, list_bids),
+        ],
+        "decision_storm": [
+            Operation("POST /api/bids/{bid_id}/decision", 1, decide),
+        ],
+        "rollback": [
+            Operation("PATCH /api/tenders/{tender_id}/edit", 50, edit_tender),
+            Operation("PUT /api/tenders/{tender_id}/rollback/{version}", 50, rollback_tender),
+        ],
+    }
+
+
+def percentile(latencies: List[float], fraction: float) -> float:
+    return latencies[min(len(latencies) - 1, int(len(latencies) * fraction))] * 1000
+
+
+async def drive(base_url: str, operations: List[Operation], args) -> Dict[str, dict]:
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    weights = [operation.weight for operation in operations]
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker(index: int):
+            # Каждый воркер со своим генератором: набор запросов
+            # воспроизводим при одинаковом --seed
+            rng = random.Random(args.seed + index)
+            while time.perf_counter() < deadline:
+                operation = rng.choices(operations, weights)[0]
+                started = time.perf_counter()
+                try:
+                    response = await operation.request(client, rng)
+                except httpx.HTTPError:
+                    errors[operation.endpoint] += 1
+                    continue
+                elapsed = time.perf_counter() - started
+                if response.status_code not in EXPECTED_STATUSES.get(operation.endpoint, (200, 201)):
+                    errors[operation.endpoint] += 1
+                    continue
+                latencies[operation.endpoint].append(elapsed)
+
+        started = time.perf_counter()
+        deadline = started + args.duration
+        await asyncio.gather(*(worker(i) for i in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    results = {}
+    for operation in operations:
+        endpoint = operation.endpoint
+        samples = sorted(latencies[endpoint])
+        if not samples:
+            results[endpoint] = {"rps": 0.0, "errors": errors[endpoint]}
+            continue
+        results[endpoint] = {
+            "requests": len(samples),
+            "rps": round(len(samples) / elapsed, 1),
+            "p50_ms": round(percentile(samples, 0.50), 2),
+            "p95_ms": round(percentile(samples, 0.95), 2),
+            "p99_ms": round(percentile(samples, 0.99), 2),
+            "errors": errors[endpoint],
+        }
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold: float, slack_ms: float) -> List[str]:
+    regressions = []
+    for mix, endpoints in baseline.items():
+        for endpoint, expected in endpoints.items():
+            actual = results.get(mix, {}).get(endpoint)
+            if actual is None:
+                continue
+            name = f"{mix} {endpoint}"
+            if actual["rps"] < expected["rps"] * (1 - threshold):
+                regressions.append(f"{name}: rps {actual['rps']} < baseline {expected['rps']}")
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if key not in expected or key not in actual:
+                    continue
+                if actual[key] > expected[key] * (1 + threshold) + slack_ms:
+                    regressions.append(f"{name}: {key} {actual[key]} > baseline {expected[key]}")
+            if actual["errors"] > expected["errors"]:
+                regressions.append(f"{name}: errors {actual['errors']} > baseline {expected['errors']}")
+    return regressions
+
+
+async def run(base_url: str, args) -> dict:
+    fixtures = await prepare(args)
+    mixes = build_mixes(fixtures, args)
+    results = {}
+    for mix in args.mixes:
+        # Прогрев соединений и кэшей, не попадает в результаты
+        await drive(base_url, mixes[mix], argparse.Namespace(**dict(vars(args), duration=args.warmup)))
+        results[mix] = await drive(base_url, mixes[mix], args)
+        for endpoint, stats in results[mix].items():
+            print(f"{mix:>14} {endpoint:<50} {json.dumps(stats)}")
+    return results
+
+
+async def wait_ready(base_url: str, timeout: float = 60):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while True:
+            try:
+                if (await client.get("/api/ping")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                if time.perf_counter() > deadline:
+                    raise
+            await asyncio.sleep(0.2)
+
+
+async def run_local(args) -> dict:
+    # Сервер в отдельном процессе, чтобы клиент не делил с ним цикл событий
+    server = subprocess.Popen([
+        sys.executable, "-m", "uvicorn", "main:app",
+        "--port", str(args.port),
+        "--log-level", "warning",
+        "--backlog", "4096",
+    ])
+    try:
+        base_url = f"http://127.0.0.1:{args.port}"
+        await wait_ready(base_url)
+        return await run(base_url, args)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+async def main(args):
+    try:
+        if args.base_url:
+            results = await run(args.base_url, args)
+        else:
+            results = await run_local(args)
+    finally:
+        await async_engine.dispose()
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"baseline saved to {args.save_baseline}")
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.latency_slack_ms)
+        if regressions:
+            print("\n".join(regressions))
+            sys.exit(f"FAIL: {len(regressions)} regressions above {args.threshold:.0%}")
+    print("ok")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--base-url")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--mixes", nargs="+", default=["browse", "bid_create", "decision_storm", "rollback"],
+                        choices=["browse", "bid_create", "decision_storm", "rollback"])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--warmup", type=float, default=2)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--tenders", type=int, default=200)
+    parser.add_argument("--storm-bids", type=int, default=500)
+    parser.add_argument("--storm-votes", type=int, default=20)
+    parser.add_argument("--baseline")
+    parser.add_argument("--save-baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    parser.add_argument("--latency-slack-ms", type=float, default=2)
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    asyncio.run(main(parse_args()))
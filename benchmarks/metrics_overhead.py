@@ -0,0 +1,69 @@
+# Накладные расходы MetricsMiddleware на один запрос.
+#
+# Запуск (БД не нужна):
+#     python -m benchmarks.metrics_overhead --requests 200000 --budget-us 5
+#
+# Прогоняет одно и то же минимальное ASGI-приложение с middleware и без,
+# вызывая его напрямую без HTTP-сервера, и сравнивает время на запрос.
+# Завершается с ошибкой, если разница больше budget-us микросекунд.
+import argparse
+import asyncio
+import sys
+import time
+
+from metrics import HTTPMetrics, MetricsMiddleware
+
+
+class Route:
+    path = "/api/bids/{bid_id}/edit"
+
+
+ROUTE = Route()
+START = {"type": "http.response.start", "status": 200, "headers": []}
+BODY = {"type": "http.response.body", "body": b"{}"}
+
+
+async def app(scope, receive, send):
+    # Маршрут выставляет роутер Starlette
+    scope["route"] = ROUTE
+    await send(START)
+    await send(BODY)
+
+
+async def receive():
+    return {"type": "http.request", "body": b""}
+
+
+async def send(message):
+    pass
+
+
+async def run(asgi_app, requests: int) -> float:
+    started = time.perf_counter()
+    for _ in range(requests):
+        scope = {"type": "http", "method": "PATCH", "path": "/api/bids/1/edit"}
+        await asgi_app(scope, receive, send)
+    return (time.perf_counter() - started) / requests * 1e6
+
+
+async def main(args):
+    instrumented = MetricsMiddleware(app, HTTPMetrics())
+    # Прогрев, затем лучший из нескольких прогонов для каждого варианта
+    await run(app, 10000)
+    await run(instrumented, 10000)
+    bare = min([await run(app, args.requests) for _ in range(args.rounds)])
+    with_metrics = min([await run(instrumented, args.requests) for _ in range(args.rounds)])
+    overhead = with_metrics - bare
+    print(f"bare: {bare:.3f} us/request, with metrics: {with_metrics:.3f} us/request, "
+          f"overhead: {overhead:.3f} us/request")
+    if overhead > args.budget_us:
+        sys.exit(f"FAIL: overhead above {args.budget_us} us")
+    print("ok")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=200000)
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--budget-us", type=float, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,163 @@
+# Проверка числа обращений к базе у функций и эндпоинтов, для которых оно
+# обещано.
+#
+# Запуск (нужна поднятая БД из .env с демо-данными, python manage.py init):
+#     python -m benchmarks.query_counts
+#
+# Отправленные в базу запросы считаются событием before_cursor_execute.
+# Эндпоинты записи вызываются с пустым кэшем: запросы до первой записи
+# (загрузка сущности и проверка прав) не должны превышать
+# WRITE_PERMISSIONS_LIMIT. Пакетные эндпоинты вызываются с BULK_MAX_ITEMS
+# элементами через QueryStatsMiddleware в режиме TEST_MODE: пачка не должна
+# превышать @query_budget маршрута и повторять запросы.
+# Проверка падает, если хотя бы один случай превысил свой предел.
+import asyncio
+import sys
+
+import httpx
+from sqlalchemy import event, select
+
+import crud
+import main as application
+from cache import identity_cache
+from config import BULK_MAX_ITEMS
+from database import AsyncSessionLocal, async_engine
+from models import Employee, Organization, OrganizationResponsible
+from query_stats import QueryStatsMiddleware
+from schemas import BidCreate, TenderCreate
+
+# Проверка прав - один запрос с EXISTS-подзапросами
+PERMISSIONS_LIMIT = 1
+# Эндпоинт записи до первой записи: загрузка сущности и проверка прав
+WRITE_PERMISSIONS_LIMIT = 2
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "WITH")
+
+
+async def prepare_cases(db):
+    # Худший случай для создания предложения: пользователь не отвечает за
+    # организацию из запроса, и нужна организация тендера. Тендер и
+    # предложение создаются заново. Пачки для пакетных эндпоинтов и запросы
+    # к эндпоинтам записи - от того же пользователя в его организацию
+    employee, organization_id = (await db.execute(
+        select(Employee, OrganizationResponsible.organization_id)
+        .join(OrganizationResponsible, OrganizationResponsible.user_id == Employee.id)
+        .order_by(Employee.id)
+        .limit(1)
+    )).one()
+    own = select(OrganizationResponsible.organization_id).filter(OrganizationResponsible.user_id == employee.id)
+    foreign_organization_id = await db.scalar(select(Organization.id).filter(Organization.id.not_in(own)))
+    tender = await crud.create_tender(db, TenderCreate(
+        name="query counts",
+        description="query counts",
+        service_type="Construction",
+        organization_id=organization_id,
+        creator_username=employee.username,
+    ))
+    bid = await crud.create_bid(db, BidCreate(
+        name="query counts",
+        description="query counts",
+        tender_id=tender.id,
+        organization_id=organization_id,
+        creator_username=employee.username,
+    ), creator_id=employee.id)
+    tender_id, bid_id, username = tender.id, bid.id, employee.username
+    writes = [
+        ("POST", "/api/tenders/new", dict(json=dict(
+            name="query counts", description="query counts", service_type="Construction",
+            organization_id=organization_id, creator_username=username))),
+        ("PATCH", f"/api/tenders/{tender_id}/edit", dict(json=dict(name="edited", username=username))),
+        ("POST", "/api/bids/new", dict(json=dict(
+            name="query counts", description="query counts", tender_id=tender_id,
+            organization_id=foreign_organization_id, creator_username=username))),
+        ("PATCH", f"/api/bids/{bid_id}/edit", dict(json=dict(name="edited", username=username))),
+        ("POST", f"/api/bids/{bid_id}/decision", dict(params=dict(username=username, decision="reject"))),
+    ]
+    bulk = {
+        "/api/tenders/bulk": [
+            dict(name=f"bulk {i}", description="bulk", service_type="Construction",
+                 organization_id=organization_id, creator_username=username)
+            for i in range(BULK_MAX_ITEMS)
+        ],
+        "/api/bids/bulk": [
+            dict(name=f"bulk {i}", description="bulk", tender_id=tender_id,
+                 organization_id=organization_id, creator_username=username)
+            for i in range(BULK_MAX_ITEMS)
+        ],
+    }
+    cases = {
+        "resolve_permissions(create bid)": lambda: crud.resolve_permissions(
+            db, username, organization_id=foreign_organization_id, tender_id=tender_id),
+        "resolve_permissions(edit bid)": lambda: crud.resolve_permissions(
+            db, username, organization_id=foreign_organization_id, bid=bid),
+        "resolve_permissions(unknown user)": lambda: crud.resolve_permissions(
+            db, "no such user", organization_id=foreign_organization_id, tender_id=tender_id),
+    }
+    return cases, writes, bulk
+
+
+async def write_cases(client, writes: list, statements: list) -> bool:
+    failed = False
+    for method, path, request in writes:
+        identity_cache.invalidate()
+        statements.clear()
+        response = await client.request(method, path, **request)
+        # Чтения до первой записи
+        reads = 0
+        for statement in statements:
+            if statement.lstrip().upper().startswith(WRITE_STATEMENTS):
+                break
+            reads += 1
+        ok = response.status_code in (200, 201) and reads <= WRITE_PERMISSIONS_LIMIT
+        failed = failed or not ok
+        print(f"{method} {path:36} {reads} queries before write (limit {WRITE_PERMISSIONS_LIMIT}), "
+              f"status {response.status_code}{'' if ok else '  FAIL'}")
+    return failed
+
+
+async def bulk_cases(client, bulk: dict) -> bool:
+    # Ошибка бюджета выходит из вызова исключением
+    failed = False
+    for path, items in bulk.items():
+        try:
+            response = await client.post(path, json=items)
+            ok = response.status_code == 200 and len(response.json()["created"]) == len(items)
+            detail = f"status {response.status_code}"
+        except AssertionError as error:
+            ok, detail = False, str(error)
+        failed = failed or not ok
+        print(f"POST {path:36} {len(items)} items: {'ok' if ok else 'FAIL'} ({detail})")
+    return failed
+
+
+async def main():
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    failed = False
+    async with AsyncSessionLocal() as db:
+        cases, writes, bulk = await prepare_cases(db)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", capture)
+        for name, call in cases.items():
+            statements.clear()
+            await call()
+            ok = len(statements) <= PERMISSIONS_LIMIT
+            failed = failed or not ok
+            print(f"{name:40} {len(statements)} queries (limit {PERMISSIONS_LIMIT}){'' if ok else '  FAIL'}")
+
+    # Маршруты без остальных middleware приложения, со своей проверкой
+    # бюджета в режиме TEST_MODE
+    app = QueryStatsMiddleware(application.app.router, test_mode=True)
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+        failed = await write_cases(client, writes, statements) or failed
+        event.remove(async_engine.sync_engine, "before_cursor_execute", capture)
+        failed = await bulk_cases(client, bulk) or failed
+    await async_engine.dispose()
+    if failed:
+        sys.exit("FAIL")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,100 @@
+# Время формирования ответа-списка: ORM-объекты + response_model FastAPI
+# против строк из колонок схемы + RowSerializer (serialization.py) и против
+# ответа только с полями из ?fields= (RowSerializer.project).
+#
+# Запуск (нужна БД из .env хотя бы с --rows тендерами и предложениями,
+# например после python generate_data.py):
+#     python -m benchmarks.serialization --rows 10000
+#
+# Для каждого варианта замеряются выборка из базы (с построением объектов
+# или строк), сериализация в JSON и размер ответа; результат - лучший из
+# --rounds прогонов в пересчёте на 10k строк. Ответы ORM и RowSerializer
+# сравниваются.
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+from fastapi.responses import JSONResponse
+from fastapi.routing import serialize_response
+from sqlalchemy import select
+
+from database import AsyncSessionLocal, async_engine
+from main import app
+from models import Bid, Tender
+from serialization import BID_ROWS, TENDER_ROWS
+
+CASES = (
+    ("tenders", Tender, TENDER_ROWS, "/api/tenders/", ("id", "name", "status", "version")),
+    ("bids", Bid, BID_ROWS, "/api/bids/my", ("id", "name", "status", "version")),
+)
+
+
+def response_field(path: str):
+    # Поле ответа маршрута - им FastAPI проверяет и сериализует ответ
+    return next(route for route in app.routes if getattr(route, "path", None) == path).response_field
+
+
+async def orm_response(model, field, rows: int):
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(select(model).order_by(model.created_at, model.id).limit(rows))
+        objects = result.scalars().all()
+    fetched = time.perf_counter()
+    content = await serialize_response(field=field, response_content=objects)
+    body = JSONResponse(content).body
+    return fetched - started, time.perf_counter() - fetched, body
+
+
+async def rows_response(model, serializer, rows: int):
+    started = time.perf_counter()
+    async with AsyncSessionLocal() as db:
+        result = await db.execute(
+            select(*serializer.columns, model.created_at, model.id).order_by(model.created_at, model.id).limit(rows)
+        )
+        records = result.all()
+    fetched = time.perf_counter()
+    body = serializer.render(records)
+    return fetched - started, time.perf_counter() - fetched, body
+
+
+async def measure(run, rounds: int):
+    timings = [await run() for _ in range(rounds)]
+    fetch = min(timing[0] for timing in timings)
+    serialize = min(timing[1] for timing in timings)
+    return fetch, serialize, timings[-1][2]
+
+
+async def main(args):
+    scale = 10000 / args.rows
+    failed = False
+    for name, model, serializer, path, fields in CASES:
+        field = response_field(path)
+        projection = serializer.project(fields)
+        orm = await measure(lambda: orm_response(model, field, args.rows), args.rounds)
+        rows = await measure(lambda: rows_response(model, serializer, args.rows), args.rounds)
+        projected = await measure(lambda: rows_response(model, projection, args.rows), args.rounds)
+        same = json.loads(orm[2]) == json.loads(rows[2])
+        failed = failed or not same
+        print(f"{name} (per 10k rows)")
+        for label, (fetch, serialize, body) in (
+            ("orm + response_model", orm),
+            ("rows + RowSerializer", rows),
+            (f"fields={','.join(fields)}", projected),
+        ):
+            print(f"  {label:30} fetch {fetch * scale * 1000:7.1f} ms  "
+                  f"serialize {serialize * scale * 1000:7.1f} ms  "
+                  f"total {(fetch + serialize) * scale * 1000:7.1f} ms  "
+                  f"body {len(body) * scale / 1024:8.0f} KiB")
+        print(f"  same response: {same}")
+    await async_engine.dispose()
+    if failed:
+        sys.exit("FAIL: responses differ")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--rounds", type=int, default=5)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,96 @@
+# Пропускная способность записи: старая схема (commit + refresh + отдельный
+# commit истории) против единой транзакции из crud.py.
+#
+# Запуск (нужна поднятая БД из .env с демо-данными):
+#     python -m benchmarks.write_throughput --operations 2000 --concurrency 20
+#
+# Каждая операция - создание тендера и одно его редактирование.
+import argparse
+import asyncio
+import time
+
+import crud
+from database import AsyncSessionLocal, async_engine
+from enums import TenderStatus
+from models import Tender, TenderHistory
+from schemas import TenderCreate, TenderUpdate
+
+TENDER = TenderCreate(
+    name="bench",
+    service_type="Construction",
+    description="d" * 500,
+    organization_id=1,
+    creator_username="johndoe",
+)
+UPDATE = TenderUpdate(
+    name="bench updated",
+    username="johndoe",
+)
+
+
+def history_row(tender: Tender) -> TenderHistory:
+    return TenderHistory(
+        tender_id=tender.id,
+        name=tender.name,
+        description=tender.description,
+        status=tender.status,
+        version=tender.version,
+        service_type=tender.service_type,
+    )
+
+
+async def legacy_operation(db):
+    # Повторяет прежнюю реализацию crud.create_tender / update_tender
+    tender = Tender(
+        name=TENDER.name,
+        description=TENDER.description,
+        service_type=TENDER.service_type,
+        organization_id=TENDER.organization_id,
+        status=TenderStatus.CREATED,
+    )
+    db.add(tender)
+    await db.commit()
+    await db.refresh(tender)
+    db.add(history_row(tender))
+    await db.commit()
+
+    tender.name = UPDATE.name
+    tender.version += 1
+    await db.commit()
+    await db.refresh(tender)
+    db.add(history_row(tender))
+    await db.commit()
+
+
+async def unit_of_work_operation(db):
+    tender = await crud.create_tender(db, TENDER)
+    await crud.update_tender(db, tender, UPDATE)
+
+
+async def run(operation, total: int, concurrency: int) -> float:
+    remaining = iter(range(total))
+
+    async def worker():
+        async with AsyncSessionLocal() as db:
+            for _ in remaining:
+                await operation(db)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return total / (time.perf_counter() - started)
+
+
+async def main(args):
+    for name, operation in (("legacy", legacy_operation), ("unit of work", unit_of_work_operation)):
+        # Прогрев пула соединений
+        await run(operation, args.concurrency, args.concurrency)
+        ops = await run(operation, args.operations, args.concurrency)
+        print(f"{name:>12}: {ops:8.1f} ops/s ({ops * 2:8.1f} writes/s)")
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--operations", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import FrozenSet, NamedTuple, Optional
+
+from config import IDENTITY_CACHE_SIZE, IDENTITY_CACHE_TTL
+
+# Канал NOTIFY, в который триггеры employee и organization_responsible
+# (миграция 0008) пишут после изменения. Уведомление приходит только после
+# коммита и во все воркеры; его слушает EventBroker (events.py)
+IDENTITY_CHANNEL = "identity_changes"
+
+
+class Identity(NamedTuple):
+    user_id: int
+    organization_ids: FrozenSet[int]
+
+
+class IdentityCache:
+    # TTL/LRU-кэш username -> (id сотрудника, организации, за которые он отвечает).
+    # Сбрасывается по NOTIFY из IDENTITY_CHANNEL; TTL ограничивает устаревание,
+    # если уведомление потеряно (например, пока listener переподключался)
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Увеличивается при каждой инвалидации, чтобы не сохранить в кэш
+        # результат запроса, начатого до изменения данных
+        self.generation = 0
+
+    def get(self, username: str) -> Optional[Identity]:
+        with self._lock:
+            entry = self._entries.get(username)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[username]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(username)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, username: str, identity: Identity, generation: int):
+        with self._lock:
+            if generation != self.generation:
+                return
+            self._entries[username] = (identity, time.monotonic() + self.ttl)
+            self._entries.move_to_end(username)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+identity_cache = IdentityCache(
+    maxsize=IDENTITY_CACHE_SIZE,
+    ttl=IDENTITY_CACHE_TTL,
+    )
+
@@ -0,0 +1,133 @@
+import datetime
+import hashlib
+import json
+from collections import defaultdict
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import NamedTuple, Optional
+
+from fastapi import Request, Response
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from metrics import format_labels
+from models import ChangeCounter
+
+
+class Validator(NamedTuple):
+    etag: str
+    last_modified: Optional[datetime.datetime]
+
+
+class ConditionalStats:
+    # Сколько условных GET пришло на маршрут и сколько из них закончилось 304
+
+    def __init__(self):
+        self._counters = defaultdict(lambda: [0, 0])
+
+    def record(self, route: str, not_modified: bool):
+        counters = self._counters[route]
+        counters[0] += 1
+        if not_modified:
+            counters[1] += 1
+
+    def stats(self) -> dict:
+        return {
+            route: {
+                "requests": requests,
+                "not_modified": not_modified,
+                "not_modified_ratio": round(not_modified / requests, 4) if requests else 0.0,
+            }
+            for route, (requests, not_modified) in self._counters.items()
+        }
+
+    def render(self, lines: list):
+        counters = sorted(self._counters.items())
+        lines.append("# HELP conditional_get_requests_total Conditional GET requests by route.")
+        lines.append("# TYPE conditional_get_requests_total counter")
+        for route, (requests, _) in counters:
+            lines.append(f"conditional_get_requests_total{{{format_labels(route=route)}}} {requests}")
+        lines.append("# HELP conditional_get_not_modified_total Conditional GET requests answered with 304.")
+        lines.append("# TYPE conditional_get_not_modified_total counter")
+        for route, (_, not_modified) in counters:
+            lines.append(f"conditional_get_not_modified_total{{{format_labels(route=route)}}} {not_modified}")
+        lines.append("# HELP conditional_get_not_modified_ratio Share of conditional GET requests answered with 304.")
+        lines.append("# TYPE conditional_get_not_modified_ratio gauge")
+        for route, (requests, not_modified) in counters:
+            ratio = not_modified / requests if requests else 0.0
+            lines.append(f"conditional_get_not_modified_ratio{{{format_labels(route=route)}}} {ratio:.4f}")
+
+
+conditional_stats = ConditionalStats()
+
+
+async def get_validator(db: AsyncSession, model, request: Request, *extra) -> Validator:
+    # Счётчик изменений таблицы - одна строка по первичному ключу. max(updated_at)
+    # не годится: транзакция с более ранним now() может закоммититься позже
+    # и не изменить его
+    result = await db.execute(
+        select(ChangeCounter.version, ChangeCounter.changed_at)
+        .filter(ChangeCounter.table_name == model.__tablename__)
+    )
+    version, changed_at = result.one_or_none() or (None, None)
+    raw = json.dumps([
+        request.url.path,
+        sorted(request.query_params.multi_items()),
+        version,
+        *extra,
+    ], default=str)
+    etag = 'W/"%s"' % hashlib.sha1(raw.encode()).hexdigest()
+    return Validator(etag=etag, last_modified=changed_at)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    opaque = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == opaque for tag in header.split(","))
+
+
+def _not_modified_since(header: str, last_modified: Optional[datetime.datetime]) -> bool:
+    if not last_modified:
+        return False
+    try:
+        since = parsedate_to_datetime(header)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo:
+        since = since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    return last_modified.replace(microsecond=0) <= since
+
+
+def _headers(validator: Validator) -> dict:
+    headers = {
+        "ETag": validator.etag,
+        "Cache-Control": "no-cache",
+    }
+    if validator.last_modified:
+        headers["Last-Modified"] = format_datetime(
+            validator.last_modified.replace(tzinfo=datetime.timezone.utc),
+            usegmt=True,
+            )
+    return headers
+
+
+def not_modified_response(request: Request, validator: Validator) -> Optional[Response]:
+    # If-None-Match имеет приоритет над If-Modified-Since (RFC 9110, 13.2.2)
+    if_none_match = request.headers.get("if-none-match")
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_none_match is not None:
+        not_modified = _etag_matches(if_none_match, validator.etag)
+    elif if_modified_since is not None:
+        not_modified = _not_modified_since(if_modified_since, validator.last_modified)
+    else:
+        return None
+
+    route = request.scope["route"].path
+    conditional_stats.record(route, not_modified)
+    if not_modified:
+        return Response(status_code=304, headers=_headers(validator))
+    return None
+
+
+def set_validator_headers(response: Response, validator: Validator):
+    response.headers.update(_headers(validator))
@@ -10,3 +10,65 @@ POSTGRES_DATABASE = os.environ.get("POSTGRES_DATABASE")
 POSTGRES_USERNAME = os.environ.get("POSTGRES_USERNAME")
 POSTGRES_PASSWORD = os.environ.get("POSTGRES_PASSWORD")
 POSTGRES_CONN = f'postgresql+psycopg2://{POSTGRES_USERNAME}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DATABASE}'
+POSTGRES_ASYNC_CONN = f'postgresql+asyncpg://{POSTGRES_USERNAME}:{POSTGRES_PASSWORD}@{POSTGRES_HOST}:{POSTGRES_PORT}/{POSTGRES_DATABASE}'
+
+IDENTITY_CACHE_TTL = float(os.environ.get("IDENTITY_CACHE_TTL") or 30)
+IDENTITY_CACHE_SIZE = int(os.environ.get("IDENTITY_CACHE_SIZE") or 10000)
+
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS") or 10000)
+
+EXPORT_BATCH_SIZE = int(os.environ.get("EXPORT_BATCH_SIZE") or 5000)
+
+# full - каждая версия истории полной строкой, delta - снимки и изменения
+HISTORY_STORAGE = os.environ.get("HISTORY_STORAGE") or "full"
+HISTORY_SNAPSHOT_INTERVAL = int(os.environ.get("HISTORY_SNAPSHOT_INTERVAL") or 20)
+HISTORY_COMPRESSION = os.environ.get("HISTORY_COMPRESSION") or "zlib"
+# inline - строка истории пишется в транзакции изменения, outbox - в
+# транзакции пишется строка history_outbox, а в историю её пачками переносит
+# фоновая задача раз в HISTORY_OUTBOX_INTERVAL секунд
+HISTORY_WRITER = os.environ.get("HISTORY_WRITER") or "inline"
+HISTORY_OUTBOX_BATCH_SIZE = int(os.environ.get("HISTORY_OUTBOX_BATCH_SIZE") or 1000)
+HISTORY_OUTBOX_INTERVAL = float(os.environ.get("HISTORY_OUTBOX_INTERVAL") or 0.5)
+
+# Политика хранения истории: 0 - без ограничения
+HISTORY_KEEP_VERSIONS = int(os.environ.get("HISTORY_KEEP_VERSIONS") or 0)
+HISTORY_KEEP_DAYS = int(os.environ.get("HISTORY_KEEP_DAYS") or 0)
+HISTORY_COMPACTION_INTERVAL = float(os.environ.get("HISTORY_COMPACTION_INTERVAL") or 3600)
+HISTORY_COMPACTION_BATCH_SIZE = int(os.environ.get("HISTORY_COMPACTION_BATCH_SIZE") or 1000)
+
+# Реплики для чтения: строки подключения postgresql+asyncpg:// через запятую
+POSTGRES_REPLICA_CONNS = [conn.strip() for conn in (os.environ.get("POSTGRES_REPLICA_CONNS") or "").split(",") if conn.strip()]
+REPLICA_HEALTH_CHECK_INTERVAL = float(os.environ.get("REPLICA_HEALTH_CHECK_INTERVAL") or 5)
+# Сколько секунд после записи чтения пользователя идут на primary
+READ_YOUR_WRITES_WINDOW = float(os.environ.get("READ_YOUR_WRITES_WINDOW") or 5)
+
+# Пул соединений. Размер по умолчанию считается от ожидаемого числа
+# одновременных запросов к базе на воркер: постоянная половина и overflow
+# на пики. Свободное соединение без pre-ping - соединения старше
+# DB_POOL_RECYCLE секунд пул закрывает сам
+DB_CONCURRENCY = int(os.environ.get("DB_CONCURRENCY") or 40)
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE") or DB_CONCURRENCY // 2)
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW") or DB_CONCURRENCY - DB_POOL_SIZE)
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT") or 10)
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE") or 1800)
+DB_POOL_PRE_PING = (os.environ.get("DB_POOL_PRE_PING") or "false").lower() in ("1", "true", "yes")
+
+# Прогрев при старте воркера: сколько соединений пула открыть заранее и
+# для скольких недавно изменённых сотрудников загрузить кэш личностей
+DB_POOL_WARM_CONNECTIONS = int(os.environ.get("DB_POOL_WARM_CONNECTIONS") or min(DB_POOL_SIZE, 5))
+IDENTITY_CACHE_WARM = int(os.environ.get("IDENTITY_CACHE_WARM") or 1000)
+
+# DEBUG - заголовки X-DB-Queries/X-DB-Time; TEST_MODE - проверка бюджета
+# SQL-запросов обработчиков и повторяющихся запросов (N+1)
+DEBUG = (os.environ.get("DEBUG") or "false").lower() in ("1", "true", "yes")
+TEST_MODE = (os.environ.get("TEST_MODE") or "false").lower() in ("1", "true", "yes")
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD") or 5)
+
+# Лента изменений /api/events: канал NOTIFY, очередь подписчика (кто её
+# переполнил, отключается с событием reset), предел подписчиков на воркер,
+# интервал пингов SSE и проверки соединения LISTEN, пауза перед переподключением
+EVENTS_CHANNEL = os.environ.get("EVENTS_CHANNEL") or "entity_events"
+EVENTS_QUEUE_SIZE = max(int(os.environ.get("EVENTS_QUEUE_SIZE") or 100), 2)
+EVENTS_MAX_SUBSCRIBERS = int(os.environ.get("EVENTS_MAX_SUBSCRIBERS") or 10000)
+EVENTS_HEARTBEAT_INTERVAL = float(os.environ.get("EVENTS_HEARTBEAT_INTERVAL") or 15)
+EVENTS_RECONNECT_DELAY = float(os.environ.get("EVENTS_RECONNECT_DELAY") or 1)
@@ -0,0 +1,91 @@
+# Перевод существующей истории версий в другой формат хранения.
+#
+# Запуск (из каталога проекта, с настройками БД из .env):
+#     python convert_history.py --to delta --snapshot-interval 20 --compression zlib
+#     python convert_history.py --to full
+#
+# История обрабатывается пачками сущностей, каждая пачка - отдельная
+# транзакция, поэтому прерванную конвертацию можно просто запустить заново.
+# После конвертации в delta включите HISTORY_STORAGE=delta, иначе новые
+# версии продолжат писаться полными строками (на чтение это не влияет).
+import argparse
+import itertools
+import time
+
+from sqlalchemy import select, update
+
+from config import HISTORY_COMPRESSION, HISTORY_SNAPSHOT_INTERVAL
+from database import SessionLocal
+from history import BID_HISTORY, TENDER_HISTORY, HistoryCodec
+from models import BidHistory, TenderHistory
+
+ENTITIES = (
+    (TenderHistory, TenderHistory.tender_id, TENDER_HISTORY),
+    (BidHistory, BidHistory.bid_id, BID_HISTORY),
+)
+
+
+def convert_chain(codec: HistoryCodec, spec, rows) -> list:
+    # Восстанавливает каждую версию и заново кодирует её целевым codec
+    changes = []
+    previous = None
+    for row, state in codec.replay_versions(spec, rows):
+        values = codec.payload(spec, row.version, state, previous)
+        values["id"] = row.id
+        changes.append(values)
+        previous = (row.version, state)
+    return changes
+
+
+def convert_table(codec: HistoryCodec, model, key_column, spec, batch_size: int) -> int:
+    columns = [model.id, key_column, model.version, *(getattr(model, field) for field in spec.fields), model.delta]
+    converted = 0
+    last_id = 0
+    with SessionLocal() as db:
+        while True:
+            entity_ids = db.scalars(
+                select(key_column)
+                .filter(key_column > last_id)
+                .distinct()
+                .order_by(key_column)
+                .limit(batch_size)
+            ).all()
+            if not entity_ids:
+                return converted
+            rows = db.execute(
+                select(*columns)
+                .filter(key_column.in_(entity_ids))
+                .order_by(key_column, model.version)
+            ).all()
+            changes = []
+            for entity_id, chain in itertools.groupby(rows, key=lambda row: row[1]):
+                try:
+                    changes.extend(convert_chain(codec, spec, chain))
+                except ValueError as exc:
+                    raise SystemExit(f"{model.__tablename__} {entity_id}: {exc}")
+            db.execute(update(model), changes)
+            db.commit()
+            converted += len(changes)
+            last_id = entity_ids[-1]
+
+
+def main(args):
+    codec = HistoryCodec(
+        storage=args.to,
+        snapshot_interval=args.snapshot_interval,
+        compression=args.compression,
+        )
+    for model, key_column, spec in ENTITIES:
+        started = time.perf_counter()
+        converted = convert_table(codec, model, key_column, spec, args.batch_size)
+        elapsed = time.perf_counter() - started
+        print(f"{model.__tablename__}: {converted} versions converted to {args.to} in {elapsed:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--to", choices=["full", "delta"], required=True)
+    parser.add_argument("--snapshot-interval", type=int, default=HISTORY_SNAPSHOT_INTERVAL)
+    parser.add_argument("--compression", choices=["none", "zlib"], default=HISTORY_COMPRESSION)
+    parser.add_argument("--batch-size", type=int, default=500)
+    main(parser.parse_args())
@@ -1,39 +1,133 @@
-from sqlalchemy import or_
+import datetime
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+from sqlalchemy import case, false, func, insert, not_, or_, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from models import (Employee, 
-                    OrganizationResponsible, 
-                    Tender, 
-                    Bid, 
-                    TenderHistory, 
-                    BidHistory, 
+from models import (Employee,
+                    OrganizationResponsible,
+                    Tender,
+                    Bid,
+                    TenderHistory,
+                    BidHistory,
+                    HistoryOutbox,
                     Organization,
+                    SEARCH_CONFIG,
                     )
-from schemas import (TenderUpdate, 
-                     TenderCreate, 
-                     BidCreate, 
+from schemas import (TenderUpdate,
+                     TenderCreate,
+                     BidCreate,
                      BidUpdate,
-                     ) 
-from enums import BidStatus, TenderStatus
-
-def get_user_by_username(db: Session, username: str):
-    return db.query(Employee).filter(Employee.username == username).first()
-
-def is_user_responsible_for_org(db: Session, user_id: int, organization_id: int):
-    return db.query(OrganizationResponsible).filter(
-        OrganizationResponsible.user_id == user_id,
-        OrganizationResponsible.organization_id == organization_id
-    ).first() is not None
-
-def is_author_of_tender(db: Session, tender_id: int, user_id: int):
-    tender = db.query(Tender).filter(Tender.id == tender_id).first()
-    if tender and tender.organization_id:
-        responsible_users = db.query(OrganizationResponsible).filter(
-            OrganizationResponsible.organization_id == tender.organization_id
-        ).all()
-        return any(res.user_id == user_id for res in responsible_users)
-    return False
-
-def create_tender(db: Session, tender: TenderCreate):
+                     )
+from enums import BidStatus, DecisionType, TenderStatus
+from pagination import (PageParams,
+                        RankedPageParams,
+                        VersionPageParams,
+                        encode_version_cursor,
+                        fetch_page,
+                        fetch_ranked_page,
+                        )
+from cache import Identity, identity_cache
+from history import BID_HISTORY, TENDER_HISTORY, history_codec, history_state
+from events import bid_event, notify, tender_event
+from history_outbox import drain, outbox_values, update_with_outbox
+from serialization import BID_ROWS, EMPLOYEE_ROWS, ORGANIZATION_ROWS, TENDER_ROWS, RowSerializer
+from config import HISTORY_WRITER
+
+async def get_identities(db: AsyncSession, usernames: Iterable[str]) -> Dict[str, Identity]:
+    identities = {}
+    missing = []
+    for username in set(usernames):
+        identity = identity_cache.get(username)
+        if identity:
+            identities[username] = identity
+        else:
+            missing.append(username)
+    if not missing:
+        return identities
+
+    identities.update(await _load_identities(db, _identity_query().filter(Employee.username.in_(missing))))
+    return identities
+
+def _identity_query():
+    return (
+        select(
+            Employee.username,
+            Employee.id,
+            func.array_remove(func.array_agg(OrganizationResponsible.organization_id), None),
+        )
+        .outerjoin(OrganizationResponsible, OrganizationResponsible.user_id == Employee.id)
+        .group_by(Employee.id)
+    )
+
+async def _load_identities(db: AsyncSession, query) -> Dict[str, Identity]:
+    # Прочитанное с реплики в кэш не попадает: отстающая реплика может вернуть
+    # ответственность, отозванную после NOTIFY от primary, а по кэшу
+    # проверяются права записей
+    cacheable = db.info.get("replica") is None
+    identities = {}
+    generation = identity_cache.generation
+    for username, user_id, organization_ids in await db.execute(query):
+        identity = Identity(user_id=user_id, organization_ids=frozenset(organization_ids))
+        if cacheable:
+            identity_cache.put(username, identity, generation)
+        identities[username] = identity
+    return identities
+
+async def warm_identity_cache(db: AsyncSession, limit: int) -> int:
+    # Заполняет кэш личностями недавно изменённых сотрудников - скорее
+    # всего именно они и будут отправлять запросы
+    recent = select(Employee.id).order_by(Employee.updated_at.desc()).limit(limit)
+    identities = await _load_identities(db, _identity_query().filter(Employee.id.in_(recent)))
+    return len(identities)
+
+async def get_identity(db: AsyncSession, username: str):
+    identities = await get_identities(db, [username])
+    return identities.get(username)
+
+class Permissions(NamedTuple):
+    user_id: Optional[int] = None
+    responsible_for_org: bool = False
+    responsible_for_tender_org: bool = False
+    is_bid_creator: bool = False
+
+    @property
+    def user_exists(self):
+        return self.user_id is not None
+
+async def resolve_permissions(db: AsyncSession, username: str, organization_id: int = None, tender_id: int = None, bid: Bid = None):
+    # Все факты для проверки прав одним запросом с EXISTS-подзапросами:
+    # строки нет - пользователя нет. Создатель предложения сравнивается с
+    # уже загруженным bid, без подзапроса
+    responsible = select(OrganizationResponsible.id).filter(
+        OrganizationResponsible.user_id == Employee.id
+    )
+    responsible_for_org = false()
+    if organization_id is not None:
+        responsible_for_org = responsible.filter(
+            OrganizationResponsible.organization_id == organization_id
+        ).exists()
+    responsible_for_tender_org = false()
+    if tender_id is not None:
+        responsible_for_tender_org = responsible.join(
+            Tender, Tender.organization_id == OrganizationResponsible.organization_id
+        ).filter(Tender.id == tender_id).exists()
+
+    result = await db.execute(select(
+        Employee.id,
+        responsible_for_org,
+        responsible_for_tender_org,
+    ).filter(Employee.username == username))
+    row = result.first()
+    if not row:
+        return Permissions()
+    return Permissions(
+        user_id=row.id,
+        responsible_for_org=row[1],
+        responsible_for_tender_org=row[2],
+        is_bid_creator=bid is not None and bid.creator_id == row.id,
+    )
+
+async def create_tender(db: AsyncSession, tender: TenderCreate):
     db_tender = Tender(
         name=tender.name,
         description=tender.description,
@@ -42,184 +136,491 @@ def create_tender(db: Session, tender: TenderCreate):
         status=TenderStatus.CREATED,
     )
     db.add(db_tender)
-    db.commit()
-    db.refresh(db_tender)
-    # Сохранение в истории
+    # INSERT ... RETURNING id, без отдельного refresh
+    await db.flush()
+    # Сохранение в истории в той же транзакции
     save_tender_history(db, db_tender)
+    await notify(db, [tender_event(db_tender)])
+    await db.commit()
+    return db_tender
+
+def _expunge_loaded(db: AsyncSession, model, entity_id: int):
+    # RETURNING не обновляет объект, уже загруженный в сессию: при
+    # параллельном изменении строки в нём осталась бы устаревшая версия
+    # (version + 1 от прочитанной), и строка истории получила бы чужой
+    # номер. Без него RETURNING создаёт объект из вернувшейся строки
+    loaded = db.sync_session.identity_map.get(Session.identity_key(model, entity_id))
+    if loaded is not None:
+        db.expunge(loaded)
+
+async def _update_tender_version(db: AsyncSession, tender_id: int, values: dict, previous: Tuple[int, dict]):
+    # UPDATE ... RETURNING: версия увеличивается в самой базе, без гонки
+    # чтение-запись. Новая версия сохраняется в истории в той же транзакции,
+    # в режиме outbox - строкой очереди в том же запросе
+    _expunge_loaded(db, Tender, tender_id)
+    if HISTORY_WRITER == "outbox":
+        return await update_with_outbox(db, "tender", Tender, tender_id, values, previous)
+    result = await db.execute(
+        update(Tender)
+        .where(Tender.id == tender_id)
+        .values(**values, version=Tender.version + 1)
+        .returning(Tender)
+        .execution_options(synchronize_session=False)
+    )
+    db_tender = result.scalar_one()
+    save_tender_history(db, db_tender, previous)
     return db_tender
 
-def update_tender(db: Session, db_tender: Tender, tender: TenderUpdate):
+async def update_tender(db: AsyncSession, db_tender: Tender, tender: TenderUpdate):
+    values = {}
     if tender.name:
-        db_tender.name = tender.name
+        values["name"] = tender.name
     if tender.description:
-        db_tender.description = tender.description
+        values["description"] = tender.description
     if tender.service_type:
-        db_tender.service_type = tender.service_type
+        values["service_type"] = tender.service_type
     if tender.status:
-        db_tender.status = tender.status
+        values["status"] = tender.status
     if tender.organization_id:
-        db_tender.organization_id = tender.organization_id
-    db_tender.version += 1
-    db.commit()
-    db.refresh(db_tender)
-    # Сохранение в истории
-    save_tender_history(db, db_tender)
+        values["organization_id"] = tender.organization_id
+    previous = (db_tender.version, history_state(TENDER_HISTORY, db_tender))
+    db_tender = await _update_tender_version(db, db_tender.id, values, previous)
+    await notify(db, [tender_event(db_tender)])
+    await db.commit()
     return db_tender
 
-def rollback_tender(db: Session, db_tender: Tender, version: int):
-    history = db.query(TenderHistory).filter(
-        TenderHistory.tender_id == db_tender.id,
-        TenderHistory.version == version
-    ).first()
-    if history:
-        db_tender.name = history.name
-        db_tender.description = history.description
-        db_tender.status = history.status
-        db_tender.service_type = history.service_type
-        db_tender.version += 1
-        db.commit()
-        db.refresh(db_tender)
-        # Сохранение в истории
-        save_tender_history(db, db_tender)
+def _history_chain_query(model, key_column, entity_id: int, version: int):
+    # Версии от ближайшего полного снимка не новее version до самой version
+    snapshot_version = (
+        select(func.max(model.version))
+        .filter(key_column == entity_id, model.version <= version, model.delta.is_(None))
+        .scalar_subquery()
+    )
+    return (
+        select(model)
+        .filter(key_column == entity_id, model.version <= version, model.version >= snapshot_version)
+        .order_by(model.version)
+    )
+
+async def _oldest_history_version(db: AsyncSession, model, key_column, entity_id: int) -> Optional[int]:
+    # Версии до самой ранней сохранённой удалены политикой хранения истории
+    return await db.scalar(select(func.min(model.version)).filter(key_column == entity_id))
+
+async def get_oldest_tender_version(db: AsyncSession, tender_id: int) -> Optional[int]:
+    return await _oldest_history_version(db, TenderHistory, TenderHistory.tender_id, tender_id)
+
+async def _replay_version(db: AsyncSession, model, key_column, spec, entity_id: int, version: int):
+    # Строка истории версии и восстановленное состояние, или (None, None)
+    result = await db.execute(_history_chain_query(model, key_column, entity_id, version))
+    rows = result.scalars().all()
+    if not rows or rows[-1].version != version:
+        return None, None
+    return rows[-1], history_codec.replay(spec, rows)
+
+async def _get_history_versions(db: AsyncSession, model, key_column, spec, entity_id: int, page: VersionPageParams):
+    result = await db.execute(
+        select(model)
+        .filter(key_column == entity_id, model.version > (page.after or 0))
+        .order_by(model.version)
+        .limit(page.limit + 1)
+    )
+    rows = result.scalars().all()
+    next_cursor = None
+    if len(rows) > page.limit:
+        rows = rows[:page.limit]
+        next_cursor = encode_version_cursor(rows[-1].version)
+    prefix = []
+    if rows and rows[0].delta is not None:
+        # Страница начинается с delta: добираем цепочку от ближайшего снимка
+        result = await db.execute(_history_chain_query(model, key_column, entity_id, rows[0].version - 1))
+        prefix = result.scalars().all()
+    versions = [
+        dict(state, version=row.version, timestamp=row.timestamp)
+        for row, state in history_codec.replay_versions(spec, prefix + rows)
+    ]
+    return versions[len(prefix):], next_cursor
+
+async def get_tender_version_state(db: AsyncSession, tender_id: int, version: int) -> Optional[dict]:
+    _, state = await _replay_version(db, TenderHistory, TenderHistory.tender_id, TENDER_HISTORY, tender_id, version)
+    return state
+
+async def get_tender_version(db: AsyncSession, tender_id: int, version: int) -> Optional[dict]:
+    row, state = await _replay_version(db, TenderHistory, TenderHistory.tender_id, TENDER_HISTORY, tender_id, version)
+    if row is None:
+        return None
+    return dict(state, version=row.version, timestamp=row.timestamp)
+
+async def get_tender_versions(db: AsyncSession, tender_id: int, page: VersionPageParams = VersionPageParams()):
+    return await _get_history_versions(db, TenderHistory, TenderHistory.tender_id, TENDER_HISTORY, tender_id, page)
+
+async def rollback_tender(db: AsyncSession, db_tender: Tender, version: int):
+    if HISTORY_WRITER == "outbox":
+        # Откат читает версии из истории: ещё не перенесённые версии
+        # переносятся в транзакции отката
+        await drain(db, entity="tender", entity_id=db_tender.id)
+    state = await get_tender_version_state(db, db_tender.id, version)
+    if state:
+        previous = (db_tender.version, history_state(TENDER_HISTORY, db_tender))
+        db_tender = await _update_tender_version(db, db_tender.id, state, previous)
+        await notify(db, [tender_event(db_tender)])
+        await db.commit()
         return db_tender
     return None
 
-def save_tender_history(db: Session, tender: Tender):
-    history = TenderHistory(
+def tender_history_values(tender: Tender, previous: Tuple[int, dict] = None) -> dict:
+    # previous - (версия, состояние) тендера до изменения, для записи delta
+    return dict(
         tender_id=tender.id,
-        name=tender.name,
-        description=tender.description,
-        status=tender.status,
         version=tender.version,
-        service_type=tender.service_type
+        **history_codec.payload(
+            TENDER_HISTORY,
+            tender.version,
+            history_state(TENDER_HISTORY, tender),
+            previous,
+            ),
     )
-    db.add(history)
-    db.commit()
 
-def create_bid(db: Session, bid: BidCreate):
-    user = get_user_by_username(db, bid.creator_username)
-    if not user:
-        raise ValueError("User not found")
+def save_tender_history(db: AsyncSession, tender: Tender, previous: Tuple[int, dict] = None):
+    # Только добавляет строку в сессию: коммит делает вызывающая функция
+    if HISTORY_WRITER == "outbox":
+        db.add(HistoryOutbox(**outbox_values("tender", tender, previous)))
+    else:
+        db.add(TenderHistory(**tender_history_values(tender, previous)))
 
+async def create_tenders_bulk(db: AsyncSession, tenders: List[TenderCreate]):
+    # Пакетная вставка: один INSERT ... RETURNING на пачку строк и один
+    # executemany для версий истории, всё в одной транзакции
+    if not tenders:
+        return []
+    result = await db.scalars(
+        insert(Tender).returning(Tender, sort_by_parameter_order=True),
+        [
+            dict(
+                name=tender.name,
+                description=tender.description,
+                service_type=tender.service_type,
+                organization_id=tender.organization_id,
+                status=TenderStatus.CREATED,
+            )
+            for tender in tenders
+        ],
+    )
+    db_tenders = result.all()
+    if HISTORY_WRITER == "outbox":
+        await db.execute(insert(HistoryOutbox), [outbox_values("tender", tender) for tender in db_tenders])
+    else:
+        await db.execute(insert(TenderHistory), [tender_history_values(tender) for tender in db_tenders])
+    await notify(db, [tender_event(tender) for tender in db_tenders])
+    await db.commit()
+    return db_tenders
+
+async def create_bid(db: AsyncSession, bid: BidCreate, creator_id: int):
     db_bid = Bid(
         name=bid.name,
         description=bid.description,
         tender_id=bid.tender_id,
         organization_id=bid.organization_id,
         status=BidStatus.CREATED,
-        creator_id=user.id
+        creator_id=creator_id
     )
     db.add(db_bid)
-    db.commit()
-    db.refresh(db_bid)
-    # Сохранение в истории
+    # INSERT ... RETURNING id, без отдельного refresh
+    await db.flush()
+    # Сохранение в истории в той же транзакции
     save_bid_history(db, db_bid)
+    await notify(db, [bid_event(db_bid)])
+    await db.commit()
     return db_bid
 
-def update_bid(db: Session, db_bid: Bid, bid: BidUpdate):
+async def _update_bid_version(db: AsyncSession, bid_id: int, values: dict, previous: Tuple[int, dict]):
+    # UPDATE ... RETURNING: версия увеличивается в самой базе, без гонки
+    # чтение-запись. Новая версия сохраняется в истории в той же транзакции,
+    # в режиме outbox - строкой очереди в том же запросе
+    _expunge_loaded(db, Bid, bid_id)
+    if HISTORY_WRITER == "outbox":
+        return await update_with_outbox(db, "bid", Bid, bid_id, values, previous)
+    result = await db.execute(
+        update(Bid)
+        .where(Bid.id == bid_id)
+        .values(**values, version=Bid.version + 1)
+        .returning(Bid)
+        .execution_options(synchronize_session=False)
+    )
+    db_bid = result.scalar_one()
+    save_bid_history(db, db_bid, previous)
+    return db_bid
+
+async def update_bid(db: AsyncSession, db_bid: Bid, bid: BidUpdate):
+    values = {}
     if bid.name:
-        db_bid.name = bid.name
+        values["name"] = bid.name
     if bid.description:
-        db_bid.description = bid.description
+        values["description"] = bid.description
     if bid.status:
-        db_bid.status = bid.status
-    db_bid.version += 1
-    db.commit()
-    db.refresh(db_bid)
-    # Сохранение в истории
-    save_bid_history(db, db_bid)
+        values["status"] = bid.status
+    previous = (db_bid.version, history_state(BID_HISTORY, db_bid))
+    db_bid = await _update_bid_version(db, db_bid.id, values, previous)
+    await notify(db, [bid_event(db_bid)])
+    await db.commit()
     return db_bid
 
-def rollback_bid(db: Session, db_bid: Bid, version: int):
-    history = db.query(BidHistory).filter(
-        BidHistory.bid_id == db_bid.id,
-        BidHistory.version == version
-    ).first()
-    if history:
-        db_bid.name = history.name
-        db_bid.description = history.description
-        db_bid.status = history.status
-        db_bid.version += 1
-        db.commit()
-        db.refresh(db_bid)
-        # Сохранение в истории
-        save_bid_history(db, db_bid)
+async def get_oldest_bid_version(db: AsyncSession, bid_id: int) -> Optional[int]:
+    return await _oldest_history_version(db, BidHistory, BidHistory.bid_id, bid_id)
+
+async def get_bid_version_state(db: AsyncSession, bid_id: int, version: int) -> Optional[dict]:
+    _, state = await _replay_version(db, BidHistory, BidHistory.bid_id, BID_HISTORY, bid_id, version)
+    return state
+
+async def get_bid_version(db: AsyncSession, bid_id: int, version: int) -> Optional[dict]:
+    row, state = await _replay_version(db, BidHistory, BidHistory.bid_id, BID_HISTORY, bid_id, version)
+    if row is None:
+        return None
+    return dict(state, version=row.version, timestamp=row.timestamp)
+
+async def get_bid_versions(db: AsyncSession, bid_id: int, page: VersionPageParams = VersionPageParams()):
+    return await _get_history_versions(db, BidHistory, BidHistory.bid_id, BID_HISTORY, bid_id, page)
+
+async def rollback_bid(db: AsyncSession, db_bid: Bid, version: int):
+    if HISTORY_WRITER == "outbox":
+        # Откат читает версии из истории: ещё не перенесённые версии
+        # переносятся в транзакции отката
+        await drain(db, entity="bid", entity_id=db_bid.id)
+    state = await get_bid_version_state(db, db_bid.id, version)
+    if state:
+        previous = (db_bid.version, history_state(BID_HISTORY, db_bid))
+        db_bid = await _update_bid_version(db, db_bid.id, state, previous)
+        await notify(db, [bid_event(db_bid)])
+        await db.commit()
         return db_bid
     return None
 
-def save_bid_history(db: Session, bid: Bid):
-    history = BidHistory(
+def bid_history_values(bid: Bid, previous: Tuple[int, dict] = None) -> dict:
+    # previous - (версия, состояние) предложения до изменения, для записи delta
+    return dict(
         bid_id=bid.id,
-        name=bid.name,
-        description=bid.description,
-        status=bid.status,
         version=bid.version,
+        **history_codec.payload(
+            BID_HISTORY,
+            bid.version,
+            history_state(BID_HISTORY, bid),
+            previous,
+            ),
     )
-    db.add(history)
-    db.commit()
-
-def get_tenders(db: Session, service_type: str = None, username: str = None):
-    if not username:
-        # Если username не указан, возвращаем все тендеры со статусом PUBLISHED
-        query = db.query(Tender).filter(Tender.status == TenderStatus.PUBLISHED)
-        if service_type:
-            query = query.filter(Tender.service_type == service_type)
-        return query.all()
-
-    # Если username указан, сначала находим организации, к которым прикреплен этот username
-    user_organization_ids = db.query(OrganizationResponsible.organization_id).join(
-        Employee, Employee.id == OrganizationResponsible.user_id
-    ).filter(Employee.username == username).all()
-
-    # Преобразуем результат в список идентификаторов организаций
-    organization_ids = [org_id for (org_id,) in user_organization_ids]
-
-    # Формируем запрос для получения тендеров
-    query = db.query(Tender).filter(
-        or_(
-            Tender.status == TenderStatus.PUBLISHED,
-            Tender.organization_id.in_(organization_ids)
-        )
+
+def save_bid_history(db: AsyncSession, bid: Bid, previous: Tuple[int, dict] = None):
+    # Только добавляет строку в сессию: коммит делает вызывающая функция
+    if HISTORY_WRITER == "outbox":
+        db.add(HistoryOutbox(**outbox_values("bid", bid, previous)))
+    else:
+        db.add(BidHistory(**bid_history_values(bid, previous)))
+
+async def create_bids_bulk(db: AsyncSession, bids: List[BidCreate], creator_ids: List[int]):
+    # Пакетная вставка: один INSERT ... RETURNING на пачку строк и один
+    # executemany для версий истории, всё в одной транзакции
+    if not bids:
+        return []
+    result = await db.scalars(
+        insert(Bid).returning(Bid, sort_by_parameter_order=True),
+        [
+            dict(
+                name=bid.name,
+                description=bid.description,
+                tender_id=bid.tender_id,
+                organization_id=bid.organization_id,
+                status=BidStatus.CREATED,
+                creator_id=creator_id,
+            )
+            for bid, creator_id in zip(bids, creator_ids)
+        ],
+    )
+    db_bids = result.all()
+    if HISTORY_WRITER == "outbox":
+        await db.execute(insert(HistoryOutbox), [outbox_values("bid", bid) for bid in db_bids])
+    else:
+        await db.execute(insert(BidHistory), [bid_history_values(bid) for bid in db_bids])
+    await notify(db, [bid_event(bid) for bid in db_bids])
+    await db.commit()
+    return db_bids
+
+async def get_tender_organization_ids(db: AsyncSession, tender_ids: Iterable[int]) -> Dict[int, int]:
+    result = await db.execute(
+        select(Tender.id, Tender.organization_id).filter(Tender.id.in_(set(tender_ids)))
     )
+    return dict(result.all())
+
+async def get_existing_organization_ids(db: AsyncSession, organization_ids: Iterable[int]):
+    result = await db.execute(
+        select(Organization.id).filter(Organization.id.in_(set(organization_ids)))
+    )
+    return set(result.scalars().all())
+
+def _visible_tenders(user: Optional[Identity]):
+    # Опубликованные тендеры и тендеры организаций пользователя
+    if not user:
+        return Tender.status == TenderStatus.PUBLISHED
+    return or_(
+        Tender.status == TenderStatus.PUBLISHED,
+        Tender.organization_id.in_(list(user.organization_ids))
+    )
+
+def _visible_bids(user: Optional[Identity]):
+    # Опубликованные предложения, предложения организаций пользователя и его собственные
+    if not user:
+        return Bid.status == BidStatus.PUBLISHED
+    return or_(
+        Bid.status == BidStatus.PUBLISHED,
+        Bid.organization_id.in_(list(user.organization_ids)),
+        Bid.creator_id == user.user_id,
+    )
+
+def _search(model, q: str):
+    # websearch_to_tsquery не падает на произвольном пользовательском вводе
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    return model.search_vector.op("@@")(tsquery), func.ts_rank_cd(model.search_vector, tsquery)
+
+async def get_tenders(db: AsyncSession, service_type: str = None, username: str = None, page: PageParams = PageParams(),
+                      serializer: RowSerializer = TENDER_ROWS):
+    # Если username не указан, возвращаем все тендеры со статусом PUBLISHED,
+    # иначе ещё и тендеры организаций, к которым прикреплен этот username
+    user = await get_identity(db, username) if username else None
+    query = select(*serializer.columns).filter(_visible_tenders(user))
 
     if service_type:
         query = query.filter(Tender.service_type == service_type)
-    
-    return query.all()
 
-def get_organization_id_by_user_id(db: Session, user_id: int) -> int:
-    org_responsible = db.query(OrganizationResponsible).filter(OrganizationResponsible.user_id == user_id).first()
-    if org_responsible:
-        return org_responsible.organization_id
-    return None
+    return await fetch_page(db, query, Tender, page)
+
+async def search_tenders(db: AsyncSession, q: str, username: str = None, page: RankedPageParams = RankedPageParams(),
+                         serializer: RowSerializer = TENDER_ROWS):
+    user = await get_identity(db, username) if username else None
+    matches, rank = _search(Tender, q)
+    query = select(*serializer.columns).filter(matches, _visible_tenders(user))
+    return await fetch_ranked_page(db, query, Tender, rank, page)
+
+async def search_bids(db: AsyncSession, q: str, username: str = None, page: RankedPageParams = RankedPageParams(),
+                      serializer: RowSerializer = BID_ROWS):
+    user = await get_identity(db, username) if username else None
+    matches, rank = _search(Bid, q)
+    query = select(*serializer.columns).filter(matches, _visible_bids(user))
+    return await fetch_ranked_page(db, query, Bid, rank, page)
 
-def get_my_tenders(db: Session, username: str):
-    user = get_user_by_username(db, username)
-    print(user)
+async def get_my_tenders(db: AsyncSession, username: str, page: PageParams = PageParams(),
+                         serializer: RowSerializer = TENDER_ROWS):
+    user = await get_identity(db, username)
     if not user:
-        return []
-    org_ids = [res.organization_id for res in db.query(OrganizationResponsible).filter(OrganizationResponsible.user_id == user.id)]
-    return db.query(Tender).filter(Tender.organization_id.in_(org_ids)).all()
+        return [], None
+    query = select(*serializer.columns).filter(Tender.organization_id.in_(list(user.organization_ids)))
+    return await fetch_page(db, query, Tender, page)
 
-def get_bids_for_tender(db: Session, tender_id: int):
-    return db.query(Bid).filter(Bid.tender_id == tender_id).all()
+async def get_bids_for_tender(db: AsyncSession, tender_id: int, page: PageParams = PageParams(),
+                              serializer: RowSerializer = BID_ROWS):
+    query = select(*serializer.columns).filter(Bid.tender_id == tender_id)
+    return await fetch_page(db, query, Bid, page)
 
-def get_my_bids(db: Session, username: str):
-    user = get_user_by_username(db, username)
+async def get_my_bids(db: AsyncSession, username: str, page: PageParams = PageParams(),
+                      serializer: RowSerializer = BID_ROWS):
+    user = await get_identity(db, username)
     if not user:
-        return []
-    return db.query(Bid).filter(Bid.creator_id == user.id).all()
+        return [], None
+    query = select(*serializer.columns).filter(Bid.creator_id == user.user_id)
+    return await fetch_page(db, query, Bid, page)
 
-def get_bid(db: Session, bid_id: int):
-    return db.query(Bid).filter(Bid.id == bid_id).first()
+# Сколько согласований нужно для публикации предложения
+BID_APPROVAL_QUORUM = 3
 
+async def apply_bid_decision(db: AsyncSession, bid_id: int, username: str, decision: DecisionType):
+    # Переход статуса одним условным UPDATE: проверка "ещё не голосовал",
+    # инкремент счётчика и проверка кворума выполняются атомарно в базе,
+    # поэтому параллельные решения не теряются и не публикуют дважды.
+    query = update(Bid).where(
+        Bid.id == bid_id,
+        Bid.status != BidStatus.PUBLISHED,
+        not_(Bid.approved_by.any(username)),
+    )
+    if decision == DecisionType.REJECT:
+        query = query.values(status=BidStatus.CANCELED)
+    else:
+        query = query.values(
+            approved_by=func.array_append(Bid.approved_by, username),
+            approve_decision_count=Bid.approve_decision_count + 1,
+            status=case(
+                (Bid.approve_decision_count + 1 >= BID_APPROVAL_QUORUM, BidStatus.PUBLISHED),
+                else_=Bid.status,
+            ),
+        )
+    result = await db.execute(
+        query
+        .returning(Bid.status, Bid.approve_decision_count,
+                   Bid.id, Bid.tender_id, Bid.organization_id, Bid.creator_id, Bid.version)
+        .execution_options(synchronize_session=False)
+    )
+    row = result.first()
+    if row:
+        await notify(db, [bid_event(row)])
+    await db.commit()
+    return row
 
-def get_employees(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(Employee).offset(skip).limit(limit).all()
+async def get_bid(db: AsyncSession, bid_id: int):
+    result = await db.execute(select(Bid).filter(Bid.id == bid_id))
+    return result.scalars().first()
+
+
+async def get_employees(db: AsyncSession, page: PageParams = PageParams(), serializer: RowSerializer = EMPLOYEE_ROWS):
+    return await fetch_page(db, select(*serializer.columns), Employee, page)
 
 # Организации
-def get_organizations(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(Organization).offset(skip).limit(limit).all()
+async def get_organizations(db: AsyncSession, page: PageParams = PageParams(),
+                            serializer: RowSerializer = ORGANIZATION_ROWS):
+    return await fetch_page(db, select(*serializer.columns), Organization, page)
+
+async def get_tender(db: AsyncSession, tender_id: int):
+    result = await db.execute(select(Tender).filter(Tender.id == tender_id))
+    return result.scalars().first()
+# Выгрузки: только нужные колонки, без создания ORM-объектов
+EXPORT_COLUMNS = {
+    "tenders": (
+        Tender.updated_at,
+        [Tender.id, Tender.name, Tender.description, Tender.service_type, Tender.status,
+         Tender.organization_id, Tender.version, Tender.created_at, Tender.updated_at],
+    ),
+    "bids": (
+        Bid.updated_at,
+        [Bid.id, Bid.name, Bid.description, Bid.status, Bid.tender_id, Bid.organization_id,
+         Bid.creator_id, Bid.version, Bid.approve_decision_count, Bid.approved_by,
+         Bid.created_at, Bid.updated_at],
+    ),
+    "tender_history": (
+        TenderHistory.timestamp,
+        [TenderHistory.id, TenderHistory.tender_id, TenderHistory.name, TenderHistory.description,
+         TenderHistory.status, TenderHistory.service_type, TenderHistory.version,
+         TenderHistory.timestamp, TenderHistory.delta],
+    ),
+    "bid_history": (
+        BidHistory.timestamp,
+        [BidHistory.id, BidHistory.bid_id, BidHistory.name, BidHistory.description,
+         BidHistory.status, BidHistory.version, BidHistory.timestamp, BidHistory.delta],
+    ),
+}
+
+# Видимость выгрузки - как у остальных эндпоинтов чтения: сущность -
+# (соединение с тендером или предложением для истории, фильтр видимости)
+EXPORT_VISIBILITY = {
+    "tenders": (None, _visible_tenders),
+    "bids": (None, _visible_bids),
+    "tender_history": ((Tender, Tender.id == TenderHistory.tender_id), _visible_tenders),
+    "bid_history": ((Bid, Bid.id == BidHistory.bid_id), _visible_bids),
+}
 
-def get_tender(db: Session, tender_id: int):
-    return db.query(Tender).filter(Tender.id == tender_id).first()
\ No newline at end of file
+def get_export_query(entity: str, user: Identity, updated_since: datetime.datetime = None):
+    updated_column, columns = EXPORT_COLUMNS[entity]
+    join, visible = EXPORT_VISIBILITY[entity]
+    query = select(*columns)
+    if join:
+        query = query.join(*join)
+    query = query.filter(visible(user))
+    if updated_since:
+        # Колонки хранят наивное UTC-время
+        if updated_since.tzinfo:
+            updated_since = updated_since.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+        query = query.filter(updated_column >= updated_since)
+    return query.order_by(columns[0])
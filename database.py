@@ -1,20 +1,241 @@
-from sqlalchemy import create_engine
+import asyncio
+import itertools
+import threading
+import time
+from typing import Iterable, List, Optional
+from fastapi import Request
+from sqlalchemy import Select, create_engine, text
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
-from config import POSTGRES_CONN
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from config import (POSTGRES_CONN, 
+                    POSTGRES_ASYNC_CONN, 
+                    POSTGRES_REPLICA_CONNS, 
+                    REPLICA_HEALTH_CHECK_INTERVAL, 
+                    READ_YOUR_WRITES_WINDOW,
+                    DB_POOL_SIZE,
+                    DB_MAX_OVERFLOW,
+                    DB_POOL_TIMEOUT,
+                    DB_POOL_RECYCLE,
+                    DB_POOL_PRE_PING,
+                    )
+from metrics import Histogram
 
+# Границы гистограммы ожидания соединения из пула, мс
+POOL_WAIT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
 
 
-engine = create_engine(POSTGRES_CONN)
+class _CheckoutTiming:
+    # Время выдачи соединения пулом: ожидание в очереди, создание нового
+    # соединения и pre-ping
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.checkout_wait = Histogram(POOL_WAIT_BUCKETS)
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            self.checkout_wait.observe((time.perf_counter() - started) * 1000)
+
+    def stats(self) -> dict:
+        return {
+            "size": self.size(),
+            "checked_out": self.checkedout(),
+            "idle": self.checkedin(),
+            # QueuePool ведёт overflow от -size, пока постоянные соединения не открыты
+            "overflow": max(self.overflow(), 0),
+            "max_overflow": self._max_overflow,
+            "checkout_wait_ms": self.checkout_wait.snapshot(),
+        }
+
+
+class InstrumentedQueuePool(_CheckoutTiming, QueuePool):
+    pass
+
+
+class InstrumentedAsyncPool(_CheckoutTiming, AsyncAdaptedQueuePool):
+    pass
+
+
+POOL_OPTIONS = dict(
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    pool_pre_ping=DB_POOL_PRE_PING,
+    )
+
+
+
+# Синхронный движок: миграции, сидирование и скрипты. Они работают в одном
+# соединении на процесс, поэтому пул маленький и без overflow, а не как у
+# обработчиков API
+SCRIPT_POOL_SIZE = 2
+
+engine = create_engine(
+    POSTGRES_CONN, 
+    poolclass=InstrumentedQueuePool, 
+    pool_size=SCRIPT_POOL_SIZE,
+    max_overflow=0,
+    pool_timeout=DB_POOL_TIMEOUT,
+    pool_recycle=DB_POOL_RECYCLE,
+    )
 SessionLocal = sessionmaker(
     autocommit=False, 
     autoflush=False, 
     bind=engine,
     )
+
+# Асинхронный движок: все обработчики API
+async_engine = create_async_engine(
+    POSTGRES_ASYNC_CONN, 
+    poolclass=InstrumentedAsyncPool, 
+    **POOL_OPTIONS,
+    )
+
+
+class ReplicaSet:
+    # Реплики для чтения: round-robin по репликам, прошедшим последнюю
+    # проверку доступности
+
+    def __init__(self, engines: List[AsyncEngine]):
+        self.engines = engines
+        self.healthy = list(engines)
+        self._counter = itertools.count()
+
+    def choose(self) -> Optional[AsyncEngine]:
+        healthy = self.healthy
+        if not healthy:
+            return None
+        return healthy[next(self._counter) % len(healthy)]
+
+    async def _ping(self, engine: AsyncEngine, timeout: float) -> bool:
+        async def ping():
+            async with engine.connect() as conn:
+                await conn.execute(text("SELECT 1"))
+        try:
+            await asyncio.wait_for(ping(), timeout)
+            return True
+        except Exception:
+            return False
+
+    async def check(self, timeout: float = 2):
+        results = await asyncio.gather(*(self._ping(engine, timeout) for engine in self.engines))
+        self.healthy = [engine for engine, ok in zip(self.engines, results) if ok]
+
+    async def run_health_checks(self, interval: float = REPLICA_HEALTH_CHECK_INTERVAL):
+        while True:
+            await self.check()
+            await asyncio.sleep(interval)
+
+    def stats(self) -> dict:
+        healthy = set(self.healthy)
+        return {
+            engine.url.render_as_string(hide_password=True): dict(
+                healthy=engine in healthy,
+                pool=engine.pool.stats(),
+                )
+            for engine in self.engines
+        }
+
+
+class RecentWriters:
+    # Пользователи, писавшие в базу последние window секунд: их чтения идут
+    # на primary, чтобы не увидеть устаревшие данные с реплики
+
+    def __init__(self, window: float):
+        self.window = window
+        self._writes = {}
+        self._lock = threading.Lock()
+
+    def mark(self, usernames: Iterable[str]):
+        now = time.monotonic()
+        with self._lock:
+            for username in usernames:
+                self._writes[username] = now
+            if len(self._writes) > 10000:
+                self._writes = {
+                    username: written_at
+                    for username, written_at in self._writes.items()
+                    if now - written_at < self.window
+                }
+
+    def is_recent(self, usernames: Iterable[str]) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            return any(
+                now - self._writes.get(username, -self.window) < self.window
+                for username in usernames
+            )
+
+
+class RoutingSession(Session):
+    # SELECT сессии, для которой выбрана реплика, идут на реплику; flush,
+    # UPDATE/INSERT/DELETE и всё остальное - на primary
+
+    def get_bind(self, mapper=None, clause=None, **kw):
+        replica = self.info.get("replica")
+        if replica is not None and not self._flushing and isinstance(clause, Select):
+            return replica.sync_engine
+        return super().get_bind(mapper, clause=clause, **kw)
+
+
+replicas = ReplicaSet([
+    create_async_engine(conn, poolclass=InstrumentedAsyncPool, **POOL_OPTIONS)
+    for conn in POSTGRES_REPLICA_CONNS
+])
+recent_writers = RecentWriters(window=READ_YOUR_WRITES_WINDOW)
+
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    sync_session_class=RoutingSession,
+    autoflush=False,
+    expire_on_commit=False,
+    )
 Base = declarative_base()
-def get_db():
-    db = SessionLocal()
+async def warm_pool(engine: AsyncEngine, connections: int):
+    # Открывает соединения заранее, чтобы первые запросы воркера не ждали
+    # установки соединения
+    async def ping():
+        async with engine.connect() as conn:
+            await conn.execute(text("SELECT 1"))
+    await asyncio.gather(*(ping() for _ in range(connections)))
+
+def read_only_session() -> AsyncSession:
+    # Сессия для чтения с реплики; без здоровых реплик - обычная сессия primary
+    db = AsyncSessionLocal()
+    db.info["replica"] = replicas.choose()
+    return db
+
+async def _request_usernames(request: Request) -> List[str]:
+    # Пользователи запроса: параметр username и поля username/creator_username
+    # тела, в том числе у элементов пакетных запросов
+    usernames = request.query_params.getlist("username")
     try:
+        body = await request.json()
+    except ValueError:
+        return usernames
+    for item in body if isinstance(body, list) else [body]:
+        if isinstance(item, dict):
+            usernames += [item[key] for key in ("username", "creator_username") if isinstance(item.get(key), str)]
+    return usernames
+
+async def get_async_db(request: Request):
+    if request.method in ("GET", "HEAD"):
+        if recent_writers.is_recent(request.query_params.getlist("username")):
+            db = AsyncSessionLocal()
+        else:
+            db = read_only_session()
+        async with db:
+            yield db
+        return
+
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
\ No newline at end of file
+    # Исключение из обработчика сюда не доходит: отмечаются только успешные записи
+    recent_writers.mark(await _request_usernames(request))
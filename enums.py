@@ -19,3 +19,13 @@ class DecisionType(str, enum.Enum):
     APPROVE = "approve" 
     REJECT = "reject"
 
+
+class ExportEntity(str, enum.Enum):
+    TENDERS = "tenders"
+    BIDS = "bids"
+    TENDER_HISTORY = "tender_history"
+    BID_HISTORY = "bid_history"
+
+class ExportFormat(str, enum.Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
@@ -0,0 +1,310 @@
+import asyncio
+import json
+import logging
+from collections import defaultdict
+from typing import Iterable, Optional
+
+import asyncpg
+from sqlalchemy import Text, bindparam, func, select
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from cache import IDENTITY_CHANNEL, Identity, identity_cache
+from config import (EVENTS_CHANNEL,
+                    EVENTS_HEARTBEAT_INTERVAL,
+                    EVENTS_MAX_SUBSCRIBERS,
+                    EVENTS_QUEUE_SIZE,
+                    EVENTS_RECONNECT_DELAY,
+                    )
+from database import async_engine
+from enums import BidStatus, TenderStatus
+
+logger = logging.getLogger(__name__)
+
+# Кадры SSE. reset - события могли потеряться (подписчик не успевал читать
+# или listener переподключался): клиенту нужно перечитать списки
+PING_FRAME = ": ping\n\n"
+RESET_FRAME = "event: reset\ndata: {}\n\n"
+# Конец потока подписчика
+CLOSE = None
+
+
+def tender_event(tender) -> dict:
+    return {
+        "type": "tender",
+        "id": tender.id,
+        "tender_id": tender.id,
+        "organization_id": tender.organization_id,
+        "status": TenderStatus(tender.status).value,
+        "version": tender.version,
+    }
+
+
+def bid_event(bid) -> dict:
+    return {
+        "type": "bid",
+        "id": bid.id,
+        "tender_id": bid.tender_id,
+        "organization_id": bid.organization_id,
+        "creator_id": bid.creator_id,
+        "status": BidStatus(bid.status).value,
+        "version": bid.version,
+    }
+
+
+async def notify(db: AsyncSession, events: Iterable[dict]):
+    # pg_notify в транзакции вызывающей функции: Postgres отправит события
+    # только после коммита и не отправит при откате. Пачка - одним запросом
+    payloads = [json.dumps(event, separators=(",", ":")) for event in events]
+    if not payloads:
+        return
+    await db.execute(select(func.pg_notify(
+        EVENTS_CHANNEL,
+        func.unnest(bindparam("payloads", payloads, type_=ARRAY(Text))),
+        )))
+
+
+class Subscription:
+    # Фильтры объединяются по "и". Без username видны только события со
+    # статусом PUBLISHED, с username - только события организаций
+    # пользователя и его предложений (как в /my)
+
+    __slots__ = ("tender_id", "organization_id", "user", "queue")
+
+    def __init__(self, tender_id: Optional[int], organization_id: Optional[int],
+                 user: Optional[Identity], queue_size: int):
+        self.tender_id = tender_id
+        self.organization_id = organization_id
+        self.user = user
+        self.queue = asyncio.Queue(queue_size)
+
+    def keys(self) -> list:
+        # Ключи индекса брокера: событие проверяется только у подписчиков,
+        # чей ключ совпал с одним из ключей события
+        if self.tender_id is not None:
+            return [("tender", self.tender_id)]
+        if self.organization_id is not None:
+            return [("organization", self.organization_id)]
+        if self.user is not None:
+            return [("organization", organization_id) for organization_id in self.user.organization_ids] + [
+                ("creator", self.user.user_id)]
+        return [("all",)]
+
+    def matches(self, event: dict) -> bool:
+        if self.tender_id is not None and event["tender_id"] != self.tender_id:
+            return False
+        if self.organization_id is not None and event["organization_id"] != self.organization_id:
+            return False
+        if self.user is None:
+            return event["status"] == TenderStatus.PUBLISHED
+        return (event["organization_id"] in self.user.organization_ids
+                or event.get("creator_id") == self.user.user_id)
+
+
+def _event_keys(event: dict) -> list:
+    keys = [("all",), ("tender", event["tender_id"]), ("organization", event["organization_id"])]
+    if "creator_id" in event:
+        keys.append(("creator", event["creator_id"]))
+    return keys
+
+
+class EventBroker:
+    # Одно соединение LISTEN на воркер раздаёт события подписчикам
+    # /api/events. У каждого подписчика ограниченная очередь: кто не успевает
+    # читать, получает reset и отключается, а не копит события в памяти.
+    # То же соединение слушает IDENTITY_CHANNEL и сбрасывает кэш личностей,
+    # поэтому оно запускается при старте воркера (start), а не при первой
+    # подписке
+
+    def __init__(self, channel: str = EVENTS_CHANNEL, queue_size: int = EVENTS_QUEUE_SIZE,
+                 max_subscribers: int = EVENTS_MAX_SUBSCRIBERS):
+        self.channel = channel
+        self.queue_size = queue_size
+        self.max_subscribers = max_subscribers
+        self._index = defaultdict(set)
+        self._subscribers = set()
+        self._tasks = ()
+        self._received = 0
+        self._delivered = 0
+        self._overflows = 0
+        self._reconnects = 0
+        self._identity_resets = 0
+
+    @property
+    def full(self) -> bool:
+        return len(self._subscribers) >= self.max_subscribers
+
+    def subscribe(self, tender_id: int = None, organization_id: int = None, user: Identity = None) -> Subscription:
+        subscription = Subscription(tender_id, organization_id, user, self.queue_size)
+        self._subscribers.add(subscription)
+        for key in subscription.keys():
+            self._index[key].add(subscription)
+        self.start()
+        return subscription
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = (asyncio.create_task(self._listen()), asyncio.create_task(self._heartbeat()))
+
+    def unsubscribe(self, subscription: Subscription):
+        if subscription not in self._subscribers:
+            return
+        self._subscribers.discard(subscription)
+        for key in subscription.keys():
+            subscribers = self._index.get(key)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._index[key]
+
+    def _close(self, subscription: Subscription, frame: Optional[str] = None):
+        self.unsubscribe(subscription)
+        queue = subscription.queue
+        while not queue.empty():
+            queue.get_nowait()
+        if frame is not None:
+            queue.put_nowait(frame)
+        queue.put_nowait(CLOSE)
+
+    def _overflow(self, subscription: Subscription):
+        # Очередь переполнена: события, которые в неё не поместились,
+        # потеряны, поэтому вместо них уходят reset и конец потока
+        self._overflows += 1
+        self._close(subscription, RESET_FRAME)
+
+    def publish(self, payload: str):
+        self._received += 1
+        try:
+            event = json.loads(payload)
+            keys = _event_keys(event)
+        except (ValueError, KeyError):
+            logger.warning("Malformed event payload: %r", payload)
+            return
+        candidates = set()
+        for key in keys:
+            candidates.update(self._index.get(key, ()))
+        # Кадр кодируется один раз для всех подписчиков
+        frame = None
+        for subscription in candidates:
+            if not subscription.matches(event):
+                continue
+            if frame is None:
+                frame = f"event: {event['type']}\ndata: {payload}\n\n"
+            try:
+                subscription.queue.put_nowait(frame)
+                self._delivered += 1
+            except asyncio.QueueFull:
+                self._overflow(subscription)
+
+    def _reset_all(self):
+        for subscription in list(self._subscribers):
+            try:
+                subscription.queue.put_nowait(RESET_FRAME)
+            except asyncio.QueueFull:
+                self._overflow(subscription)
+
+    async def _heartbeat(self):
+        # Пинг раз в EVENTS_HEARTBEAT_INTERVAL не даёт прокси закрыть
+        # простаивающее соединение и выявляет ушедших клиентов. Один таймер
+        # на всех, а не ожидание с тайм-аутом в каждом потоке; в непустую
+        # очередь пинг не нужен - поток и так не простаивает
+        while True:
+            await asyncio.sleep(EVENTS_HEARTBEAT_INTERVAL)
+            for subscription in self._subscribers:
+                if subscription.queue.empty():
+                    subscription.queue.put_nowait(PING_FRAME)
+
+    def _on_notification(self, connection, pid, channel, payload):
+        self.publish(payload)
+
+    def _on_identity_change(self, connection, pid, channel, payload):
+        self._identity_resets += 1
+        identity_cache.invalidate()
+
+    async def _listen(self):
+        # Соединение не из пула: LISTEN держит его всё время жизни воркера.
+        # Обрыв замечается по периодическому запросу; после переподключения
+        # подписчики получают reset, а кэш личностей сбрасывается - события
+        # и уведомления за время обрыва потеряны
+        dsn = async_engine.url.set(drivername="postgresql").render_as_string(hide_password=False)
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(dsn)
+                await connection.add_listener(self.channel, self._on_notification)
+                await connection.add_listener(IDENTITY_CHANNEL, self._on_identity_change)
+                if connected_before:
+                    self._reconnects += 1
+                    self._reset_all()
+                    identity_cache.invalidate()
+                connected_before = True
+                while True:
+                    await asyncio.sleep(EVENTS_HEARTBEAT_INTERVAL)
+                    await asyncio.wait_for(connection.fetchval("SELECT 1"), EVENTS_HEARTBEAT_INTERVAL)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Event listener connection failed")
+            finally:
+                if connection is not None:
+                    connection.terminate()
+            await asyncio.sleep(EVENTS_RECONNECT_DELAY)
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = ()
+        for subscription in list(self._subscribers):
+            self._close(subscription)
+
+    async def stream(self, tender_id: int = None, organization_id: int = None, user: Identity = None):
+        # Тело ответа SSE. Подписка оформляется в самом генераторе: если
+        # клиент уйдёт до начала ответа, генератор не запустится и подписка
+        # не повиснет. Накопившиеся в очереди кадры уходят одним чанком
+        subscription = self.subscribe(tender_id, organization_id, user)
+        queue = subscription.queue
+        try:
+            yield f"retry: {int(EVENTS_RECONNECT_DELAY * 1000)}\n\n"
+            while True:
+                frames = [await queue.get()]
+                while not queue.empty():
+                    frames.append(queue.get_nowait())
+                if CLOSE in frames:
+                    chunk = "".join(frames[:frames.index(CLOSE)])
+                    if chunk:
+                        yield chunk
+                    return
+                yield "".join(frames)
+        finally:
+            self.unsubscribe(subscription)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "listening": bool(self._tasks),
+            "received": self._received,
+            "delivered": self._delivered,
+            "overflows": self._overflows,
+            "reconnects": self._reconnects,
+            "identity_resets": self._identity_resets,
+        }
+
+    def render(self, lines: list):
+        stats = self.stats()
+        lines.append("# HELP events_subscribers Open /api/events streams.")
+        lines.append("# TYPE events_subscribers gauge")
+        lines.append(f"events_subscribers {stats['subscribers']}")
+        for name, help_text in (
+            ("received", "Notifications received by the listener."),
+            ("delivered", "Events queued to subscribers."),
+            ("overflows", "Subscribers disconnected because their queue was full."),
+            ("reconnects", "Listener reconnections."),
+            ("identity_resets", "Identity cache resets on identity_changes notifications."),
+        ):
+            lines.append(f"# HELP events_{name}_total {help_text}")
+            lines.append(f"# TYPE events_{name}_total counter")
+            lines.append(f"events_{name}_total {stats[name]}")
+
+
+event_broker = EventBroker()
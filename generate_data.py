@@ -0,0 +1,419 @@
+# Генератор синтетических данных для нагрузочного тестирования.
+#
+# Запуск (из каталога проекта, с настройками БД из .env, на базе с
+# применёнными миграциями):
+#     python generate_data.py --employees 100000 --organizations 10000 \
+#         --tenders 5000000 --bids 20000000 --workers 8 --seed 1
+#
+# Данные загружаются через COPY пачками по --chunk-size строк, пачки
+# одной таблицы грузятся параллельно в --workers процессах. Вторичные
+# индексы больших таблиц на время загрузки удаляются и затем строятся
+# заново (тоже параллельно). Содержимое каждой пачки определяется только
+# --seed, номером пачки и параметрами масштаба, поэтому при тех же
+# параметрах данные совпадают независимо от числа процессов (кроме
+# суррогатных id строк истории, которые выдаёт последовательность).
+#
+# Распределения:
+#     - организации тендеров и предложений - степенной закон: немногие
+#       крупные организации публикуют большую часть тендеров;
+#     - service_type перекошен в сторону нескольких популярных видов услуг;
+#     - предложения концентрируются на "горячих" тендерах;
+#     - длина цепочки версий - распределение Парето с длинным хвостом до
+#       --max-versions.
+# История пишется в формате HISTORY_STORAGE (full или delta).
+import argparse
+import datetime
+import io
+import multiprocessing
+import random
+import sys
+import time
+from typing import Iterator, List, NamedTuple, Tuple
+
+from sqlalchemy import text
+
+from config import HISTORY_COMPRESSION, HISTORY_SNAPSHOT_INTERVAL, HISTORY_STORAGE
+from crud import BID_APPROVAL_QUORUM
+from database import engine
+from enums import BidStatus, OrganizationType, TenderStatus
+from history import BID_HISTORY, TENDER_HISTORY, HistoryCodec
+
+TABLES = (
+    "organization",
+    "employee",
+    "organization_responsible",
+    "tenders",
+    "tender_history",
+    "bids",
+    "bid_history",
+)
+
+SERVICE_TYPES = ("Construction", "Delivery", "Manufacture", "Consulting", "Cleaning", "Security", "IT")
+SERVICE_TYPE_WEIGHTS = (40, 25, 12, 10, 6, 4, 3)
+
+TENDER_STATUSES = (TenderStatus.CREATED, TenderStatus.PUBLISHED, TenderStatus.CLOSED)
+TENDER_STATUS_WEIGHTS = (20, 60, 20)
+BID_STATUSES = (BidStatus.CREATED, BidStatus.PUBLISHED, BidStatus.CANCELED)
+BID_STATUS_WEIGHTS = (55, 30, 15)
+
+FIRST_NAMES = ("Иван", "Мария", "Алексей", "Ольга", "Дмитрий", "Анна", "Сергей", "Елена", "Павел", "Наталья")
+LAST_NAMES = ("Иванов", "Смирнова", "Кузнецов", "Попова", "Соколов", "Лебедева", "Козлов", "Новикова")
+WORDS = (
+    "поставка", "ремонт", "строительство", "обслуживание", "оборудование", "материалы",
+    "склад", "офис", "доставка", "монтаж", "проектирование", "уборка", "охрана", "сервер",
+    "кровля", "фасад", "дорога", "мост", "освещение", "вентиляция", "отопление", "мебель",
+    "консультация", "аудит", "логистика", "транспорт", "поддержка", "разработка", "лицензия",
+)
+
+# Большое простое число: перемешивает номера "горячих" сущностей, чтобы
+# они не шли подряд по id
+SCATTER = 2654435761
+
+
+class Scale(NamedTuple):
+    employees: int
+    organizations: int
+    tenders: int
+    bids: int
+    max_versions: int
+    version_alpha: float
+    seed: int
+    start: datetime.datetime
+    days: int
+
+
+class Chunk(NamedTuple):
+    table: str
+    index: int
+    first_id: int
+    last_id: int
+
+
+def _rng(scale: Scale, chunk: Chunk) -> random.Random:
+    # Строковый seed хешируется детерминированно (в отличие от hash())
+    return random.Random(f"{scale.seed}:{chunk.table}:{chunk.index}")
+
+
+def _skewed(rng: random.Random, n: int, exponent: float) -> int:
+    # Степенное распределение на 1..n: малые номера выпадают чаще,
+    # затем номера перемешиваются, чтобы популярные id были разбросаны
+    rank = int(n * rng.random() ** exponent)
+    return rank * SCATTER % n + 1
+
+
+def _versions(rng: random.Random, scale: Scale) -> int:
+    return min(scale.max_versions, int(rng.paretovariate(scale.version_alpha)))
+
+
+def _moment(rng: random.Random, scale: Scale) -> datetime.datetime:
+    return scale.start + datetime.timedelta(seconds=rng.randrange(scale.days * 86400))
+
+
+def _username(employee_id: int) -> str:
+    return f"user{employee_id}"
+
+
+def _responsible(rng: random.Random, scale: Scale, organization_id: int) -> int:
+    # Сотрудник employee_id отвечает за организацию (employee_id - 1) % organizations + 1
+    members = (scale.employees - organization_id) // scale.organizations + 1
+    return organization_id + rng.randrange(members) * scale.organizations
+
+
+def _text(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choices(WORDS, k=words))
+
+
+def _copy_value(value) -> str:
+    if value is None:
+        return "\\N"
+    if isinstance(value, bytes):
+        return "\\\\x" + value.hex()
+    if isinstance(value, (TenderStatus, BidStatus, OrganizationType)):
+        return value.value
+    if isinstance(value, datetime.datetime):
+        return value.isoformat(sep=" ")
+    if isinstance(value, list):
+        return "{" + ",".join(value) + "}"
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n")
+
+
+class CopyBuffer:
+    # Строки для COPY ... FROM STDIN в текстовом формате
+
+    def __init__(self, table: str, columns: Tuple[str, ...]):
+        self.table = table
+        self.columns = columns
+        self.buffer = io.StringIO()
+
+    def add(self, *values):
+        self.buffer.write("\t".join(_copy_value(value) for value in values))
+        self.buffer.write("\n")
+
+    def copy(self, cursor):
+        self.buffer.seek(0)
+        cursor.copy_expert(f"COPY {self.table} ({', '.join(self.columns)}) FROM STDIN", self.buffer)
+
+
+def _history_rows(codec: HistoryCodec, spec, states: List[Tuple[datetime.datetime, dict]]) -> Iterator[Tuple]:
+    previous = None
+    for version, (moment, state) in enumerate(states, start=1):
+        payload = codec.payload(spec, version, state, previous)
+        yield version, moment, payload
+        previous = (version, state)
+
+
+def generate_organizations(scale: Scale, chunk: Chunk, codec: HistoryCodec) -> List[CopyBuffer]:
+    rng = _rng(scale, chunk)
+    organizations = CopyBuffer("organization", ("id", "name", "description", "type", "created_at", "updated_at"))
+    for organization_id in range(chunk.first_id, chunk.last_id + 1):
+        created_at = _moment(rng, scale)
+        organizations.add(
+            organization_id,
+            f"Организация {organization_id}",
+            _text(rng, 5),
+            rng.choice(list(OrganizationType)),
+            created_at,
+            created_at,
+        )
+    return [organizations]
+
+
+def generate_employees(scale: Scale, chunk: Chunk, codec: HistoryCodec) -> List[CopyBuffer]:
+    rng = _rng(scale, chunk)
+    employees = CopyBuffer("employee", ("id", "username", "first_name", "last_name", "created_at", "updated_at"))
+    responsibles = CopyBuffer("organization_responsible", ("id", "organization_id", "user_id"))
+    for employee_id in range(chunk.first_id, chunk.last_id + 1):
+        created_at = _moment(rng, scale)
+        employees.add(
+            employee_id,
+            _username(employee_id),
+            rng.choice(FIRST_NAMES),
+            rng.choice(LAST_NAMES),
+            created_at,
+            created_at,
+        )
+        responsibles.add(employee_id, (employee_id - 1) % scale.organizations + 1, employee_id)
+    return [employees, responsibles]
+
+
+def generate_tenders(scale: Scale, chunk: Chunk, codec: HistoryCodec) -> List[CopyBuffer]:
+    rng = _rng(scale, chunk)
+    tenders = CopyBuffer("tenders", (
+        "id", "name", "description", "service_type", "status", "organization_id",
+        "created_at", "updated_at", "version",
+    ))
+    history = CopyBuffer("tender_history", (
+        "tender_id", "name", "description", "status", "version", "timestamp", "service_type", "delta",
+    ))
+    for tender_id in range(chunk.first_id, chunk.last_id + 1):
+        organization_id = _skewed(rng, scale.organizations, 3)
+        final_status = rng.choices(TENDER_STATUSES, TENDER_STATUS_WEIGHTS)[0]
+        moment = created_at = _moment(rng, scale)
+        state = {
+            "name": f"Тендер {tender_id}: {_text(rng, 3)}",
+            "description": _text(rng, rng.randint(10, 40)),
+            "status": TenderStatus.CREATED,
+            "service_type": rng.choices(SERVICE_TYPES, SERVICE_TYPE_WEIGHTS)[0],
+        }
+        states = [(moment, state)]
+        versions = _versions(rng, scale)
+        for version in range(2, versions + 1):
+            moment += datetime.timedelta(minutes=rng.randint(1, 60 * 24))
+            state = dict(state)
+            if version == versions:
+                state["status"] = final_status
+            elif rng.random() < 0.5:
+                state["description"] = _text(rng, rng.randint(10, 40))
+            else:
+                state["name"] = f"Тендер {tender_id}: {_text(rng, 3)}"
+            states.append((moment, state))
+        if versions == 1:
+            state["status"] = final_status
+        tenders.add(
+            tender_id, state["name"], state["description"], state["service_type"], state["status"],
+            organization_id, created_at, moment, versions,
+        )
+        for version, timestamp, payload in _history_rows(codec, TENDER_HISTORY, states):
+            history.add(
+                tender_id, payload["name"], payload["description"], payload["status"], version,
+                timestamp, payload["service_type"], payload["delta"],
+            )
+    return [tenders, history]
+
+
+def generate_bids(scale: Scale, chunk: Chunk, codec: HistoryCodec) -> List[CopyBuffer]:
+    rng = _rng(scale, chunk)
+    bids = CopyBuffer("bids", (
+        "id", "name", "description", "status", "tender_id", "organization_id", "created_at",
+        "updated_at", "version", "creator_id", "approve_decision_count", "approved_by",
+    ))
+    history = CopyBuffer("bid_history", (
+        "bid_id", "name", "description", "status", "version", "timestamp", "delta",
+    ))
+    for bid_id in range(chunk.first_id, chunk.last_id + 1):
+        # Большая часть предложений приходится на немногие горячие тендеры
+        tender_id = _skewed(rng, scale.tenders, 4)
+        organization_id = _skewed(rng, scale.organizations, 2)
+        status = rng.choices(BID_STATUSES, BID_STATUS_WEIGHTS)[0]
+        if status == BidStatus.PUBLISHED:
+            approvals = BID_APPROVAL_QUORUM
+        elif status == BidStatus.CREATED:
+            approvals = rng.randrange(BID_APPROVAL_QUORUM)
+        else:
+            approvals = 0
+        approved_by = sorted({
+            _username(_responsible(rng, scale, organization_id))
+            for _ in range(approvals)
+        })
+        moment = created_at = _moment(rng, scale)
+        # История хранит состояние на момент правки; решения по
+        # предложению меняют статус без новой версии
+        state = {
+            "name": f"Предложение {bid_id}: {_text(rng, 3)}",
+            "description": _text(rng, rng.randint(10, 40)),
+            "status": BidStatus.CREATED,
+        }
+        states = [(moment, state)]
+        versions = max(1, _versions(rng, scale) // 2)
+        for _ in range(2, versions + 1):
+            moment += datetime.timedelta(minutes=rng.randint(1, 60 * 24))
+            state = dict(state, description=_text(rng, rng.randint(10, 40)))
+            states.append((moment, state))
+        bids.add(
+            bid_id, state["name"], state["description"], status, tender_id, organization_id,
+            created_at, moment, versions, _responsible(rng, scale, organization_id),
+            len(approved_by), approved_by,
+        )
+        for version, timestamp, payload in _history_rows(codec, BID_HISTORY, states):
+            history.add(
+                bid_id, payload["name"], payload["description"], payload["status"], version,
+                timestamp, payload["delta"],
+            )
+    return [bids, history]
+
+
+GENERATORS = {
+    "organization": generate_organizations,
+    "employee": generate_employees,
+    "tenders": generate_tenders,
+    "bids": generate_bids,
+}
+
+
+def _init_worker():
+    # Соединения пула родительского процесса не должны использоваться после fork
+    engine.dispose(close=False)
+
+
+def load_chunk(task) -> int:
+    scale, chunk, codec = task
+    buffers = GENERATORS[chunk.table](scale, chunk, codec)
+    connection = engine.raw_connection()
+    try:
+        with connection.cursor() as cursor:
+            for buffer in buffers:
+                buffer.copy(cursor)
+        connection.commit()
+    finally:
+        connection.close()
+    return chunk.last_id - chunk.first_id + 1
+
+
+def execute(statement: str):
+    with engine.begin() as conn:
+        conn.execute(text(statement))
+
+
+def chunks(table: str, total: int, chunk_size: int) -> List[Chunk]:
+    return [
+        Chunk(table, index, first_id, min(total, first_id + chunk_size - 1))
+        for index, first_id in enumerate(range(1, total + 1, chunk_size))
+    ]
+
+
+def secondary_indexes() -> List[Tuple[str, str]]:
+    # Индексы, не обеспечивающие первичный ключ или ограничение уникальности
+    with engine.connect() as conn:
+        return conn.execute(text(
+            "SELECT indexname, indexdef FROM pg_indexes i "
+            "WHERE schemaname = current_schema() AND tablename = ANY(:tables) "
+            "AND NOT EXISTS (SELECT 1 FROM pg_constraint c WHERE c.conname = i.indexname)"
+        ), {"tables": list(TABLES)}).all()
+
+
+def prepare(args):
+    with engine.connect() as conn:
+        count = conn.execute(text("SELECT count(*) FROM tenders")).scalar()
+        employees = conn.execute(text("SELECT count(*) FROM employee")).scalar()
+    if count or employees:
+        if not args.truncate:
+            sys.exit("База уже содержит данные: нужна пустая база или --truncate")
+        execute(f"TRUNCATE {', '.join(TABLES)} RESTART IDENTITY CASCADE")
+
+
+def main(args):
+    if args.employees < args.organizations:
+        sys.exit("Сотрудников должно быть не меньше, чем организаций")
+    scale = Scale(
+        employees=args.employees,
+        organizations=args.organizations,
+        tenders=args.tenders,
+        bids=args.bids,
+        max_versions=args.max_versions,
+        version_alpha=args.version_alpha,
+        seed=args.seed,
+        start=datetime.datetime.fromisoformat(args.start),
+        days=args.days,
+    )
+    codec = HistoryCodec(
+        storage=args.history_storage,
+        snapshot_interval=HISTORY_SNAPSHOT_INTERVAL,
+        compression=HISTORY_COMPRESSION,
+        )
+    prepare(args)
+    indexes = secondary_indexes()
+    for name, _ in indexes:
+        execute(f'DROP INDEX IF EXISTS "{name}"')
+
+    started = time.perf_counter()
+    with multiprocessing.Pool(args.workers, initializer=_init_worker) as pool:
+        for table, total in (
+            ("organization", scale.organizations),
+            ("employee", scale.employees),
+            ("tenders", scale.tenders),
+            ("bids", scale.bids),
+        ):
+            stage_started = time.perf_counter()
+            tasks = [(scale, chunk, codec) for chunk in chunks(table, total, args.chunk_size)]
+            loaded = sum(pool.imap_unordered(load_chunk, tasks))
+            print(f"{table}: {loaded} rows in {time.perf_counter() - stage_started:.1f}s")
+
+        stage_started = time.perf_counter()
+        list(pool.imap_unordered(execute, [definition for _, definition in indexes]))
+        print(f"{len(indexes)} indexes rebuilt in {time.perf_counter() - stage_started:.1f}s")
+
+    for table in TABLES:
+        execute(f"SELECT setval(pg_get_serial_sequence('{table}', 'id'), "
+                f"(SELECT coalesce(max(id), 0) + 1 FROM {table}), false)")
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        conn.execute(text("ANALYZE"))
+    print(f"done in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--employees", type=int, default=100000)
+    parser.add_argument("--organizations", type=int, default=10000)
+    parser.add_argument("--tenders", type=int, default=5000000)
+    parser.add_argument("--bids", type=int, default=20000000)
+    parser.add_argument("--max-versions", type=int, default=100)
+    # Меньше alpha - длиннее хвост цепочек версий
+    parser.add_argument("--version-alpha", type=float, default=1.3)
+    parser.add_argument("--history-storage", choices=["full", "delta"], default=HISTORY_STORAGE)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--start", default="2024-01-01")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--chunk-size", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=multiprocessing.cpu_count())
+    parser.add_argument("--truncate", action="store_true")
+    main(parser.parse_args())
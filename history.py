@@ -0,0 +1,133 @@
+import enum
+import json
+import zlib
+from typing import Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from config import HISTORY_COMPRESSION, HISTORY_SNAPSHOT_INTERVAL, HISTORY_STORAGE
+from enums import BidStatus, TenderStatus
+
+# Первый байт delta - формат полезной нагрузки
+RAW_DELTA = b"j"
+ZLIB_DELTA = b"z"
+
+
+class HistorySpec(NamedTuple):
+    # Поля, которые хранит история сущности
+    fields: Tuple[str, ...]
+    # Перечисления, которые нужно восстановить из JSON
+    enums: Dict[str, type]
+    # Поля, которые меняются без увеличения версии (например, статус
+    # предложения при согласовании) и поэтому всегда пишутся в delta
+    always: Tuple[str, ...] = ()
+
+
+TENDER_HISTORY = HistorySpec(
+    fields=("name", "description", "status", "service_type"),
+    enums={"status": TenderStatus},
+    )
+BID_HISTORY = HistorySpec(
+    fields=("name", "description", "status"),
+    enums={"status": BidStatus},
+    always=("status",),
+    )
+
+
+def history_state(spec: HistorySpec, obj) -> dict:
+    return {field: getattr(obj, field) for field in spec.fields}
+
+
+def diff_states(spec: HistorySpec, old: dict, new: dict) -> dict:
+    return {
+        field: {"old": old[field], "new": new[field]}
+        for field in spec.fields
+        if old[field] != new[field]
+    }
+
+
+class HistoryCodec:
+    # Хранение истории версий: "full" - каждая версия полной строкой,
+    # "delta" - полный снимок раз в snapshot_interval версий, между ними
+    # только изменённые поля (по возможности сжатые zlib)
+
+    def __init__(self, storage: str, snapshot_interval: int, compression: str):
+        self.storage = storage
+        self.snapshot_interval = snapshot_interval
+        self.compression = compression
+
+    def is_snapshot_version(self, version: int) -> bool:
+        return self.storage != "delta" or (version - 1) % self.snapshot_interval == 0
+
+    def encode_delta(self, changes: dict) -> bytes:
+        raw = json.dumps(
+            {field: value.value if isinstance(value, enum.Enum) else value
+             for field, value in changes.items()},
+            ensure_ascii=False,
+            separators=(",", ":"),
+            ).encode()
+        if self.compression == "zlib":
+            packed = zlib.compress(raw)
+            # Короткие delta от сжатия только растут
+            if len(packed) < len(raw):
+                return ZLIB_DELTA + packed
+        return RAW_DELTA + raw
+
+    @staticmethod
+    def decode_delta(data: bytes) -> dict:
+        data = bytes(data)
+        header, payload = data[:1], data[1:]
+        if header == ZLIB_DELTA:
+            payload = zlib.decompress(payload)
+        elif header != RAW_DELTA:
+            raise ValueError("Unknown history delta format")
+        return json.loads(payload)
+
+    def payload(
+        self,
+        spec: HistorySpec,
+        version: int,
+        state: dict,
+        previous: Optional[Tuple[int, dict]] = None,
+        ) -> dict:
+        # Значения полей строки истории: полный снимок или delta к previous,
+        # (версия, состояние) предыдущей версии. Если предыдущая версия
+        # неизвестна или не соседняя, пишется снимок
+        if (previous is None
+                or previous[0] != version - 1
+                or self.is_snapshot_version(version)):
+            return dict(state, delta=None)
+        previous_state = previous[1]
+        changes = {
+            field: state[field]
+            for field in spec.fields
+            if field in spec.always or state[field] != previous_state[field]
+        }
+        return dict(dict.fromkeys(spec.fields), delta=self.encode_delta(changes))
+
+    def replay_versions(self, spec: HistorySpec, rows: Iterable) -> Iterator[Tuple[object, dict]]:
+        # rows - строки истории по возрастанию версии, начиная со снимка
+        state = None
+        for row in rows:
+            if row.delta is None:
+                state = history_state(spec, row)
+            elif state is None:
+                raise ValueError("History chain does not start with a snapshot")
+            else:
+                state = dict(state)
+                for field, value in self.decode_delta(row.delta).items():
+                    if field in spec.enums and value is not None:
+                        value = spec.enums[field](value)
+                    state[field] = value
+            yield row, state
+
+    def replay(self, spec: HistorySpec, rows: Iterable) -> Optional[dict]:
+        state = None
+        for _, state in self.replay_versions(spec, rows):
+            pass
+        return state
+
+
+history_codec = HistoryCodec(
+    storage=HISTORY_STORAGE,
+    snapshot_interval=HISTORY_SNAPSHOT_INTERVAL,
+    compression=HISTORY_COMPRESSION,
+    )
@@ -0,0 +1,189 @@
+# Асинхронная запись истории версий (HISTORY_WRITER=outbox): изменение
+# сущности пишет в своей транзакции узкую строку history_outbox с состоянием
+# до и после изменения, а фоновая задача пачками кодирует версии (снимок или
+# delta, см. HistoryCodec) и переносит их в tender_history/bid_history.
+# Версии в истории появляются с задержкой до HISTORY_OUTBOX_INTERVAL;
+# откат сначала переносит версии своей сущности сам.
+#
+# Перенести всю очередь вручную (например, перед переключением на inline):
+#     python manage.py drain-history
+import asyncio
+import datetime
+import logging
+from collections import defaultdict
+from typing import Optional, Tuple
+
+from sqlalchemy import DateTime, Integer, bindparam, delete, func, insert, literal, select, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import aliased
+
+from config import HISTORY_OUTBOX_BATCH_SIZE, HISTORY_OUTBOX_INTERVAL
+from database import AsyncSessionLocal
+from history import BID_HISTORY, TENDER_HISTORY, HistorySpec, history_codec, history_state
+from models import BidHistory, HistoryOutbox, TenderHistory
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: очередь переносит один процесс за раз. Изменения
+# одной сущности сериализованы блокировкой её строки, поэтому в порядке id
+# очереди версия v всегда раньше v + 1
+OUTBOX_LOCK_KEY = 0x6f757462
+
+# сущность -> (модель истории, ключевое поле, спецификация истории)
+ENTITIES = {
+    "tender": (TenderHistory, "tender_id", TENDER_HISTORY),
+    "bid": (BidHistory, "bid_id", BID_HISTORY),
+}
+
+# (сущность, изменяемые поля) -> запрос update_with_outbox
+_statements = {}
+
+
+def _json_state(state: dict) -> dict:
+    # Перечисления - строкой, как их хранит JSONB
+    return {field: getattr(value, "value", value) for field, value in state.items()}
+
+
+def _restore_state(spec: HistorySpec, state: dict) -> dict:
+    return {
+        field: spec.enums[field](state[field]) if field in spec.enums and state[field] is not None else state[field]
+        for field in spec.fields
+    }
+
+
+def outbox_values(entity: str, obj, previous: Tuple[int, dict] = None) -> dict:
+    # Строка очереди для версии obj; previous - (версия, состояние) до изменения
+    _, _, spec = ENTITIES[entity]
+    return dict(
+        entity=entity,
+        entity_id=obj.id,
+        version=obj.version,
+        timestamp=datetime.datetime.utcnow(),
+        state=_json_state(history_state(spec, obj)),
+        previous_version=previous[0] if previous else None,
+        previous=_json_state(previous[1]) if previous else None,
+    )
+
+
+def _update_with_outbox(entity: str, model, fields: Tuple[str, ...]):
+    # UPDATE ... RETURNING, из RETURNING которого тем же запросом вставляется
+    # строка очереди; результат - ORM-объекты model. Запрос собирается один
+    # раз на набор изменяемых полей: сборка и ключ кэша такого запроса
+    # дороже самого обращения к базе
+    _, _, spec = ENTITIES[entity]
+    updated = (
+        update(model)
+        .where(model.id == bindparam("entity_id"))
+        .values(**{field: bindparam(f"value_{field}") for field in fields}, version=model.version + 1)
+        .returning(*model.__table__.c)
+        .cte("updated")
+    )
+    outbox = insert(HistoryOutbox).from_select(
+        ["entity", "entity_id", "version", "timestamp", "state", "previous_version", "previous"],
+        select(
+            literal(entity),
+            updated.c.id,
+            updated.c.version,
+            bindparam("timestamp", type_=DateTime),
+            func.jsonb_build_object(*(
+                argument for field in spec.fields for argument in (literal(field), updated.c[field])
+            )),
+            bindparam("previous_version", type_=Integer),
+            bindparam("previous", type_=JSONB),
+        ),
+    ).cte("outbox")
+    return select(aliased(model, updated)).add_cte(outbox)
+
+
+async def update_with_outbox(db, entity: str, model, entity_id: int, values: dict,
+                             previous: Optional[Tuple[int, dict]]):
+    # UPDATE сущности с увеличением версии и запись версии в очередь одним
+    # запросом, без отдельного обращения к базе
+    fields = tuple(sorted(values))
+    statement = _statements.get((entity, fields))
+    if statement is None:
+        statement = _statements[(entity, fields)] = _update_with_outbox(entity, model, fields)
+    params = {f"value_{field}": value for field, value in values.items()}
+    result = await db.execute(statement, dict(
+        params,
+        entity_id=entity_id,
+        timestamp=datetime.datetime.utcnow(),
+        previous_version=previous[0] if previous else None,
+        previous=_json_state(previous[1]) if previous else None,
+    ))
+    return result.scalar_one()
+
+
+def history_values(row) -> dict:
+    # Значения строки истории из строки очереди: кодирование то же, что
+    # при записи inline
+    _, key, spec = ENTITIES[row.entity]
+    previous = None
+    if row.previous_version is not None:
+        previous = (row.previous_version, _restore_state(spec, row.previous))
+    values = history_codec.payload(spec, row.version, _restore_state(spec, row.state), previous)
+    values[key] = row.entity_id
+    values["version"] = row.version
+    values["timestamp"] = row.timestamp
+    return values
+
+
+async def drain(db, batch_size: int = None, entity: str = None, entity_id: int = None) -> int:
+    # Забирает из очереди строки по порядку id и вставляет их в историю в
+    # транзакции db; коммит делает вызывающая функция. Строки блокируются
+    # в порядке id и без SKIP LOCKED: параллельный перенос той же сущности
+    # дождётся этого, а не перескочит через версию
+    claimed = select(HistoryOutbox.id).order_by(HistoryOutbox.id).limit(batch_size).with_for_update()
+    if entity is not None:
+        claimed = claimed.filter(HistoryOutbox.entity == entity, HistoryOutbox.entity_id == entity_id)
+    result = await db.execute(
+        delete(HistoryOutbox)
+        .where(HistoryOutbox.id.in_(claimed.scalar_subquery()))
+        .returning(
+            HistoryOutbox.entity,
+            HistoryOutbox.entity_id,
+            HistoryOutbox.version,
+            HistoryOutbox.timestamp,
+            HistoryOutbox.state,
+            HistoryOutbox.previous_version,
+            HistoryOutbox.previous,
+            )
+        .execution_options(synchronize_session=False)
+    )
+    rows = result.all()
+    by_entity = defaultdict(list)
+    for row in rows:
+        by_entity[row.entity].append(history_values(row))
+    for name, values in by_entity.items():
+        await db.execute(insert(ENTITIES[name][0]), values)
+    return len(rows)
+
+
+async def drain_history_outbox(batch_size: int = HISTORY_OUTBOX_BATCH_SIZE, wait: bool = False) -> int:
+    # Каждая пачка - отдельная короткая транзакция. wait - дождаться
+    # блокировки, а не уступить очередь другому процессу
+    moved = 0
+    while True:
+        async with AsyncSessionLocal() as db:
+            if wait:
+                await db.execute(select(func.pg_advisory_xact_lock(OUTBOX_LOCK_KEY)))
+                locked = True
+            else:
+                locked = await db.scalar(select(func.pg_try_advisory_xact_lock(OUTBOX_LOCK_KEY)))
+            if not locked:
+                # Очередь уже переносит другой процесс
+                return moved
+            count = await drain(db, batch_size)
+            await db.commit()
+        moved += count
+        if count < batch_size:
+            return moved
+
+
+async def run_history_writer(interval: float = HISTORY_OUTBOX_INTERVAL):
+    while True:
+        try:
+            await drain_history_outbox()
+        except Exception:
+            logger.exception("History outbox drain failed")
+        await asyncio.sleep(interval)
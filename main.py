@@ -1,51 +1,150 @@
+import asyncio
+import logging
 from typing import List
-from fastapi import FastAPI, Query, Depends
-from sqlalchemy.orm import Session
-from routers import tender, bid 
-from database import engine, SessionLocal, get_db
-from models import Base
-from crud import get_organizations,  get_employees
+from fastapi import FastAPI, Depends, Request, Response
+from fastapi.responses import PlainTextResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from routers import tender, bid, export, events
+from database import async_engine, AsyncSessionLocal, get_async_db, replicas, warm_pool
+from crud import get_organizations,  get_employees, warm_identity_cache
 from schemas import EmployeeBase, OrganizationBase
-from demo import create_initial_data
+from pagination import PageParams, get_page_params, set_next_cursor
+from cache import identity_cache
+from conditional import conditional_stats, get_validator, not_modified_response, set_validator_headers
+from models import Employee, Organization
+from retention import retention_policy, run_compaction
+from history_outbox import run_history_writer
+from config import DB_POOL_WARM_CONNECTIONS, HISTORY_WRITER, IDENTITY_CACHE_WARM
+from metrics import MetricsMiddleware, http_metrics, render_histogram
+from query_stats import QueryStatsMiddleware, query_budget, query_metrics
+from serialization import EMPLOYEE_ROWS, ORGANIZATION_ROWS, RowSerializer
+from events import event_broker
 
 
+logger = logging.getLogger(__name__)
 
 app = FastAPI()
-
+app.add_middleware(QueryStatsMiddleware)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(tender.router)
 app.include_router(bid.router)
+app.include_router(export.router)
+app.include_router(events.router)
+
+async def warm_up():
+    try:
+        await warm_pool(async_engine, DB_POOL_WARM_CONNECTIONS)
+        async with AsyncSessionLocal() as db:
+            await warm_identity_cache(db, IDENTITY_CACHE_WARM)
+    except Exception:
+        logger.exception("Warm-up failed")
 
 @app.on_event("startup")
 async def on_startup():
+    # Миграции и начальные данные - отдельной командой (manage.py) до
+    # запуска воркеров. Прогрев идёт в фоне и не задерживает готовность:
+    # запросы, пришедшие раньше, просто откроют соединения сами
+    app.state.warm_up_task = asyncio.create_task(warm_up())
+    # LISTEN ленты изменений и сброса кэша личностей
+    event_broker.start()
+    if retention_policy.enabled:
+        app.state.compaction_task = asyncio.create_task(run_compaction())
+    if HISTORY_WRITER == "outbox":
+        app.state.history_writer_task = asyncio.create_task(run_history_writer())
+    if replicas.engines:
+        await replicas.check()
+        app.state.replica_health_task = asyncio.create_task(replicas.run_health_checks())
 
-    Base.metadata.create_all(bind=engine)
-    
-
-    db = SessionLocal()
-    try:
-        create_initial_data(db)
-    finally:
-        db.close()
+@app.on_event("shutdown")
+async def on_shutdown():
+    for name in ("warm_up_task", "compaction_task", "history_writer_task", "replica_health_task"):
+        task = getattr(app.state, name, None)
+        if task:
+            task.cancel()
+    await event_broker.stop()
 
 @app.get("/api/ping", response_model=str)
 async def ping():
     return "ok"
 
+def _render_pool_metrics(lines: list):
+    pools = {"primary": async_engine.pool}
+    pools.update({
+        f"replica{index}": engine.pool
+        for index, engine in enumerate(replicas.engines)
+    })
+    stats = {name: pool.stats() for name, pool in pools.items()}
+    lines.append("# HELP db_pool_connections Pool connections by state.")
+    lines.append("# TYPE db_pool_connections gauge")
+    for name, pool_stats in stats.items():
+        for state in ("checked_out", "idle", "overflow"):
+            lines.append(f'db_pool_connections{{pool="{name}",state="{state}"}} {pool_stats[state]}')
+    lines.append("# HELP db_pool_checkout_wait_milliseconds Time to get a connection from the pool.")
+    lines.append("# TYPE db_pool_checkout_wait_milliseconds histogram")
+    for name, pool_stats in stats.items():
+        render_histogram(lines, "db_pool_checkout_wait_milliseconds", f'pool="{name}"', pool_stats["checkout_wait_ms"])
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    # Prometheus text exposition format
+    lines = []
+    http_metrics.render(lines)
+    query_metrics.render(lines)
+    conditional_stats.render(lines)
+    event_broker.render(lines)
+    _render_pool_metrics(lines)
+    return PlainTextResponse(
+        "\n".join(lines) + "\n",
+        media_type="text/plain; version=0.0.4",
+        )
+
+@app.get("/api/db/stats")
+async def db_stats():
+    return {
+        "pool": async_engine.pool.stats(),
+        "replicas": replicas.stats(),
+    }
+
+@app.get("/api/cache/stats")
+async def cache_stats():
+    return {
+        "identity": identity_cache.stats(),
+        "conditional_get": conditional_stats.stats(),
+        }
+
 @app.get("/employees", response_model=List[EmployeeBase])
+@query_budget(3)
 async def list_employees(
-    skip: int = Query(0, alias="page", ge=0), 
-    limit: int = Query(10, le=100), 
-    db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(get_page_params),
+    serializer: RowSerializer = Depends(EMPLOYEE_ROWS.select_fields),
+    db: AsyncSession = Depends(get_async_db),
     ):
-    employees = get_employees(db, skip=skip, limit=limit)
-    return employees
+    validator = await get_validator(db, Employee, request)
+    not_modified = not_modified_response(request, validator)
+    if not_modified:
+        return not_modified
+    set_validator_headers(response, validator)
+    employees, next_cursor = await get_employees(db, page=page, serializer=serializer)
+    set_next_cursor(response, next_cursor)
+    return serializer.response(employees, response)
 
 @app.get("/organizations", response_model=List[OrganizationBase])
+@query_budget(3)
 async def list_organizations(
-    skip: int = Query(0, alias="page", ge=0),
-      limit: int = Query(10, le=100), 
-      db: Session = Depends(get_db),
+    request: Request,
+    response: Response,
+    page: PageParams = Depends(get_page_params),
+    serializer: RowSerializer = Depends(ORGANIZATION_ROWS.select_fields),
+      db: AsyncSession = Depends(get_async_db),
       ):
-    organizations = get_organizations(db, skip=skip, limit=limit)
-    return organizations
+    validator = await get_validator(db, Organization, request)
+    not_modified = not_modified_response(request, validator)
+    if not_modified:
+        return not_modified
+    set_validator_headers(response, validator)
+    organizations, next_cursor = await get_organizations(db, page=page, serializer=serializer)
+    set_next_cursor(response, next_cursor)
+    return serializer.response(organizations, response)
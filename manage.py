@@ -0,0 +1,75 @@
+# Команды подготовки базы. Выполняются один раз перед запуском воркеров,
+# а не при старте каждого из них.
+#
+# Запуск (из каталога проекта, с настройками БД из .env):
+#     python manage.py migrate   - применить миграции Alembic
+#     python manage.py seed      - создать демо-данные, если база пуста
+#     python manage.py init      - migrate и seed
+#     python manage.py drain-history - перенести очередь history_outbox в историю
+import argparse
+import asyncio
+import os
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import func, select
+
+from database import SessionLocal, async_engine, engine
+from demo import create_initial_data
+from history_outbox import drain_history_outbox
+
+# Ключ advisory-блокировки: если команду одновременно запустят несколько
+# контейнеров, миграции и заполнение выполнит только один, остальные дождутся
+INIT_LOCK_KEY = 0x696e6974
+
+
+def run_migrations(connection):
+    alembic_cfg = Config(os.path.join(os.path.dirname(__file__), "alembic.ini"))
+    alembic_cfg.attributes["connection"] = connection
+    alembic_cfg.attributes["configure_logger"] = False
+    command.upgrade(alembic_cfg, "head")
+
+
+def migrate():
+    with engine.begin() as conn:
+        conn.execute(select(func.pg_advisory_xact_lock(INIT_LOCK_KEY)))
+        run_migrations(conn)
+    print("migrations applied")
+
+
+def seed():
+    with SessionLocal() as db:
+        # Проверка "база пуста" в create_initial_data выполняется под
+        # блокировкой, до первого коммита
+        db.execute(select(func.pg_advisory_xact_lock(INIT_LOCK_KEY)))
+        create_initial_data(db)
+        db.commit()
+    print("initial data created")
+
+
+def drain_history():
+    # Нужна перед переключением HISTORY_WRITER на inline и перед откатом
+    # миграции 0007: версии из очереди иначе не попадут в историю
+    async def drain():
+        try:
+            return await drain_history_outbox(wait=True)
+        finally:
+            await async_engine.dispose()
+
+    print(f"history versions moved from outbox: {asyncio.run(drain())}")
+
+
+COMMANDS = {
+    "migrate": (migrate,),
+    "seed": (seed,),
+    "init": (migrate, seed),
+    "drain-history": (drain_history,),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=sorted(COMMANDS))
+    args = parser.parse_args()
+    for step in COMMANDS[args.command]:
+        step()
@@ -0,0 +1,151 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from typing import Iterable
+
+
+class Histogram:
+    # Кумулятивная гистограмма в духе Prometheus: bucket "le" считает
+    # наблюдения, не превышающие границу
+
+    def __init__(self, buckets: Iterable[float], threadsafe: bool = True):
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._sum = 0.0
+        self._lock = threading.Lock()
+        if not threadsafe:
+            # Только для вызовов из одного потока (цикла событий)
+            self.observe = self._observe
+
+    def _observe(self, value: float):
+        self._counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sum += value
+
+    def observe(self, value: float):
+        with self._lock:
+            self._observe(value)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total_sum = self._sum
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            buckets["+Inf" if bound == float("inf") else str(bound)] = cumulative
+        return {
+            "buckets": buckets,
+            "count": cumulative,
+            "sum": round(total_sum, 6),
+        }
+
+
+# Границы гистограммы задержки запросов, секунды
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Метка для запросов, не попавших ни в один маршрут: сырые пути 404 не
+# должны порождать новые временные ряды
+UNMATCHED_ROUTE = "unmatched"
+
+
+def route_label(scope) -> str:
+    route = scope.get("route")
+    return route.path if route is not None else UNMATCHED_ROUTE
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(**labels) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+
+
+def render_histogram(lines: list, name: str, labels: str, snapshot: dict):
+    separator = "," if labels else ""
+    for bound, count in snapshot["buckets"].items():
+        lines.append(f'{name}_bucket{{{labels}{separator}le="{bound}"}} {count}')
+    lines.append(f"{name}_sum{{{labels}}} {snapshot['sum']}")
+    lines.append(f"{name}_count{{{labels}}} {snapshot['count']}")
+
+
+class HTTPMetrics:
+    # Задержка, коды ответов и запросы в работе по шаблону маршрута.
+    # Обновляется только из цикла событий, поэтому без блокировок
+
+    def __init__(self):
+        # (метод, маршрут) -> (гистограмма задержки, {код ответа: число})
+        self._routes = {}
+        # Запросы в работе: маршрут становится известен только после
+        # диспетчеризации, поэтому он читается из scope при сборе метрик
+        self._active = {}
+
+    def start(self, scope):
+        self._active[id(scope)] = scope
+
+    def finish(self, scope, status: int, elapsed: float):
+        del self._active[id(scope)]
+        key = (scope["method"], route_label(scope))
+        stats = self._routes.get(key)
+        if stats is None:
+            stats = self._routes[key] = (Histogram(LATENCY_BUCKETS, threadsafe=False), {})
+        histogram, statuses = stats
+        histogram.observe(elapsed)
+        statuses[status] = statuses.get(status, 0) + 1
+
+    def render(self, lines: list):
+        routes = sorted(self._routes.items())
+        lines.append("# HELP http_request_duration_seconds Request latency by route.")
+        lines.append("# TYPE http_request_duration_seconds histogram")
+        for (method, route), (histogram, _) in routes:
+            render_histogram(lines, "http_request_duration_seconds",
+                             format_labels(method=method, route=route), histogram.snapshot())
+
+        lines.append("# HELP http_responses_total Responses by route and status code.")
+        lines.append("# TYPE http_responses_total counter")
+        for (method, route), (_, statuses) in routes:
+            for status, count in sorted(statuses.items()):
+                lines.append(f"http_responses_total{{{format_labels(method=method, route=route, status=status)}}} {count}")
+
+        in_flight = defaultdict(int)
+        for scope in list(self._active.values()):
+            in_flight[(scope["method"], route_label(scope))] += 1
+        lines.append("# HELP http_requests_in_flight Requests being processed by route.")
+        lines.append("# TYPE http_requests_in_flight gauge")
+        for (method, route), count in sorted(in_flight.items()):
+            lines.append(f"http_requests_in_flight{{{format_labels(method=method, route=route)}}} {count}")
+
+
+http_metrics = HTTPMetrics()
+
+
+class MetricsMiddleware:
+    # Чистый ASGI middleware: без BaseHTTPMiddleware и лишних объектов
+    # запроса, чтобы накладные расходы оставались в пределах микросекунд
+
+    def __init__(self, app, metrics: HTTPMetrics = http_metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        metrics = self.metrics
+        metrics.start(scope)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.finish(scope, status, time.perf_counter() - started)
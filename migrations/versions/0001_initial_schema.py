@@ -0,0 +1,135 @@
+"""initial schema
+
+Схема в том виде, в каком её создавал Base.metadata.create_all. Уже
+развёрнутые базы достаточно пометить этой ревизией: alembic stamp 0001
+
+Revision ID: 0001
+Revises: 
+Create Date: 2024-09-14 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('employee',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('username', sa.String(length=50), nullable=False),
+    sa.Column('first_name', sa.String(length=50), nullable=True),
+    sa.Column('last_name', sa.String(length=50), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('username')
+    )
+    op.create_index(op.f('ix_employee_id'), 'employee', ['id'], unique=False)
+    op.create_table('organization',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('type', sa.Enum('IE', 'LLC', 'JSC', name='organizationtype'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_organization_id'), 'organization', ['id'], unique=False)
+    op.create_table('organization_responsible',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('organization_id', sa.Integer(), nullable=True),
+    sa.Column('user_id', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['organization_id'], ['organization.id'], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['user_id'], ['employee.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_organization_responsible_id'), 'organization_responsible', ['id'], unique=False)
+    op.create_table('tenders',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('description', sa.String(length=1000), nullable=True),
+    sa.Column('service_type', sa.String(length=100), nullable=True),
+    sa.Column('status', sa.Enum('CREATED', 'PUBLISHED', 'CLOSED', name='tenderstatus'), nullable=True),
+    sa.Column('organization_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['organization_id'], ['organization.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tenders_id'), 'tenders', ['id'], unique=False)
+    op.create_index(op.f('ix_tenders_name'), 'tenders', ['name'], unique=False)
+    op.create_table('bids',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('description', sa.String(length=1000), nullable=True),
+    sa.Column('status', sa.Enum('CREATED', 'PUBLISHED', 'CANCELED', name='bidstatus'), nullable=True),
+    sa.Column('tender_id', sa.Integer(), nullable=True),
+    sa.Column('organization_id', sa.Integer(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=True),
+    sa.Column('creator_id', sa.Integer(), nullable=True),
+    sa.Column('approve_decision_count', sa.Integer(), nullable=True),
+    sa.Column('approved_by', postgresql.ARRAY(sa.String()), nullable=True),
+    sa.ForeignKeyConstraint(['creator_id'], ['employee.id'], ),
+    sa.ForeignKeyConstraint(['organization_id'], ['organization.id'], ),
+    sa.ForeignKeyConstraint(['tender_id'], ['tenders.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_bids_id'), 'bids', ['id'], unique=False)
+    op.create_index(op.f('ix_bids_name'), 'bids', ['name'], unique=False)
+    op.create_table('tender_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('tender_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('description', sa.String(length=1000), nullable=True),
+    sa.Column('status', sa.Enum('CREATED', 'PUBLISHED', 'CLOSED', name='tenderstatus'), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=True),
+    sa.Column('service_type', sa.String(length=100), nullable=True),
+    sa.ForeignKeyConstraint(['tender_id'], ['tenders.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_tender_history_id'), 'tender_history', ['id'], unique=False)
+    op.create_table('bid_history',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('bid_id', sa.Integer(), nullable=True),
+    sa.Column('name', sa.String(length=100), nullable=True),
+    sa.Column('description', sa.String(length=1000), nullable=True),
+    sa.Column('status', sa.Enum('CREATED', 'PUBLISHED', 'CANCELED', name='bidstatus'), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=True),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['bid_id'], ['bids.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_bid_history_id'), 'bid_history', ['id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_bid_history_id'), table_name='bid_history')
+    op.drop_table('bid_history')
+    op.drop_index(op.f('ix_tender_history_id'), table_name='tender_history')
+    op.drop_table('tender_history')
+    op.drop_index(op.f('ix_bids_name'), table_name='bids')
+    op.drop_index(op.f('ix_bids_id'), table_name='bids')
+    op.drop_table('bids')
+    op.drop_index(op.f('ix_tenders_name'), table_name='tenders')
+    op.drop_index(op.f('ix_tenders_id'), table_name='tenders')
+    op.drop_table('tenders')
+    op.drop_index(op.f('ix_organization_responsible_id'), table_name='organization_responsible')
+    op.drop_table('organization_responsible')
+    op.drop_index(op.f('ix_organization_id'), table_name='organization')
+    op.drop_table('organization')
+    op.drop_index(op.f('ix_employee_id'), table_name='employee')
+    op.drop_table('employee')
+    sa.Enum(name='bidstatus').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='tenderstatus').drop(op.get_bind(), checkfirst=True)
+    sa.Enum(name='organizationtype').drop(op.get_bind(), checkfirst=True)
@@ -0,0 +1,51 @@
+"""query indexes
+
+Индексы под реальные запросы crud.py: фильтры + ключ keyset-пагинации
+(created_at, id), уникальность версий истории и ответственных.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2024-09-14 12:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_unique_constraint('uq_bid_history_bid_version', 'bid_history', ['bid_id', 'version'])
+    op.create_index('ix_bids_creator_id', 'bids', ['creator_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_bids_tender_id', 'bids', ['tender_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_employee_created_at', 'employee', ['created_at', 'id'], unique=False)
+    op.create_index('ix_organization_created_at', 'organization', ['created_at', 'id'], unique=False)
+    op.create_index('ix_organization_responsible_organization_id', 'organization_responsible', ['organization_id'], unique=False)
+    op.create_unique_constraint('uq_organization_responsible_user_organization', 'organization_responsible', ['user_id', 'organization_id'])
+    op.create_unique_constraint('uq_tender_history_tender_version', 'tender_history', ['tender_id', 'version'])
+    op.create_index('ix_tenders_organization_id', 'tenders', ['organization_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_tenders_published_created_at', 'tenders', ['created_at', 'id'], unique=False, postgresql_where=sa.text("status = 'PUBLISHED'"))
+    op.create_index('ix_tenders_published_service_type', 'tenders', ['service_type', 'created_at', 'id'], unique=False, postgresql_where=sa.text("status = 'PUBLISHED'"))
+    op.create_index('ix_tenders_status_service_type', 'tenders', ['status', 'service_type'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tenders_status_service_type', table_name='tenders')
+    op.drop_index('ix_tenders_published_service_type', table_name='tenders', postgresql_where=sa.text("status = 'PUBLISHED'"))
+    op.drop_index('ix_tenders_published_created_at', table_name='tenders', postgresql_where=sa.text("status = 'PUBLISHED'"))
+    op.drop_index('ix_tenders_organization_id', table_name='tenders')
+    op.drop_constraint('uq_tender_history_tender_version', 'tender_history', type_='unique')
+    op.drop_constraint('uq_organization_responsible_user_organization', 'organization_responsible', type_='unique')
+    op.drop_index('ix_organization_responsible_organization_id', table_name='organization_responsible')
+    op.drop_index('ix_organization_created_at', table_name='organization')
+    op.drop_index('ix_employee_created_at', table_name='employee')
+    op.drop_index('ix_bids_tender_id', table_name='bids')
+    op.drop_index('ix_bids_creator_id', table_name='bids')
+    op.drop_constraint('uq_bid_history_bid_version', 'bid_history', type_='unique')
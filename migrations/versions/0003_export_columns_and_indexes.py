@@ -0,0 +1,37 @@
+"""export columns and indexes
+
+Колонка tender_history.timestamp (раньше не создавалась из-за опечатки в
+модели) и индексы для инкрементальной выгрузки по updated_at/timestamp.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2024-09-15 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_bid_history_timestamp', 'bid_history', ['timestamp'], unique=False)
+    op.create_index('ix_bids_updated_at', 'bids', ['updated_at'], unique=False)
+    op.add_column('tender_history', sa.Column('timestamp', sa.DateTime(), nullable=True))
+    op.create_index('ix_tender_history_timestamp', 'tender_history', ['timestamp'], unique=False)
+    op.create_index('ix_tenders_updated_at', 'tenders', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tenders_updated_at', table_name='tenders')
+    op.drop_index('ix_tender_history_timestamp', table_name='tender_history')
+    op.drop_column('tender_history', 'timestamp')
+    op.drop_index('ix_bids_updated_at', table_name='bids')
+    op.drop_index('ix_bid_history_timestamp', table_name='bid_history')
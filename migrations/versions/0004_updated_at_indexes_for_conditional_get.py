@@ -0,0 +1,30 @@
+"""updated_at indexes for conditional get
+
+Индексы по updated_at для дешёвого вычисления ETag списков сотрудников
+и организаций.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2024-09-15 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_employee_updated_at', 'employee', ['updated_at'], unique=False)
+    op.create_index('ix_organization_updated_at', 'organization', ['updated_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_organization_updated_at', table_name='organization')
+    op.drop_index('ix_employee_updated_at', table_name='employee')
@@ -0,0 +1,37 @@
+"""search vectors
+
+Вычисляемые столбцы tsvector по названию и описанию тендеров и
+предложений с GIN-индексами для полнотекстового поиска. Добавление
+STORED-столбца переписывает таблицу - на больших базах накатывать
+в окно обслуживания.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2024-09-16 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('bids', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("to_tsvector('russian', coalesce(name, '') || ' ' || coalesce(description, ''))", persisted=True), nullable=True))
+    op.create_index('ix_bids_search_vector', 'bids', ['search_vector'], unique=False, postgresql_using='gin')
+    op.add_column('tenders', sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed("to_tsvector('russian', coalesce(name, '') || ' ' || coalesce(description, ''))", persisted=True), nullable=True))
+    op.create_index('ix_tenders_search_vector', 'tenders', ['search_vector'], unique=False, postgresql_using='gin')
+
+
+def downgrade() -> None:
+    op.drop_index('ix_tenders_search_vector', table_name='tenders', postgresql_using='gin')
+    op.drop_column('tenders', 'search_vector')
+    op.drop_index('ix_bids_search_vector', table_name='bids', postgresql_using='gin')
+    op.drop_column('bids', 'search_vector')
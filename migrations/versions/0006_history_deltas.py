@@ -0,0 +1,32 @@
+"""history deltas
+
+Столбец delta в истории версий для режима HISTORY_STORAGE=delta. Перед
+откатом миграции историю нужно перевести в полные строки:
+python convert_history.py --to full
+
+Revision ID: 0006
+Revises: 0005
+Create Date: 2024-09-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0006'
+down_revision: Union[str, None] = '0005'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('bid_history', sa.Column('delta', sa.LargeBinary(), nullable=True))
+    op.add_column('tender_history', sa.Column('delta', sa.LargeBinary(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('tender_history', 'delta')
+    op.drop_column('bid_history', 'delta')
@@ -0,0 +1,49 @@
+"""identity notify
+
+Триггеры на employee и organization_responsible: после любого изменения
+(в том числе seed, COPY из generate_data.py и ручных правок) транзакция при
+коммите отправляет NOTIFY в канал identity_changes, и каждый воркер
+сбрасывает свой кэш личностей (cache.IDENTITY_CHANNEL).
+
+Revision ID: 0008
+Revises: 0007
+Create Date: 2024-09-21 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0008'
+down_revision: Union[str, None] = '0007'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('employee', 'organization_responsible')
+
+
+def upgrade() -> None:
+    # Триггер на оператор, а не на строку: одинаковые уведомления одной
+    # транзакции Postgres и так объединяет в одно
+    op.execute("""
+        CREATE FUNCTION notify_identity_changes() RETURNS trigger AS $$
+        BEGIN
+            PERFORM pg_notify('identity_changes', TG_TABLE_NAME);
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TABLES:
+        op.execute(f"""
+            CREATE TRIGGER {table}_identity_changes
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION notify_identity_changes()
+        """)
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER {table}_identity_changes ON {table}")
+    op.execute("DROP FUNCTION notify_identity_changes()")
@@ -0,0 +1,65 @@
+"""change counters
+
+Таблица change_counter и триггеры на tenders, employee и organization:
+любой оператор изменения (в том числе COPY и TRUNCATE) увеличивает счётчик
+своей таблицы в той же транзакции. Строка счётчика заблокирована до
+коммита, поэтому значения растут в порядке коммитов - из них строятся
+валидаторы условных GET (conditional.py).
+
+Revision ID: 0009
+Revises: 0008
+Create Date: 2024-09-22 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0009'
+down_revision: Union[str, None] = '0008'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+TABLES = ('tenders', 'employee', 'organization')
+
+
+def upgrade() -> None:
+    op.create_table('change_counter',
+    sa.Column('table_name', sa.String(length=63), nullable=False),
+    sa.Column('version', sa.BigInteger(), nullable=False),
+    sa.Column('changed_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('table_name')
+    )
+    # changed_at не убывает: следующий писатель получает блокировку строки
+    # только после коммита предыдущего
+    op.execute("""
+        CREATE FUNCTION bump_change_counter() RETURNS trigger AS $$
+        BEGIN
+            UPDATE change_counter
+            SET version = version + 1,
+                changed_at = greatest(changed_at, timezone('utc', clock_timestamp()))
+            WHERE table_name = TG_TABLE_NAME;
+            RETURN NULL;
+        END
+        $$ LANGUAGE plpgsql
+    """)
+    for table in TABLES:
+        op.execute(
+            f"INSERT INTO change_counter (table_name, version, changed_at) "
+            f"SELECT '{table}', 0, max(updated_at) FROM {table}"
+        )
+        op.execute(f"""
+            CREATE TRIGGER {table}_change_counter
+            AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON {table}
+            FOR EACH STATEMENT EXECUTE FUNCTION bump_change_counter()
+        """)
+
+
+def downgrade() -> None:
+    for table in TABLES:
+        op.execute(f"DROP TRIGGER {table}_change_counter ON {table}")
+    op.execute("DROP FUNCTION bump_change_counter()")
+    op.drop_table('change_counter')
@@ -1,14 +1,66 @@
-from sqlalchemy import Column, Integer, String, Enum, ForeignKey, DateTime
-from sqlalchemy.orm import relationship
-from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy import BigInteger, Column, Computed, Integer, LargeBinary, String, Enum, ForeignKey, DateTime, Index, UniqueConstraint, text
+from sqlalchemy.orm import deferred, relationship
+from sqlalchemy.dialects.postgresql import ARRAY, JSONB, TSVECTOR
 from database import Base
 from enums import TenderStatus, BidStatus, OrganizationType
 import datetime
 
+# Конфигурация полнотекстового поиска; она же используется в запросах,
+# иначе GIN-индекс по search_vector не будет применён
+SEARCH_CONFIG = "russian"
+
+
+def search_vector_column():
+    # Вычисляемый в базе tsvector по названию и описанию. Загружается только
+    # по явному обращению, чтобы не тянуть его в обычные выборки
+    return deferred(Column(
+        TSVECTOR,
+        Computed(
+            f"to_tsvector('{SEARCH_CONFIG}', "
+            "coalesce(name, '') || ' ' || coalesce(description, ''))",
+            persisted=True,
+            ),
+        ))
+
 
 
 class Tender(Base):
     __tablename__ = "tenders"
+    __table_args__ = (
+        Index(
+            "ix_tenders_status_service_type",
+            "status",
+            "service_type",
+            ),
+        Index(
+            "ix_tenders_published_service_type",
+            "service_type",
+            "created_at",
+            "id",
+            postgresql_where=text("status = 'PUBLISHED'"),
+            ),
+        Index(
+            "ix_tenders_published_created_at",
+            "created_at",
+            "id",
+            postgresql_where=text("status = 'PUBLISHED'"),
+            ),
+        Index(
+            "ix_tenders_organization_id",
+            "organization_id",
+            "created_at",
+            "id",
+            ),
+        Index(
+            "ix_tenders_updated_at",
+            "updated_at",
+            ),
+        Index(
+            "ix_tenders_search_vector",
+            "search_vector",
+            postgresql_using="gin",
+            ),
+    )
 
     id = Column(
         Integer, 
@@ -41,6 +93,7 @@ class Tender(Base):
         Integer, 
         default=1,
         )
+    search_vector = search_vector_column()
 
     organization = relationship(
         "Organization", 
@@ -57,6 +110,29 @@ class Tender(Base):
 
 class Bid(Base):
     __tablename__ = "bids"
+    __table_args__ = (
+        Index(
+            "ix_bids_tender_id",
+            "tender_id",
+            "created_at",
+            "id",
+            ),
+        Index(
+            "ix_bids_creator_id",
+            "creator_id",
+            "created_at",
+            "id",
+            ),
+        Index(
+            "ix_bids_updated_at",
+            "updated_at",
+            ),
+        Index(
+            "ix_bids_search_vector",
+            "search_vector",
+            postgresql_using="gin",
+            ),
+    )
 
     id = Column(
         Integer, 
@@ -105,6 +181,7 @@ class Bid(Base):
         ARRAY(String),
          default=[],
          )
+    search_vector = search_vector_column()
 
     tender = relationship(
         "Tender", 
@@ -127,6 +204,17 @@ class Bid(Base):
 
 class Employee(Base):
     __tablename__ = "employee"
+    __table_args__ = (
+        Index(
+            "ix_employee_created_at",
+            "created_at",
+            "id",
+            ),
+        Index(
+            "ix_employee_updated_at",
+            "updated_at",
+            ),
+    )
 
     id = Column(
         Integer, 
@@ -161,6 +249,17 @@ class Employee(Base):
 
 class Organization(Base):
     __tablename__ = "organization"
+    __table_args__ = (
+        Index(
+            "ix_organization_created_at",
+            "created_at",
+            "id",
+            ),
+        Index(
+            "ix_organization_updated_at",
+            "updated_at",
+            ),
+    )
 
     id = Column(
         Integer, 
@@ -201,6 +300,17 @@ class Organization(Base):
 
 class OrganizationResponsible(Base):
     __tablename__ = "organization_responsible"
+    __table_args__ = (
+        UniqueConstraint(
+            "user_id",
+            "organization_id",
+            name="uq_organization_responsible_user_organization",
+            ),
+        Index(
+            "ix_organization_responsible_organization_id",
+            "organization_id",
+            ),
+    )
 
     id = Column(
         Integer, 
@@ -233,6 +343,17 @@ class OrganizationResponsible(Base):
 
 class TenderHistory(Base):
     __tablename__ = "tender_history"
+    __table_args__ = (
+        UniqueConstraint(
+            "tender_id",
+            "version",
+            name="uq_tender_history_tender_version",
+            ),
+        Index(
+            "ix_tender_history_timestamp",
+            "timestamp",
+            ),
+    )
 
     id = Column(
         Integer, 
@@ -249,14 +370,27 @@ class TenderHistory(Base):
     version = Column(Integer)
     timestamp = Column(
         DateTime,
-        default=datetime.datetime.utcnow),
-    
+        default=datetime.datetime.utcnow,
+        )
     service_type = Column(String(100))
+    # Изменённые поля относительно предыдущей версии; NULL - полный снимок
+    delta = Column(LargeBinary)
 
     tender = relationship("Tender", back_populates="histories")
 
 class BidHistory(Base):
     __tablename__ = "bid_history"
+    __table_args__ = (
+        UniqueConstraint(
+            "bid_id",
+            "version",
+            name="uq_bid_history_bid_version",
+            ),
+        Index(
+            "ix_bid_history_timestamp",
+            "timestamp",
+            ),
+    )
 
     id = Column(
         Integer,
@@ -275,9 +409,50 @@ class BidHistory(Base):
         DateTime,
          default=datetime.datetime.utcnow,
          )
+    # Изменённые поля относительно предыдущей версии; NULL - полный снимок
+    delta = Column(LargeBinary)
 
     bid = relationship(
         "Bid",
          back_populates="histories",
          )
 
+class HistoryOutbox(Base):
+    # Версии истории, ожидающие переноса в tender_history/bid_history
+    # (HISTORY_WRITER=outbox). Узкая таблица без внешних ключей и
+    # вторичных индексов; кодирование версии (снимок или delta) делает
+    # фоновая задача при переносе, а не запрос
+    __tablename__ = "history_outbox"
+
+    id = Column(
+        BigInteger,
+        primary_key=True,
+        )
+    # tender или bid
+    entity = Column(String(16), nullable=False)
+    entity_id = Column(Integer, nullable=False)
+    version = Column(Integer, nullable=False)
+    timestamp = Column(
+        DateTime,
+        default=datetime.datetime.utcnow,
+        nullable=False,
+        )
+    # Состояние полей истории после изменения и, если известно, до него -
+    # из него при переносе считается delta
+    state = Column(JSONB, nullable=False)
+    previous_version = Column(Integer)
+    previous = Column(JSONB)
+
+
+class ChangeCounter(Base):
+    # Счётчик изменений таблицы для валидаторов условных GET. Увеличивается
+    # триггером на оператор (миграция 0009) в транзакции изменения, поэтому
+    # растёт в порядке коммитов, в отличие от updated_at
+    __tablename__ = "change_counter"
+
+    table_name = Column(
+        String(63),
+        primary_key=True,
+        )
+    version = Column(BigInteger, nullable=False)
+    changed_at = Column(DateTime)
@@ -0,0 +1,158 @@
+import base64
+import datetime
+import json
+from typing import NamedTuple, Optional, Tuple
+
+from fastapi import HTTPException, Query, Response
+from sqlalchemy import and_, or_, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class PageParams(NamedTuple):
+    limit: int = DEFAULT_PAGE_SIZE
+    # (created_at, id) последней строки предыдущей страницы
+    after: Optional[Tuple[datetime.datetime, int]] = None
+
+
+class RankedPageParams(NamedTuple):
+    limit: int = DEFAULT_PAGE_SIZE
+    # (rank, id) последней строки предыдущей страницы поисковой выдачи
+    after: Optional[Tuple[float, int]] = None
+
+
+class VersionPageParams(NamedTuple):
+    limit: int = DEFAULT_PAGE_SIZE
+    # Последняя версия предыдущей страницы истории
+    after: Optional[int] = None
+
+
+def _encode(values: list) -> str:
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def _decode(cursor: str) -> list:
+    raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+    return json.loads(raw)
+
+
+def encode_cursor(created_at: datetime.datetime, id: int) -> str:
+    return _encode([created_at.isoformat(), id])
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime.datetime, int]:
+    try:
+        created_at, id = _decode(cursor)
+        return datetime.datetime.fromisoformat(created_at), int(id)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def encode_rank_cursor(rank: float, id: int) -> str:
+    return _encode([rank, id])
+
+
+def decode_rank_cursor(cursor: str) -> Tuple[float, int]:
+    try:
+        rank, id = _decode(cursor)
+        return float(rank), int(id)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def encode_version_cursor(version: int) -> str:
+    return _encode([version])
+
+
+def decode_version_cursor(cursor: str) -> int:
+    try:
+        version, = _decode(cursor)
+        return int(version)
+    except (ValueError, TypeError) as exc:
+        raise ValueError("Invalid cursor") from exc
+
+
+def _invalid_cursor():
+    return HTTPException(
+        status_code=400,
+        detail="Некорректный курсор",
+        )
+
+
+def get_page_params(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    ) -> PageParams:
+    if not cursor:
+        return PageParams(limit=limit)
+    try:
+        return PageParams(limit=limit, after=decode_cursor(cursor))
+    except ValueError:
+        raise _invalid_cursor()
+
+
+def get_ranked_page_params(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    ) -> RankedPageParams:
+    if not cursor:
+        return RankedPageParams(limit=limit)
+    try:
+        return RankedPageParams(limit=limit, after=decode_rank_cursor(cursor))
+    except ValueError:
+        raise _invalid_cursor()
+
+
+def get_version_page_params(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    ) -> VersionPageParams:
+    if not cursor:
+        return VersionPageParams(limit=limit)
+    try:
+        return VersionPageParams(limit=limit, after=decode_version_cursor(cursor))
+    except ValueError:
+        raise _invalid_cursor()
+
+
+def set_next_cursor(response: Response, next_cursor: Optional[str]):
+    if next_cursor:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+
+
+async def fetch_page(db: AsyncSession, query, model, page: PageParams):
+    # Keyset-пагинация по (created_at, id): стоимость страницы не зависит от её номера.
+    # Ключ добавляется последними колонками строки, поэтому query может
+    # выбирать любые колонки, в том числе без id и created_at
+    if page.after:
+        query = query.filter(tuple_(model.created_at, model.id) > tuple_(*page.after))
+    query = query.add_columns(model.created_at, model.id)
+    query = query.order_by(model.created_at, model.id).limit(page.limit + 1)
+    result = await db.execute(query)
+    rows = result.all()
+    if len(rows) > page.limit:
+        last = rows[page.limit - 1]
+        return rows[:page.limit], encode_cursor(last[-2], last[-1])
+    return rows, None
+
+
+async def fetch_ranked_page(db: AsyncSession, query, model, rank, page: RankedPageParams):
+    # Keyset-пагинация по (rank desc, id) для поисковой выдачи
+    if page.after:
+        after_rank, after_id = page.after
+        query = query.filter(or_(
+            rank < after_rank,
+            and_(rank == after_rank, model.id > after_id),
+        ))
+    # Ключ (id, ранг) - последние колонки строки
+    query = query.add_columns(model.id, rank).order_by(rank.desc(), model.id).limit(page.limit + 1)
+    result = await db.execute(query)
+    rows = result.all()
+    if len(rows) > page.limit:
+        last = rows[page.limit - 1]
+        return rows[:page.limit], encode_rank_cursor(last[-1], last[-2])
+    return rows, None
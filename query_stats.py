@@ -0,0 +1,182 @@
+import contextvars
+import logging
+import time
+from collections import Counter
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.interfaces import ExecuteStyle
+
+from config import DEBUG, N_PLUS_ONE_THRESHOLD, TEST_MODE
+from metrics import Histogram, format_labels, render_histogram, route_label
+
+logger = logging.getLogger(__name__)
+
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 8, 13, 21, 34, 55, 89)
+QUERY_TIME_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+
+QUERIES_HEADER = b"x-db-queries"
+TIME_HEADER = b"x-db-time"
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RepeatedStatements(AssertionError):
+    pass
+
+
+class QueryStats:
+    # SQL-запросы одного HTTP-запроса
+
+    def __init__(self):
+        self.count = 0
+        self.time = 0.0
+        self.statements = Counter()
+        # Контекст последнего executemany, разбитого на пачки insertmanyvalues
+        self.batched = None
+
+    def repeated(self, threshold: int = N_PLUS_ONE_THRESHOLD) -> dict:
+        # Одинаковый текст запроса много раз подряд - почти всегда N+1
+        return {
+            statement: count
+            for statement, count in self.statements.items()
+            if count >= threshold
+        }
+
+
+_current = contextvars.ContextVar("query_stats", default=None)
+
+
+def current_query_stats() -> Optional[QueryStats]:
+    return _current.get()
+
+
+# Время начала хранится в контексте выполнения, а не на соединении: у
+# запроса, завершившегося ошибкой, after_cursor_execute не вызывается, и
+# запись на соединении из пула сдвинула бы время следующих запросов
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current.get() is not None and context is not None:
+        context._query_started = time.perf_counter()
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    started = getattr(context, "_query_started", None)
+    if stats is None or started is None:
+        return
+    stats.time += time.perf_counter() - started
+    if context is not None and context.execute_style is ExecuteStyle.INSERTMANYVALUES:
+        # INSERT ... RETURNING пачкой строк драйвер отправляет частями по
+        # insertmanyvalues_page_size строк; один вызов execute - один запрос,
+        # иначе бюджет пакетных эндпоинтов зависел бы от размера пачки
+        if stats.batched is context:
+            return
+        stats.batched = context
+    stats.count += 1
+    stats.statements[statement] += 1
+
+
+def query_budget(limit: int):
+    # Объявляет, сколько SQL-запросов может выполнить обработчик. Ставится
+    # под декоратором маршрута; в TEST_MODE превышение - ошибка запроса
+    def decorator(endpoint):
+        endpoint.query_budget = limit
+        return endpoint
+    return decorator
+
+
+class QueryMetrics:
+    # Число запросов и время в базе на HTTP-запрос по шаблону маршрута
+
+    def __init__(self):
+        self._routes = {}
+        self._repeated = Counter()
+
+    def observe(self, key: tuple, stats: QueryStats, repeated: dict):
+        # key - (метод, шаблон маршрута)
+        histograms = self._routes.get(key)
+        if histograms is None:
+            histograms = self._routes[key] = (
+                Histogram(QUERY_COUNT_BUCKETS, threadsafe=False),
+                Histogram(QUERY_TIME_BUCKETS, threadsafe=False),
+                )
+        histograms[0].observe(stats.count)
+        histograms[1].observe(stats.time)
+        if repeated:
+            self._repeated[key] += 1
+
+    def render(self, lines: list):
+        routes = sorted(self._routes.items())
+        lines.append("# HELP db_queries_per_request SQL statements per HTTP request.")
+        lines.append("# TYPE db_queries_per_request histogram")
+        for (method, route), (count_histogram, _) in routes:
+            render_histogram(lines, "db_queries_per_request",
+                             format_labels(method=method, route=route), count_histogram.snapshot())
+        lines.append("# HELP db_time_per_request_seconds Time spent in SQL per HTTP request.")
+        lines.append("# TYPE db_time_per_request_seconds histogram")
+        for (method, route), (_, time_histogram) in routes:
+            render_histogram(lines, "db_time_per_request_seconds",
+                             format_labels(method=method, route=route), time_histogram.snapshot())
+        lines.append("# HELP db_repeated_statement_requests_total Requests that repeated one statement "
+                     "N_PLUS_ONE_THRESHOLD or more times.")
+        lines.append("# TYPE db_repeated_statement_requests_total counter")
+        for (method, route), count in sorted(self._repeated.items()):
+            lines.append(f"db_repeated_statement_requests_total{{{format_labels(method=method, route=route)}}} {count}")
+
+
+query_metrics = QueryMetrics()
+
+
+def _check(scope, stats: QueryStats, repeated: dict):
+    route = scope.get("route")
+    budget = getattr(getattr(route, "endpoint", None), "query_budget", None)
+    if budget is not None and stats.count > budget:
+        raise QueryBudgetExceeded(
+            f"{scope['method']} {route.path}: {stats.count} SQL statements, budget {budget}")
+    if repeated:
+        raise RepeatedStatements(f"{scope['method']} {route_label(scope)}: {repeated}")
+
+
+class QueryStatsMiddleware:
+    # Считает SQL-запросы каждого HTTP-запроса. В DEBUG добавляет заголовки
+    # X-DB-Queries и X-DB-Time, в TEST_MODE проверяет бюджет запросов
+    # обработчика и повторяющиеся запросы
+
+    def __init__(self, app, metrics: QueryMetrics = query_metrics, debug: bool = DEBUG, test_mode: bool = TEST_MODE):
+        self.app = app
+        self.metrics = metrics
+        self.debug = debug
+        self.test_mode = test_mode
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = QueryStats()
+        token = _current.set(stats)
+
+        async def send_with_stats(message):
+            if message["type"] == "http.response.start":
+                if self.test_mode:
+                    _check(scope, stats, stats.repeated())
+                if self.debug:
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (QUERIES_HEADER, str(stats.count).encode()),
+                        (TIME_HEADER, f"{stats.time * 1000:.2f}ms".encode()),
+                    ]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_stats)
+        finally:
+            _current.reset(token)
+            repeated = stats.repeated()
+            if repeated:
+                logger.warning("Possible N+1 in %s %s: %s", scope["method"], route_label(scope), repeated)
+            self.metrics.observe((scope["method"], route_label(scope)), stats, repeated)
@@ -0,0 +1,159 @@
+# Политика хранения истории версий и фоновая компакция.
+#
+# Разовый проход вручную (с настройками БД и политики из .env):
+#     python retention.py
+import asyncio
+import datetime
+import logging
+from typing import Dict, NamedTuple
+
+from sqlalchemy import and_, delete, exists, func, select, update
+
+import crud
+from config import (HISTORY_COMPACTION_BATCH_SIZE,
+                    HISTORY_COMPACTION_INTERVAL,
+                    HISTORY_KEEP_DAYS,
+                    HISTORY_KEEP_VERSIONS,
+                    )
+from database import AsyncSessionLocal, async_engine
+from models import Bid, BidHistory, HistoryOutbox, Tender, TenderHistory
+
+logger = logging.getLogger(__name__)
+
+# Ключ advisory-блокировки: при нескольких воркерах компакцию в каждый
+# момент выполняет только один из них
+COMPACTION_LOCK_KEY = 0x68697374
+
+ENTITIES = (
+    (TenderHistory, TenderHistory.tender_id, Tender, crud.get_tender_version_state, "tender"),
+    (BidHistory, BidHistory.bid_id, Bid, crud.get_bid_version_state, "bid"),
+)
+
+
+class RetentionPolicy(NamedTuple):
+    # 0 - без ограничения. Если заданы оба ограничения, версия удаляется,
+    # только когда она вне обоих: не среди последних keep_versions и
+    # старше keep_days дней. Текущая версия не удаляется никогда
+    keep_versions: int = 0
+    keep_days: int = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.keep_versions or self.keep_days)
+
+    def expired(self, model, live_model, now: datetime.datetime):
+        conditions = [model.version < live_model.version]
+        if self.keep_versions:
+            conditions.append(model.version <= live_model.version - self.keep_versions)
+        if self.keep_days:
+            conditions.append(model.timestamp < now - datetime.timedelta(days=self.keep_days))
+        return and_(*conditions)
+
+
+retention_policy = RetentionPolicy(
+    keep_versions=HISTORY_KEEP_VERSIONS,
+    keep_days=HISTORY_KEEP_DAYS,
+    )
+
+
+async def _ensure_snapshot(db, model, key_column, get_state, entity_id: int, after_version: int):
+    # Первая оставшаяся версия должна быть полным снимком, иначе delta
+    # после неё не от чего восстанавливать
+    result = await db.execute(
+        select(model.id, model.version, model.delta)
+        .filter(key_column == entity_id, model.version > after_version)
+        .order_by(model.version)
+        .limit(1)
+    )
+    row = result.first()
+    if row is None or row.delta is None:
+        return
+    state = await get_state(db, entity_id, row.version)
+    await db.execute(
+        update(model)
+        .where(model.id == row.id)
+        .values(**state, delta=None)
+        .execution_options(synchronize_session=False)
+    )
+
+
+async def _compact_batch(db, entity, policy: RetentionPolicy, now, after_entity_id: int, batch_size: int):
+    model, key_column, live_model, get_state, outbox_entity = entity
+    # Версии каждой сущности удаляются только с начала: упорядоченная по
+    # (сущность, версия) пачка всегда содержит префикс устаревших версий.
+    # Сущности с версиями в history_outbox пропускаются до следующего
+    # прохода: перенос закодирует их delta к предыдущей версии, и её нельзя
+    # удалять раньше. Очередь и версия сущности берутся из одного снимка,
+    # поэтому изменение, закоммиченное после запроса, удаления не затронет
+    pending = exists().where(HistoryOutbox.entity == outbox_entity, HistoryOutbox.entity_id == key_column)
+    result = await db.execute(
+        select(model.id, key_column, model.version)
+        .join(live_model, live_model.id == key_column)
+        .filter(key_column >= after_entity_id, policy.expired(model, live_model, now), ~pending)
+        .order_by(key_column, model.version)
+        .limit(batch_size)
+    )
+    rows = result.all()
+    if not rows:
+        return 0, after_entity_id
+
+    last_versions = {}
+    for _, entity_id, version in rows:
+        last_versions[entity_id] = version
+    for entity_id, version in last_versions.items():
+        await _ensure_snapshot(db, model, key_column, get_state, entity_id, version)
+    await db.execute(
+        delete(model)
+        .where(model.id.in_([row.id for row in rows]))
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    return len(rows), rows[-1][1]
+
+
+async def compact_history(
+    policy: RetentionPolicy = retention_policy,
+    batch_size: int = HISTORY_COMPACTION_BATCH_SIZE,
+    ) -> Dict[str, int]:
+    # Каждая пачка - отдельная короткая транзакция, чтобы не держать
+    # блокировки на строках истории дольше одной пачки
+    deleted = {}
+    if not policy.enabled:
+        return deleted
+    now = datetime.datetime.utcnow()
+    for entity in ENTITIES:
+        model = entity[0]
+        deleted[model.__tablename__] = 0
+        after_entity_id = 0
+        while True:
+            async with AsyncSessionLocal() as db:
+                locked = await db.scalar(select(func.pg_try_advisory_xact_lock(COMPACTION_LOCK_KEY)))
+                if not locked:
+                    # Компакцию уже выполняет другой процесс
+                    return deleted
+                count, after_entity_id = await _compact_batch(
+                    db, entity, policy, now, after_entity_id, batch_size)
+            if not count:
+                break
+            deleted[model.__tablename__] += count
+    return deleted
+
+
+async def run_compaction(interval: float = HISTORY_COMPACTION_INTERVAL):
+    while True:
+        try:
+            deleted = await compact_history()
+            if any(deleted.values()):
+                logger.info("History compaction: %s", deleted)
+        except Exception:
+            logger.exception("History compaction failed")
+        await asyncio.sleep(interval)
+
+
+async def _main():
+    print(await compact_history())
+    await async_engine.dispose()
+
+
+if __name__ == "__main__":
+    asyncio.run(_main())
@@ -1,23 +1,52 @@
 # routers/bids.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Response, status
 from fastapi.responses import JSONResponse
-from sqlalchemy.orm import Session
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from schemas import BidCreate, Bid, BidUpdate
-from crud import (get_user_by_username,
-                  is_user_responsible_for_org, 
+from config import BULK_MAX_ITEMS
+from schemas import (BidCreate, 
+                     Bid, 
+                     BidUpdate, 
+                     BidBulkResult, 
+                     BulkError, 
+                     validate_bulk_items,
+                     BidVersion,
+                     VersionDiff,
+                     )
+from history import BID_HISTORY, diff_states
+from crud import (get_identity,
+                  get_identities,
+                  get_tender_organization_ids,
+                  get_existing_organization_ids,
+                  resolve_permissions,
                   create_bid, 
+                  create_bids_bulk,
                   get_bids_for_tender, 
                   get_my_bids, 
+                  search_bids,
                   update_bid, 
                   rollback_bid, 
+                  get_oldest_bid_version,
+                  get_bid_version,
+                  get_bid_versions,
                   get_bid, 
-                  is_author_of_tender
+                  apply_bid_decision,
+                  BID_APPROVAL_QUORUM,
                   )
-from database import get_db
+from database import get_async_db
+from pagination import (PageParams, 
+                        RankedPageParams, 
+                        VersionPageParams, 
+                        get_page_params, 
+                        get_ranked_page_params, 
+                        get_version_page_params, 
+                        set_next_cursor,
+                        )
 from enums import DecisionType, BidStatus
+from query_stats import query_budget
+from serialization import BID_ROWS, RowSerializer
 
 
 router = APIRouter(
@@ -25,85 +54,220 @@ router = APIRouter(
     tags=["bids"],
 )
 
+async def _compacted_version_error(db: AsyncSession, bid_id: int, version: int):
+    oldest_version = await get_oldest_bid_version(
+        db=db, 
+        bid_id=bid_id,
+        )
+    if oldest_version and 1 <= version < oldest_version:
+        return HTTPException(
+            status_code=404, 
+            detail=f"Версия {version} удалена политикой хранения истории, "
+                   f"самая ранняя доступная версия: {oldest_version}",
+            )
+    return None
+
+async def _get_bid_or_404(db: AsyncSession, bid_id: int):
+    db_bid = await get_bid(
+        db=db, 
+        bid_id=bid_id,
+        )
+    if not db_bid:
+        raise HTTPException(
+            status_code=404, 
+            detail="Предложение не найдено",
+            )
+    return db_bid
+
+async def _get_version_or_404(db: AsyncSession, bid_id: int, version: int):
+    db_version = await get_bid_version(
+        db=db, 
+        bid_id=bid_id,
+        version=version,
+        )
+    if not db_version:
+        compacted = await _compacted_version_error(db, bid_id, version)
+        if compacted:
+            raise compacted
+        raise HTTPException(
+            status_code=404, 
+            detail="Версия не найдена",
+            )
+    return db_version
+
 @router.post(
         "/new", 
         response_model=Bid, 
         status_code=status.HTTP_201_CREATED,
         )
-def endpoint_create_bid(
+@query_budget(6)
+async def endpoint_create_bid(
     bid: BidCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     ):
-    user = get_user_by_username(
+    permissions = await resolve_permissions(
         db=db,
-        username = bid.creator_username,
+        username=bid.creator_username,
+        organization_id=bid.organization_id,
+        tender_id=bid.tender_id,
         )
-    if not user:
+    if not permissions.user_exists:
         raise HTTPException(
             status_code=400, 
             detail="Пользователь не найден",
             )
     
 
-    is_responsible = is_user_responsible_for_org(
-        db=db, 
-        user_id=user.id, 
-        organization_id=bid.organization_id,
-        )
-    if not is_responsible and not is_author_of_tender(
-        db=db, 
-        tender_id=bid.tender_id, 
-        user_id=user.id,
-        ):
+    if not (permissions.responsible_for_org
+            or permissions.responsible_for_tender_org):
         raise HTTPException(
             status_code=403, 
             detail="Нет прав на создание предложения",
             )
     
-    new_bid = create_bid(
+    new_bid = await create_bid(
         db=db,
         bid=bid,
+        creator_id=permissions.user_id,
         )
     return new_bid
 
+@router.post(
+        "/bulk", 
+        response_model=BidBulkResult,
+        )
+@query_budget(7)
+async def endpoint_create_bids_bulk(
+    items: List[dict] = Body(..., max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(get_async_db),
+    ):
+    valid, errors = validate_bulk_items(BidCreate, items)
+    # Пользователи, организации тендеров и существующие организации -
+    # фиксированное число запросов на всю пачку
+    identities = await get_identities(
+        db=db,
+        usernames=[bid.creator_username for _, bid in valid],
+        )
+    tender_organization_ids = await get_tender_organization_ids(
+        db=db,
+        tender_ids=[bid.tender_id for _, bid in valid],
+        )
+    organization_ids = await get_existing_organization_ids(
+        db=db,
+        organization_ids=[bid.organization_id for _, bid in valid],
+        )
+    allowed, creator_ids = [], []
+    for index, bid in valid:
+        user = identities.get(bid.creator_username)
+        if not user:
+            errors.append(BulkError(
+                index=index, 
+                detail="Пользователь не найден",
+                ))
+        elif bid.tender_id not in tender_organization_ids:
+            errors.append(BulkError(
+                index=index, 
+                detail="Тендер не найден",
+                ))
+        elif bid.organization_id not in organization_ids:
+            errors.append(BulkError(
+                index=index, 
+                detail="Организация не найдена",
+                ))
+        elif not (bid.organization_id in user.organization_ids
+                  or tender_organization_ids[bid.tender_id] in user.organization_ids):
+            errors.append(BulkError(
+                index=index, 
+                detail="Нет прав на создание предложения",
+                ))
+        else:
+            allowed.append(bid)
+            creator_ids.append(user.user_id)
+
+    created = await create_bids_bulk(
+        db=db, 
+        bids=allowed,
+        creator_ids=creator_ids,
+        )
+    errors.sort(key=lambda error: error.index)
+    return {"created": created, "errors": errors}
+
 @router.get(
         "/my", 
         response_model=List[Bid],
         )
-def endpoint_list_my_bids(
+@query_budget(4)
+async def endpoint_list_my_bids(
     username: str,
-      db: Session = Depends(get_db),
+    response: Response,
+      db: AsyncSession = Depends(get_async_db),
+      page: PageParams = Depends(get_page_params),
+      serializer: RowSerializer = Depends(BID_ROWS.select_fields),
       ):
-    bids = get_my_bids(
+    bids, next_cursor = await get_my_bids(
+        db=db, 
+        username=username,
+        page=page,
+        serializer=serializer,
+        )
+    set_next_cursor(response, next_cursor)
+    return serializer.response(bids, response)
+
+@router.get(
+        "/search", 
+        response_model=List[Bid],
+        )
+@query_budget(3)
+async def endpoint_search_bids(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    username: str = None,
+    db: AsyncSession = Depends(get_async_db),
+    page: RankedPageParams = Depends(get_ranked_page_params),
+    serializer: RowSerializer = Depends(BID_ROWS.select_fields),
+    ):
+    bids, next_cursor = await search_bids(
         db=db, 
+        q=q, 
         username=username,
+        page=page,
+        serializer=serializer,
         )
-    return bids
+    set_next_cursor(response, next_cursor)
+    return serializer.response(bids, response)
 
 @router.get(
         "/{tender_id}/list",
          response_model=List[Bid],
          )
-def endpoint_list_bids_for_tender(
+@query_budget(4)
+async def endpoint_list_bids_for_tender(
     tender_id: int, 
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    page: PageParams = Depends(get_page_params),
+    serializer: RowSerializer = Depends(BID_ROWS.select_fields),
     ):
-    bids = get_bids_for_tender(
+    bids, next_cursor = await get_bids_for_tender(
         db=db, 
         tender_id=tender_id,
+        page=page,
+        serializer=serializer,
         )
-    return bids
+    set_next_cursor(response, next_cursor)
+    return serializer.response(bids, response)
 
 @router.patch(
         "/{bid_id}/edit", 
         response_model=Bid,
         )
-def endpoint_edit_bid(
+@query_budget(7)
+async def endpoint_edit_bid(
     bid_id: int, 
     bid: BidUpdate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     ):
-    db_bid = get_bid(
+    db_bid = await get_bid(
         db=db, 
         bid_id=bid_id,
         )
@@ -114,37 +278,89 @@ def endpoint_edit_bid(
             )
     
     
-    user = get_user_by_username(
+    permissions = await resolve_permissions(
         db=db, 
         username=bid.username,
-        )
-    if not user or not (is_user_responsible_for_org(
-        db=db, 
-        user_id=user.id, 
         organization_id=db_bid.organization_id,
-        ) or db_bid.creator_id == user.id):
+        bid=db_bid,
+        )
+    if not (permissions.responsible_for_org or permissions.is_bid_creator):
         raise HTTPException(
             status_code=403, 
             detail="Нет доступа к редактированию предложения",
             )
     
-    updated_bid = update_bid(
+    updated_bid = await update_bid(
         db=db, 
         db_bid=db_bid, 
         bid=bid,
         )
     return updated_bid
 
+@router.get(
+        "/{bid_id}/versions", 
+        response_model=List[BidVersion],
+        )
+@query_budget(4)
+async def endpoint_list_bid_versions(
+    bid_id: int, 
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    page: VersionPageParams = Depends(get_version_page_params),
+    ):
+    await _get_bid_or_404(db, bid_id)
+    versions, next_cursor = await get_bid_versions(
+        db=db, 
+        bid_id=bid_id,
+        page=page,
+        )
+    set_next_cursor(response, next_cursor)
+    return versions
+
+@router.get(
+        "/{bid_id}/versions/{version}", 
+        response_model=BidVersion,
+        )
+@query_budget(5)
+async def endpoint_get_bid_version(
+    bid_id: int, 
+    version: int, 
+    db: AsyncSession = Depends(get_async_db),
+    ):
+    await _get_bid_or_404(db, bid_id)
+    return await _get_version_or_404(db, bid_id, version)
+
+@router.get(
+        "/{bid_id}/diff", 
+        response_model=VersionDiff,
+        )
+@query_budget(6)
+async def endpoint_diff_bid_versions(
+    bid_id: int, 
+    from_version: int = Query(..., alias="from"),
+    to_version: int = Query(..., alias="to"),
+    db: AsyncSession = Depends(get_async_db),
+    ):
+    await _get_bid_or_404(db, bid_id)
+    old = await _get_version_or_404(db, bid_id, from_version)
+    new = await _get_version_or_404(db, bid_id, to_version)
+    return VersionDiff(
+        from_version=from_version,
+        to_version=to_version,
+        changes=diff_states(BID_HISTORY, old, new),
+        )
+
 @router.put(
         "/{bid_id}/rollback/{version}",
          response_model=Bid,
          )
-def endpoint_rollback_bid(
+@query_budget(8)
+async def endpoint_rollback_bid(
     bid_id: int, 
     version: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     ):
-    db_bid = get_bid(
+    db_bid = await get_bid(
         db=db, 
         bid_id=bid_id,
         )
@@ -154,12 +370,15 @@ def endpoint_rollback_bid(
             detail="Предложение не найдено",
             )
     
-    rolled_back_bid = rollback_bid(
+    rolled_back_bid = await rollback_bid(
         db=db, 
         db_bid=db_bid, 
         version=version,
         )
     if not rolled_back_bid:
+        compacted = await _compacted_version_error(db, bid_id, version)
+        if compacted:
+            raise compacted
         raise HTTPException(
             status_code=400, 
             detail="Некорректная версия для отката",
@@ -171,13 +390,14 @@ def endpoint_rollback_bid(
         "/{bid_id}/decision", 
         response_model=Bid,
         )
-def endpoint_bid_decision(
+@query_budget(7)
+async def endpoint_bid_decision(
         bid_id: int, 
         username: str, 
         decision: DecisionType, 
-        db: Session = Depends(get_db),
+        db: AsyncSession = Depends(get_async_db),
         ):
-    bid = get_bid(
+    bid = await get_bid(
         db=db, 
         bid_id=bid_id,
         )
@@ -194,7 +414,7 @@ def endpoint_bid_decision(
                 },
             )
 
-    user = get_user_by_username(
+    user = await get_identity(
         db=db, 
         username=username,
         )
@@ -203,41 +423,48 @@ def endpoint_bid_decision(
             status_code=400, 
             detail="Пользователь не найден",
             )
-    if not is_user_responsible_for_org(
-        db=db, 
-        user_id=user.id, 
-        organization_id=bid.organization_id,
-        ):
+    if bid.organization_id not in user.organization_ids:
         raise HTTPException(
             status_code=403, 
             detail="Нет доступа к редактированию предложения",
             )
-    if username not in bid.approved_by:
-        if decision == DecisionType.REJECT:
-            bid.status = BidStatus.CANCELED
-            db.commit()
-            return JSONResponse(
-                status_code=200, 
-                content={
-                    "message": "Предложение отклонено",
-                    },
-                    ) 
-        bid.approve_decision_count += 1
-        bid.approved_by = bid.approved_by + [username]
-        
-        db.commit()
-        db.refresh(bid)
-        
-    else:
+    if username in bid.approved_by:
         raise HTTPException(
             status_code=400, 
             detail="Пользователь уже принял предложение",
             )
-        
-    if bid.approve_decision_count >=3:
-        bid.status = BidStatus.PUBLISHED
-        
-        db.commit()
+
+    result = await apply_bid_decision(
+        db=db,
+        bid_id=bid_id,
+        username=username,
+        decision=decision,
+        )
+    if not result:
+        # Условие UPDATE не выполнилось: решение успело принять параллельный запрос
+        await db.refresh(bid)
+        if username in bid.approved_by:
+            raise HTTPException(
+                status_code=400, 
+                detail="Пользователь уже принял предложение",
+                )
+        return JSONResponse(
+            status_code=200, 
+            content={
+                "message": "Предложение уже опубликовано",
+                },
+            )
+
+    # Сообщение - по принятому решению: одобрение уже отклонённого
+    # предложения ничего не отклоняет
+    if decision == DecisionType.REJECT:
+        return JSONResponse(
+            status_code=200, 
+            content={
+                "message": "Предложение отклонено",
+                },
+                ) 
+    if result.status == BidStatus.PUBLISHED:
         return JSONResponse(
             status_code=200, 
             content={
@@ -248,17 +475,17 @@ def endpoint_bid_decision(
     return JSONResponse(
         status_code=200,
           content={
-              "message": f"Предложение не опубликовано. До подтверждения осталось: {3 - bid.approve_decision_count} принятия предложения.",
+              "message": f"Предложение не опубликовано. До подтверждения осталось: {BID_APPROVAL_QUORUM - result.approve_decision_count} принятия предложения.",
               },
               )
 
 
 @router.post("/{bid_id}/approved_by")
-def endpoint_test(
+async def endpoint_test(
     bid_id: int,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     ):
-    bid = get_bid(
+    bid = await get_bid(
         db=db, 
         bid_id=bid_id,
         )
@@ -0,0 +1,54 @@
+# routers/events.py
+
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from crud import get_identity
+from database import get_async_db
+from events import event_broker
+from query_stats import query_budget
+
+router = APIRouter(
+    prefix="/api/events",
+    tags=["events"],
+)
+
+
+@router.get("")
+@query_budget(1)
+async def endpoint_events(
+    tender_id: Optional[int] = None,
+    organization_id: Optional[int] = None,
+    username: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db),
+    ):
+    # Server-Sent Events об изменениях тендеров и предложений вместо опроса
+    # списков. Без username приходят только события со статусом PUBLISHED,
+    # с username - события организаций пользователя и его предложений.
+    # Событие reset означает, что часть событий потеряна и списки нужно
+    # перечитать
+    user = None
+    if username:
+        user = await get_identity(db=db, username=username)
+        if not user:
+            raise HTTPException(
+                status_code=400, 
+                detail="Пользователь не найден",
+                )
+    if event_broker.full:
+        raise HTTPException(
+            status_code=503, 
+            detail="Слишком много подписчиков",
+            )
+    # Сессия закрывается до начала потока: подписчик не держит соединение пула
+    return StreamingResponse(
+        event_broker.stream(tender_id, organization_id, user),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            },
+        )
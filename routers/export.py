@@ -0,0 +1,107 @@
+# routers/export.py
+
+import csv
+import datetime
+import enum
+import io
+import json
+
+from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import EXPORT_BATCH_SIZE
+from cache import Identity
+from crud import get_export_query, get_identity
+from database import get_async_db, read_only_session
+from enums import ExportEntity, ExportFormat
+from history import HistoryCodec
+
+router = APIRouter(
+    prefix="/api/export",
+    tags=["export"],
+)
+
+MEDIA_TYPES = {
+    ExportFormat.NDJSON: "application/x-ndjson",
+    ExportFormat.CSV: "text/csv",
+}
+
+
+def _to_json(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, bytes):
+        # delta версии истории выгружается как объект изменённых полей
+        return HistoryCodec.decode_delta(value)
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _to_csv(value):
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, list):
+        return json.dumps(value)
+    if isinstance(value, bytes):
+        return json.dumps(HistoryCodec.decode_delta(value), ensure_ascii=False)
+    return value
+
+
+async def _stream_rows(entity: ExportEntity, export_format: ExportFormat, user: Identity, updated_since):
+    # Сессия открывается внутри генератора: зависимость get_async_db
+    # закрывается до того, как начнётся отправка тела ответа
+    query = get_export_query(entity.value, user, updated_since).execution_options(
+        yield_per=EXPORT_BATCH_SIZE,
+        )
+    async with read_only_session() as db:
+        # Серверный курсор: в памяти одновременно не больше одной пачки строк
+        result = await db.stream(query)
+        columns = list(result.keys())
+        if export_format == ExportFormat.CSV:
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(columns)
+        async for rows in result.partitions():
+            if export_format == ExportFormat.NDJSON:
+                yield "".join(
+                    json.dumps(dict(zip(columns, row)), default=_to_json, ensure_ascii=False) + "\n"
+                    for row in rows
+                    )
+            else:
+                writer.writerows([_to_csv(value) for value in row] for row in rows)
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+        if export_format == ExportFormat.CSV and buffer.tell():
+            yield buffer.getvalue()
+
+
+@router.get("/{entity}")
+async def endpoint_export(
+    entity: ExportEntity,
+    username: str,
+    format: ExportFormat = ExportFormat.NDJSON,
+    updated_since: datetime.datetime = None,
+    db: AsyncSession = Depends(get_async_db),
+    ):
+    # Выгружаются только строки, видимые пользователю: опубликованные и его
+    # организаций (предложения - ещё и его собственные), история - вместе со
+    # своим тендером или предложением
+    user = await get_identity(
+        db=db,
+        username=username,
+        )
+    if not user:
+        raise HTTPException(
+            status_code=400,
+            detail="Пользователь не найден",
+            )
+    return StreamingResponse(
+        _stream_rows(entity, format, user, updated_since),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "Content-Disposition": f'attachment; filename="{entity.value}.{format.value}"',
+            },
+        )
@@ -1,36 +1,105 @@
 # routers/tenders.py
 
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
 from typing import List
 
-from schemas import Tender, TenderCreate, TenderUpdate
-from crud import (get_user_by_username,
-                  is_user_responsible_for_org,
+from config import BULK_MAX_ITEMS
+from schemas import (Tender, 
+                     TenderCreate, 
+                     TenderUpdate, 
+                     TenderBulkResult, 
+                     BulkError, 
+                     validate_bulk_items,
+                     TenderVersion,
+                     VersionDiff,
+                     )
+from history import TENDER_HISTORY, diff_states
+from crud import (get_identity,
+                  get_identities,
                   create_tender,
+                  create_tenders_bulk,
                   get_tenders,
+                  search_tenders,
                   get_my_tenders, 
                   update_tender,
                   rollback_tender, 
+                  get_oldest_tender_version,
+                  get_tender_version,
+                  get_tender_versions,
                   get_tender,
                   )
-from database import get_db
+from database import get_async_db
+from pagination import (PageParams, 
+                        RankedPageParams, 
+                        VersionPageParams, 
+                        get_page_params, 
+                        get_ranked_page_params, 
+                        get_version_page_params, 
+                        set_next_cursor,
+                        )
+from conditional import get_validator, not_modified_response, set_validator_headers
+from query_stats import query_budget
+from serialization import TENDER_ROWS, RowSerializer
+from models import Tender as TenderModel
 
 router = APIRouter(
     prefix="/api/tenders",
     tags=["tenders"],
 )
 
+async def _compacted_version_error(db: AsyncSession, tender_id: int, version: int):
+    oldest_version = await get_oldest_tender_version(
+        db=db, 
+        tender_id=tender_id,
+        )
+    if oldest_version and 1 <= version < oldest_version:
+        return HTTPException(
+            status_code=404, 
+            detail=f"Версия {version} удалена политикой хранения истории, "
+                   f"самая ранняя доступная версия: {oldest_version}",
+            )
+    return None
+
+async def _get_tender_or_404(db: AsyncSession, tender_id: int):
+    db_tender = await get_tender(
+        db=db, 
+        tender_id=tender_id,
+        )
+    if not db_tender:
+        raise HTTPException(
+            status_code=404, 
+            detail="Тендер не найден",
+            )
+    return db_tender
+
+async def _get_version_or_404(db: AsyncSession, tender_id: int, version: int):
+    db_version = await get_tender_version(
+        db=db, 
+        tender_id=tender_id,
+        version=version,
+        )
+    if not db_version:
+        compacted = await _compacted_version_error(db, tender_id, version)
+        if compacted:
+            raise compacted
+        raise HTTPException(
+            status_code=404, 
+            detail="Версия не найдена",
+            )
+    return db_version
+
 @router.post(
         "/new", 
         response_model=Tender, 
         status_code=status.HTTP_201_CREATED,
         )
-def endpoint_create_tender(
+@query_budget(6)
+async def endpoint_create_tender(
     tender: TenderCreate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     ):
-    user = get_user_by_username(
+    user = await get_identity(
         db=db,
         username=tender.creator_username,
         )
@@ -39,62 +108,147 @@ def endpoint_create_tender(
             status_code=400, 
             detail="Пользователь не найден",
             )
-    is_responsible = is_user_responsible_for_org(
-        db=db, 
-        user_id=user.id, 
-        organization_id=tender.organization_id,
-        )
-    if not is_responsible:
+    if tender.organization_id not in user.organization_ids:
         raise HTTPException(
             status_code=403, 
             detail="Пользователь не является ответственным за организацию",
             )
     
-    new_tender = create_tender(
+    new_tender = await create_tender(
         db=db, 
         tender=tender,
         )
     return new_tender
 
+@router.post(
+        "/bulk", 
+        response_model=TenderBulkResult,
+        )
+@query_budget(7)
+async def endpoint_create_tenders_bulk(
+    items: List[dict] = Body(..., max_length=BULK_MAX_ITEMS),
+    db: AsyncSession = Depends(get_async_db),
+    ):
+    valid, errors = validate_bulk_items(TenderCreate, items)
+    # Все пользователи и их организации - одним запросом на пачку
+    identities = await get_identities(
+        db=db,
+        usernames=[tender.creator_username for _, tender in valid],
+        )
+    allowed = []
+    for index, tender in valid:
+        user = identities.get(tender.creator_username)
+        if not user:
+            errors.append(BulkError(
+                index=index, 
+                detail="Пользователь не найден",
+                ))
+        elif tender.organization_id not in user.organization_ids:
+            errors.append(BulkError(
+                index=index, 
+                detail="Пользователь не является ответственным за организацию",
+                ))
+        else:
+            allowed.append(tender)
+
+    created = await create_tenders_bulk(
+        db=db, 
+        tenders=allowed,
+        )
+    errors.sort(key=lambda error: error.index)
+    return {"created": created, "errors": errors}
+
 @router.get("/", 
             response_model=List[Tender],
             )
-def endpoint_list_tenders(
+@query_budget(4)
+async def endpoint_list_tenders(
+    request: Request,
+    response: Response,
     service_type: str = None,
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     username: str = None,
+    page: PageParams = Depends(get_page_params),
+    serializer: RowSerializer = Depends(TENDER_ROWS.select_fields),
     ):
-    tenders = get_tenders(
+    # Видимость зависит от организаций пользователя - они входят в валидатор
+    user = await get_identity(db=db, username=username) if username else None
+    validator = await get_validator(
+        db, 
+        TenderModel, 
+        request, 
+        sorted(user.organization_ids) if user else None,
+        )
+    not_modified = not_modified_response(request, validator)
+    if not_modified:
+        return not_modified
+
+    tenders, next_cursor = await get_tenders(
         db=db, 
         service_type=service_type, 
         username=username,
+        page=page,
+        serializer=serializer,
         )
-    return tenders
+    set_next_cursor(response, next_cursor)
+    set_validator_headers(response, validator)
+    return serializer.response(tenders, response)
+
+@router.get(
+        "/search", 
+        response_model=List[Tender],
+        )
+@query_budget(3)
+async def endpoint_search_tenders(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    username: str = None,
+    db: AsyncSession = Depends(get_async_db),
+    page: RankedPageParams = Depends(get_ranked_page_params),
+    serializer: RowSerializer = Depends(TENDER_ROWS.select_fields),
+    ):
+    tenders, next_cursor = await search_tenders(
+        db=db, 
+        q=q, 
+        username=username,
+        page=page,
+        serializer=serializer,
+        )
+    set_next_cursor(response, next_cursor)
+    return serializer.response(tenders, response)
 
 @router.get(
         "/my", 
         response_model=List[Tender],
         )
-def endpoint_list_my_tenders(
+@query_budget(3)
+async def endpoint_list_my_tenders(
     username: str, 
-    db: Session = Depends(get_db),
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    page: PageParams = Depends(get_page_params),
+    serializer: RowSerializer = Depends(TENDER_ROWS.select_fields),
     ):
-    tenders = get_my_tenders(
+    tenders, next_cursor = await get_my_tenders(
         db=db, 
         username=username,
+        page=page,
+        serializer=serializer,
         )
-    return tenders
+    set_next_cursor(response, next_cursor)
+    return serializer.response(tenders, response)
 
 @router.patch(
         "/{tender_id}/edit", 
         response_model=Tender,
         )
-def endpoint_edit_tender(
+@query_budget(6)
+async def endpoint_edit_tender(
     tender_id: int, 
     tender: TenderUpdate, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     ):
-    db_tender = get_tender(
+    db_tender = await get_tender(
         db=db, 
         tender_id=tender_id,
         )
@@ -104,37 +258,87 @@ def endpoint_edit_tender(
             detail="Тендер не найден",
             )
     
-    user = get_user_by_username(
+    user = await get_identity(
         db=db, 
         username=tender.username,
         )
-    if not user or not is_user_responsible_for_org(
-        db=db,
-        user_id=user.id,
-        organization_id=db_tender.organization_id,
-        ):
+    if not user or db_tender.organization_id not in user.organization_ids:
         raise HTTPException(
             status_code=403, 
             detail="Нет доступа к редактированию тендера",
             )
     
-    updated_tender = update_tender(
+    updated_tender = await update_tender(
         db=db,
         db_tender=db_tender, 
         tender=tender,
         )
     return updated_tender
 
+@router.get(
+        "/{tender_id}/versions", 
+        response_model=List[TenderVersion],
+        )
+@query_budget(4)
+async def endpoint_list_tender_versions(
+    tender_id: int, 
+    response: Response,
+    db: AsyncSession = Depends(get_async_db),
+    page: VersionPageParams = Depends(get_version_page_params),
+    ):
+    await _get_tender_or_404(db, tender_id)
+    versions, next_cursor = await get_tender_versions(
+        db=db, 
+        tender_id=tender_id,
+        page=page,
+        )
+    set_next_cursor(response, next_cursor)
+    return versions
+
+@router.get(
+        "/{tender_id}/versions/{version}", 
+        response_model=TenderVersion,
+        )
+@query_budget(5)
+async def endpoint_get_tender_version(
+    tender_id: int, 
+    version: int, 
+    db: AsyncSession = Depends(get_async_db),
+    ):
+    await _get_tender_or_404(db, tender_id)
+    return await _get_version_or_404(db, tender_id, version)
+
+@router.get(
+        "/{tender_id}/diff", 
+        response_model=VersionDiff,
+        )
+@query_budget(6)
+async def endpoint_diff_tender_versions(
+    tender_id: int, 
+    from_version: int = Query(..., alias="from"),
+    to_version: int = Query(..., alias="to"),
+    db: AsyncSession = Depends(get_async_db),
+    ):
+    await _get_tender_or_404(db, tender_id)
+    old = await _get_version_or_404(db, tender_id, from_version)
+    new = await _get_version_or_404(db, tender_id, to_version)
+    return VersionDiff(
+        from_version=from_version,
+        to_version=to_version,
+        changes=diff_states(TENDER_HISTORY, old, new),
+        )
+
 @router.put(
         "/{tender_id}/rollback/{version}", 
         response_model=Tender,
         )
-def endpoint_rollback_tender(
+@query_budget(8)
+async def endpoint_rollback_tender(
     tender_id: int, 
     version: int, 
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
     ):
-    db_tender = get_tender(
+    db_tender = await get_tender(
         db=db, 
         tender_id=tender_id,
         )
@@ -144,12 +348,15 @@ def endpoint_rollback_tender(
             detail="Тендер не найден",
             )
     
-    rolled_back_tender = rollback_tender(
+    rolled_back_tender = await rollback_tender(
         db=db, 
         db_tender=db_tender, 
         version=version,
         )
     if not rolled_back_tender:
+        compacted = await _compacted_version_error(db, tender_id, version)
+        if compacted:
+            raise compacted
         raise HTTPException(
             status_code=400, 
             detail="Некорректная версия для отката",
@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
-from typing import Optional
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+import datetime
+from typing import Any, Dict, List, Optional
 from enums import TenderStatus, BidStatus, DecisionType
 
 
@@ -29,8 +30,7 @@ class Tender(TenderBase):
     version: int
     organization_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Schemas for Bid
 class BidBase(BaseModel):
@@ -58,8 +58,7 @@ class Bid(BidBase):
     organization_id: int
     creator_id: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 # Schema for BidDecision
 class BidDecision(BaseModel):
@@ -69,6 +68,33 @@ class BidDecision(BaseModel):
     organization_id: int
 
 
+# Schemas for bulk creation
+class BulkError(BaseModel):
+    index: int
+    detail: Any
+
+def validate_bulk_items(schema, items: List[dict]):
+    # Ошибки валидации отдельных элементов не прерывают обработку пачки
+    valid, errors = [], []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schema.model_validate(item)))
+        except ValidationError as exc:
+            errors.append(BulkError(
+                index=index,
+                detail=exc.errors(include_url=False, include_context=False),
+                ))
+    return valid, errors
+
+class TenderBulkResult(BaseModel):
+    created: List[Tender]
+    errors: List[BulkError]
+
+class BidBulkResult(BaseModel):
+    created: List[Bid]
+    errors: List[BulkError]
+
+
 class TenderHistoryBase(BaseModel):
     name: str
     description: Optional[str]
@@ -76,8 +102,7 @@ class TenderHistoryBase(BaseModel):
     version: int
     service_type: str = Field(..., max_length=100)
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 class BidHistoryBase(BaseModel):
     name: str
@@ -85,8 +110,24 @@ class BidHistoryBase(BaseModel):
     status: BidStatus
     version: int
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
+
+# timestamp может быть NULL: колонка tender_history.timestamp добавлена
+# миграцией 0003 без заполнения старых строк
+class TenderVersion(TenderHistoryBase):
+    timestamp: Optional[datetime.datetime]
+
+class BidVersion(BidHistoryBase):
+    timestamp: Optional[datetime.datetime]
+
+class FieldChange(BaseModel):
+    old: Any
+    new: Any
+
+class VersionDiff(BaseModel):
+    from_version: int
+    to_version: int
+    changes: Dict[str, FieldChange]
 
 class EmployeeBase(BaseModel):
     id: int
@@ -95,8 +136,7 @@ class EmployeeBase(BaseModel):
     last_name: Optional[str] = None
 
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
         
 
 class OrganizationBase(BaseModel):
@@ -106,8 +146,7 @@ class OrganizationBase(BaseModel):
     type: str
 
 
-    class Config:
-        orm_mode = True
+    model_config = ConfigDict(from_attributes=True)
 
 
 
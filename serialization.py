@@ -0,0 +1,91 @@
+from typing import Iterable, List, Optional, Type
+
+from fastapi import HTTPException, Query, Response
+from pydantic import BaseModel, ConfigDict, TypeAdapter, create_model
+from pydantic_core import to_json
+from sqlalchemy import Enum, String, type_coerce
+
+import models
+import schemas
+from config import TEST_MODE
+
+
+def _column(model, field: str):
+    column = getattr(model, field)
+    if isinstance(column.type, Enum):
+        # Значение перечисления сразу строкой, как его вернул драйвер: без
+        # создания объектов Enum при чтении и без медленного определения их
+        # типа при сериализации
+        return type_coerce(column, String).label(field)
+    return column
+
+
+class RowSerializer:
+    # Ответ-список из строк select(*serializer.columns, ...): без ORM-объектов
+    # и без проверки каждого значения схемой - строки пришли из базы и уже
+    # ей соответствуют. Лишние колонки в конце строки (ключ курсора)
+    # отбрасываются. В TEST_MODE строки всё же проверяются
+    # кэшированным TypeAdapter, чтобы расхождение схемы и модели не прошло
+    # незамеченным
+
+    def __init__(self, model, schema: Type[BaseModel], validate: bool = TEST_MODE):
+        self.model = model
+        self.schema = schema
+        self.fields = tuple(schema.model_fields)
+        self.columns = tuple(_column(model, field) for field in self.fields)
+        self.validate = validate
+        self._adapter = TypeAdapter(List[schema])
+        self._projections = {}
+
+    def project(self, fields: Iterable[str]) -> "RowSerializer":
+        # Сериализатор для подмножества полей схемы (в порядке схемы) со своей
+        # схемой ответа. Подмножеств конечное число, поэтому каждое строится
+        # один раз и хранится без вытеснения
+        fields = tuple(field for field in self.fields if field in set(fields))
+        if fields == self.fields:
+            return self
+        projection = self._projections.get(fields)
+        if projection is None:
+            schema = create_model(
+                f"{self.schema.__name__}Fields",
+                __config__=ConfigDict(from_attributes=True),
+                **{field: (self.schema.model_fields[field].annotation, self.schema.model_fields[field])
+                   for field in fields},
+            )
+            projection = self._projections[fields] = RowSerializer(self.model, schema, self.validate)
+        return projection
+
+    def select_fields(
+        self,
+        fields: Optional[str] = Query(None, description="Поля ответа через запятую, например id,name,status"),
+        ) -> "RowSerializer":
+        # Зависимость маршрута: ?fields= превращается в SELECT только этих
+        # колонок и ответ только с ними
+        if fields is None:
+            return self
+        names = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = names.difference(self.fields)
+        if not names or unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Неизвестные поля: {', '.join(sorted(unknown))}" if unknown else "Не указаны поля",
+                )
+        return self.project(names)
+
+    def render(self, rows: Iterable) -> bytes:
+        fields = self.fields
+        items = [dict(zip(fields, row)) for row in rows]
+        if self.validate:
+            self._adapter.validate_python(items)
+        return to_json(items)
+
+    def response(self, rows: Iterable, response: Response) -> Response:
+        # Заголовки, выставленные обработчиком во внедрённый response (курсор,
+        # ETag), переносятся в ответ
+        return Response(self.render(rows), media_type="application/json", headers=response.headers)
+
+
+TENDER_ROWS = RowSerializer(models.Tender, schemas.Tender)
+BID_ROWS = RowSerializer(models.Bid, schemas.Bid)
+EMPLOYEE_ROWS = RowSerializer(models.Employee, schemas.EmployeeBase)
+ORGANIZATION_ROWS = RowSerializer(models.Organization, schemas.OrganizationBase)